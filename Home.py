@@ -1,10 +1,11 @@
 import streamlit as st
 import os
-import pandas as pd
 import sqlite3
-from shared_utils import get_connection
+from ingest_utils import SUPPORTED_EXTENSIONS, ingest_file, preview_upload
+from ui_utils import start_page_trace, render_diagnostics_panel, queue_wait_reporter
 
 st.set_page_config(page_title="Universal Analyzer 4.0 PRO SaaS", layout="wide")
+start_page_trace("Home")
 st.title("Datos 4.0 PRO")
 
 st.markdown("""
@@ -27,23 +28,39 @@ This app includes:
 if not os.path.exists("models"):
     os.makedirs("models")
 
-# 🚀 ✅ CSV Upload Section:
-st.header("📂 Upload CSV Data Into SQLite")
+# 🚀 ✅ File Upload Section:
+st.header("📂 Upload Data Into SQLite")
 
-uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
+uploaded_file = st.file_uploader("Upload a CSV, Excel, JSON or Parquet file", type=SUPPORTED_EXTENSIONS)
 
 if uploaded_file:
-    df = pd.read_csv(uploaded_file)
     st.write("Preview of uploaded data:")
-    st.dataframe(df.head())
+    st.dataframe(preview_upload(uploaded_file, uploaded_file.name))
 
     table_name = st.text_input("Enter table name to save into database (e.g. player_stats, injuries, weather):")
 
     if st.button("💾 Save to Database"):
         if table_name:
-            conn = get_connection()
-            df.to_sql(table_name, conn, if_exists="replace", index=False)
-            conn.close()
-            st.success(f"✅ Table '{table_name}' saved successfully into SQLite!")
+            progress_bar = st.progress(0.0)
+            status = st.empty()
+
+            # Streamed in chunks so peak memory stays near one chunk
+            def report(rows, elapsed, fraction):
+                if fraction is not None:
+                    progress_bar.progress(fraction)
+                rate = rows / elapsed if elapsed > 0 else 0
+                status.write(f"Ingested {rows:,} rows ({rate:,.0f} rows/sec)")
+
+            uploaded_file.seek(0)
+            stats = ingest_file(
+                uploaded_file, uploaded_file.name, table_name, progress=report, on_wait=queue_wait_reporter(status)
+            )
+            progress_bar.progress(1.0)
+            st.success(
+                f"✅ Table '{table_name}' saved successfully into SQLite! "
+                f"{stats['rows']:,} rows in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/sec)"
+            )
         else:
             st.warning("⚠️ Please enter a table name before saving.")
+
+render_diagnostics_panel()
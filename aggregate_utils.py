@@ -0,0 +1,233 @@
+import hashlib
+import threading
+import time
+
+import pandas as pd
+
+import perf_utils
+import shared_utils
+from result_cache_utils import cached_result
+from shared_utils import INTERNAL_PREFIX, get_connection, quote_table, get_table_version
+from query_utils import table_columns, build_where_clause
+from write_utils import WriteQueueTimeout, write_slot
+
+AGG_FUNCS = ["sum", "mean", "max", "min", "count"]
+
+# Universal-filter dimensions kept in rollups so they can still be filtered on
+ROLLUP_DIMENSIONS = ["season", "position"]
+# A (table, group_col, agg_col) combination gets a rollup after this many uses
+ROLLUP_MIN_USES = 2
+# Usage counts are kept in memory and written out at most this often
+USAGE_FLUSH_SECONDS = 30
+
+ROLLUPS_TABLE = f"{INTERNAL_PREFIX}rollups"
+USAGE_TABLE = f"{INTERNAL_PREFIX}rollup_usage"
+
+# (db, table, group_col, agg_col) -> {"stored": uses in USAGE_TABLE, "pending": uses not yet flushed}
+_usage = {}
+_usage_lock = threading.Lock()
+_last_flush = {"at": 0.0}
+
+# Final SQL expression per function over raw rows
+_SQL_AGG = {
+    "sum": "COALESCE(SUM({c}), 0)",
+    "mean": "AVG({c})",
+    "max": "MAX({c})",
+    "min": "MIN({c})",
+    "count": "COUNT({c})",
+}
+
+# Re-aggregation of the mergeable partials stored in a rollup
+_ROLLUP_AGG = {
+    "sum": "COALESCE(SUM(sum_value), 0)",
+    "mean": "1.0 * SUM(sum_value) / NULLIF(SUM(count_value), 0)",
+    "max": "MAX(max_value)",
+    "min": "MIN(min_value)",
+    "count": "SUM(count_value)",
+}
+
+def _ensure_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {ROLLUPS_TABLE} ("
+        "rollup_table TEXT PRIMARY KEY, source_table TEXT NOT NULL, source_version INTEGER NOT NULL, "
+        "group_col TEXT NOT NULL, agg_col TEXT NOT NULL, dimensions TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {USAGE_TABLE} ("
+        "source_table TEXT NOT NULL, group_col TEXT NOT NULL, agg_col TEXT NOT NULL, uses INTEGER NOT NULL, "
+        "PRIMARY KEY (source_table, group_col, agg_col))"
+    )
+
+def _rollup_name(table_name, group_col, agg_col):
+    digest = hashlib.sha1(f"{table_name}\x00{group_col}\x00{agg_col}".encode("utf-8")).hexdigest()[:16]
+    return f"{INTERNAL_PREFIX}rollup_{digest}"
+
+# Count one use in memory; returns the total including other sessions' flushed uses
+def _record_use(table_name, group_col, agg_col, conn):
+    key = (shared_utils.DB_FILE, table_name, group_col, agg_col)
+    with _usage_lock:
+        entry = _usage.get(key)
+    if entry is None:
+        row = conn.execute(
+            f"SELECT uses FROM {USAGE_TABLE} WHERE source_table = ? AND group_col = ? AND agg_col = ?",
+            (table_name, group_col, agg_col),
+        ).fetchone()
+        with _usage_lock:
+            entry = _usage.setdefault(key, {"stored": row[0] if row else 0, "pending": 0})
+    with _usage_lock:
+        entry["pending"] += 1
+        return entry["stored"] + entry["pending"]
+
+# Write pending usage counts for this database; the caller holds the write slot
+def _flush_usage(conn):
+    with _usage_lock:
+        pending = {key: entry["pending"] for key, entry in _usage.items()
+                   if key[0] == shared_utils.DB_FILE and entry["pending"]}
+        _last_flush["at"] = time.monotonic()
+    if not pending:
+        return
+    conn.executemany(
+        f"INSERT INTO {USAGE_TABLE} (source_table, group_col, agg_col, uses) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(source_table, group_col, agg_col) DO UPDATE SET uses = uses + excluded.uses",
+        [(table, group, agg, uses) for (_db, table, group, agg), uses in pending.items()],
+    )
+    conn.commit()
+    with _usage_lock:
+        for key, uses in pending.items():
+            _usage[key]["pending"] -= uses
+            _usage[key]["stored"] += uses
+
+# Flush usage counts if the write slot is free right now; a busy slot just defers it
+def flush_usage(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        with write_slot("rollup usage", timeout=0):
+            _flush_usage(conn)
+        return True
+    except WriteQueueTimeout:
+        return False
+    finally:
+        if own_conn:
+            conn.close()
+
+# Partial aggregates of agg_col by group_col and the filter dimensions
+def build_rollup(table_name, group_col, agg_col, conn):
+    _ensure_tables(conn)
+    columns = table_columns(table_name, conn)
+    dims = [d for d in ROLLUP_DIMENSIONS if d in columns and d != group_col]
+    rollup = _rollup_name(table_name, group_col, agg_col)
+    g, a = quote_table(group_col), quote_table(agg_col)
+    dim_sql = "".join(f", {quote_table(d)}" for d in dims)
+
+    with write_slot(f"rollup {table_name}"):
+        conn.execute(f"DROP TABLE IF EXISTS {quote_table(rollup)}")
+        conn.execute(
+            f"CREATE TABLE {quote_table(rollup)} AS "
+            f"SELECT {g}{dim_sql}, SUM({a}) AS sum_value, COUNT({a}) AS count_value, "
+            f"MIN({a}) AS min_value, MAX({a}) AS max_value "
+            f"FROM {quote_table(table_name)} WHERE {g} IS NOT NULL GROUP BY {g}{dim_sql}"
+        )
+        conn.execute(
+            f"INSERT OR REPLACE INTO {ROLLUPS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (rollup, table_name, get_table_version(table_name, conn), group_col, agg_col, ",".join(dims), time.time()),
+        )
+        conn.commit()
+    return rollup, dims
+
+# Build a rollup only if the write slot is free; otherwise the query runs on the
+# raw table and a later call builds it. Pending usage counts go out in the same slot.
+def _try_build_rollup(table_name, group_col, agg_col, conn):
+    try:
+        with write_slot(f"rollup {table_name}", timeout=0):
+            _flush_usage(conn)
+            return build_rollup(table_name, group_col, agg_col, conn)
+    except WriteQueueTimeout:
+        return None
+
+# Current rollup for a combination, or None if missing / built from an older table
+# version (a stale one is replaced by the next build, so reads never write)
+def _fresh_rollup(table_name, group_col, agg_col, conn):
+    row = conn.execute(
+        f"SELECT rollup_table, source_version, dimensions FROM {ROLLUPS_TABLE} "
+        "WHERE source_table = ? AND group_col = ? AND agg_col = ?",
+        (table_name, group_col, agg_col),
+    ).fetchone()
+    if row is None:
+        return None
+    rollup, version, dims = row
+    if version != get_table_version(table_name, conn):
+        return None
+    return rollup, [d for d in dims.split(",") if d]
+
+# Drop every rollup built from a table (called when the table is rewritten)
+def drop_rollups(table_name, conn):
+    _ensure_tables(conn)
+    rollups = conn.execute(
+        f"SELECT rollup_table FROM {ROLLUPS_TABLE} WHERE source_table = ?", (table_name,)
+    ).fetchall()
+    for (rollup,) in rollups:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_table(rollup)}")
+    conn.execute(f"DELETE FROM {ROLLUPS_TABLE} WHERE source_table = ?", (table_name,))
+    conn.commit()
+
+# A rollup can answer filters that only touch its dimensions
+def _rollup_can_answer(filters, dims, group_col):
+    usable = set(dims) | {group_col}
+    if filters.get("player_search") or filters.get("player_exact") or filters.get("ranges"):
+        return False
+    if filters.get("season") is not None and "season" not in usable:
+        return False
+    if filters.get("positions") is not None and "position" not in usable:
+        return False
+    return True
+
+# GROUP BY pushed down to SQLite, served from a rollup when possible.
+# Returns (grouped DataFrame, "rollup" or "sql").
+@perf_utils.timed("aggregate")
+def aggregate(table_name, group_col, agg_col, agg_func, filters=None, conn=None):
+    if agg_func not in _SQL_AGG:
+        raise ValueError(f"Unsupported aggregation: {agg_func}")
+    filters = filters or {}
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_tables(conn)
+        g = quote_table(group_col)
+        where, params = build_where_clause(filters)
+
+        uses = _record_use(table_name, group_col, agg_col, conn)
+        rollup = _fresh_rollup(table_name, group_col, agg_col, conn)
+        if rollup is None and uses >= ROLLUP_MIN_USES:
+            rollup = _try_build_rollup(table_name, group_col, agg_col, conn)
+        elif time.monotonic() - _last_flush["at"] >= USAGE_FLUSH_SECONDS:
+            flush_usage(conn)
+
+        if rollup is not None and _rollup_can_answer(filters, rollup[1], group_col):
+            source, expr = quote_table(rollup[0]), _ROLLUP_AGG[agg_func]
+            served = "rollup"
+        else:
+            source, expr = quote_table(table_name), _SQL_AGG[agg_func].format(c=quote_table(agg_col))
+            served = "sql"
+
+        # Grouping a column by itself would otherwise produce two identical names
+        out_col = agg_col if agg_col != group_col else f"{agg_col}_{agg_func}"
+        conditions = [f"{g} IS NOT NULL"] + ([where] if where else [])
+        sql = (
+            f"SELECT {g} AS {quote_table(group_col)}, {expr} AS {quote_table(out_col)} "
+            f"FROM {source} WHERE {' AND '.join(conditions)} GROUP BY {g} ORDER BY {g}"
+        )
+        # Rollup and raw SQL give the same answer, so both share one cached result
+        grouped = cached_result(
+            table_name,
+            get_table_version(table_name, conn),
+            "aggregate",
+            {"group": group_col, "agg": agg_col, "func": agg_func, "filters": filters},
+            lambda: pd.read_sql(sql, conn, params=params),
+        )
+    finally:
+        if own_conn:
+            conn.close()
+    return grouped, served
@@ -0,0 +1,284 @@
+# Reproducible benchmark suite for the core Datos operations on synthetic data.
+#
+#     python benchmark.py --rows 100000 --output bench.json
+#     python benchmark.py --rows 1000000 --baseline bench.json --tolerance 0.15
+#
+# Each operation records wall time, peak RSS and rows/sec. With --baseline the
+# run is compared operation by operation and exits non-zero on a regression.
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import shared_utils
+
+OPERATIONS = ["ingest", "fusion", "filter", "clean", "aggregate", "profile", "train", "predict"]
+FEATURES = ["passing_yards", "rushing_yards", "receiving_yards", "targets", "receptions", "week"]
+TARGET = "fantasy_points_ppr"
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        # ru_maxrss is KiB on Linux, bytes on macOS; only a process-wide high-water mark
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+# Samples this process's RSS in the background to get a per-operation peak
+class _PeakRss:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+# Best-of-`repeat` timing of fn(); fn returns the number of rows it processed
+def measure(name, fn, repeat=1):
+    best = None
+    for _ in range(repeat):
+        with _PeakRss() as rss:
+            started = time.perf_counter()
+            rows = fn()
+            seconds = time.perf_counter() - started
+        if best is None or seconds < best["seconds"]:
+            best = {
+                "name": name,
+                "seconds": seconds,
+                "rows": int(rows),
+                "rows_per_sec": rows / seconds if seconds > 0 else None,
+                "peak_rss_mb": rss.peak / 1024 / 1024,
+            }
+    print(f"{name:<10} {best['seconds']:9.3f}s  {best['rows']:>12,} rows  {best['peak_rss_mb']:8.1f} MB", file=sys.stderr)
+    return best
+
+def run_suite(rows, seasons, seed, repeat, operations, train_rows, workers, storage="sqlite"):
+    from synthetic_utils import generate_fantasy_data
+    from ingest_utils import ingest_file
+    from fusion_utils import fuse_tables
+    from query_utils import count_rows
+    from cleaning_utils import clean_table_chunked
+    from aggregate_utils import aggregate
+    from profile_utils import profile_table
+    from training_utils import load_training_frame, prepare_xy, train_random_forest
+    from registry_utils import register_model
+    from scoring_utils import score_file
+    from result_cache_utils import set_result_cache_budget
+    from storage_utils import set_storage_backend
+
+    # Measure real reads, not the in-process table cache or the shared result cache
+    shared_utils.set_cache_budget(0)
+    set_result_cache_budget(0)
+    set_storage_backend(storage)
+    started = time.perf_counter()
+    paths = generate_fantasy_data("data", rows=rows, seasons=seasons, seed=seed)
+    print(f"generated {rows:,} rows in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    results = []
+    stats_rows = 0
+
+    def ingest():
+        nonlocal stats_rows
+        total = 0
+        for table, path in paths.items():
+            n = ingest_file(path, path, table)["rows"]
+            total += n
+            if table == "player_stats":
+                stats_rows = n
+        return total
+
+    # Everything after ingest reads the ingested tables, so ingest always runs
+    result = measure("ingest", ingest, repeat if "ingest" in operations else 1)
+    if "ingest" in operations:
+        results.append(result)
+
+    first, last = 2010 + seasons // 2, 2010 + seasons - 1
+    filters = {"season": (first, last), "positions": ["RB", "WR"]}
+
+    if "fusion" in operations:
+        results.append(measure("fusion", lambda: fuse_tables(incremental=False)["rows"], repeat))
+
+    if "filter" in operations:
+        def universal_filter():
+            return len(shared_utils.load_table("player_stats", filters=filters))
+        results.append(measure("filter", universal_filter, repeat))
+
+    if "clean" in operations:
+        results.append(measure(
+            "clean",
+            lambda: clean_table_chunked("player_stats", "player_stats_clean", method="zscore")["rows_read"],
+            repeat,
+        ))
+
+    if "aggregate" in operations:
+        def group_by():
+            aggregate("player_stats", "team", TARGET, "mean", filters)
+            return count_rows("player_stats")
+        results.append(measure("aggregate", group_by, repeat))
+
+    if "profile" in operations:
+        results.append(measure(
+            "profile", lambda: profile_table("player_stats", mode="sketch", workers=workers).attrs["rows_scanned"], repeat
+        ))
+
+    model_path = None
+    if "train" in operations or "predict" in operations:
+        # Forests on tens of millions of rows are not a useful benchmark; train on a capped slice
+        def train():
+            nonlocal model_path
+            df = load_training_frame("player_stats", FEATURES, TARGET, filters)
+            if len(df) > train_rows:
+                df = df.sample(train_rows, random_state=seed)
+            X, y = prepare_xy(df, FEATURES, TARGET)
+            model, metrics, _ = train_random_forest(X, y, n_estimators=100, max_depth=10, n_jobs=workers)
+            _, model_path = register_model(model, "benchmark_rf", FEATURES, TARGET, source_table="player_stats", metrics=metrics)
+            return len(df)
+        result = measure("train", train, repeat)
+        if "train" in operations:
+            results.append(result)
+
+    if "predict" in operations:
+        results.append(measure(
+            "predict",
+            lambda: score_file(model_path, paths["player_stats"], paths["player_stats"], "predictions.parquet",
+                               "parquet", workers=workers if workers > 1 else 0)["rows"],
+            repeat,
+        ))
+
+    meta = {
+        "rows": rows,
+        "player_stats_rows": stats_rows,
+        "seasons": seasons,
+        "seed": seed,
+        "repeat": repeat,
+        "workers": workers,
+        "train_rows": train_rows,
+        "storage": storage,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+        "versions": _library_versions(),
+    }
+    return {"meta": meta, "results": results}
+
+def _library_versions():
+    versions = {}
+    for name in ["pandas", "numpy", "sklearn", "pyarrow"]:
+        try:
+            versions[name] = __import__(name).__version__
+        except ImportError:
+            versions[name] = None
+    return versions
+
+# Per-operation ratio against a baseline run. A regression is a slowdown beyond
+# the tolerance that is also more than min_seconds, so timer noise on very
+# fast operations doesn't fail the run.
+def compare_to_baseline(report, baseline, tolerance=0.10, min_seconds=0.05):
+    base = {r["name"]: r for r in baseline["results"]}
+    comparison = []
+    for result in report["results"]:
+        old = base.get(result["name"])
+        if old is None:
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] else None
+        comparison.append({
+            "name": result["name"],
+            "seconds": result["seconds"],
+            "baseline_seconds": old["seconds"],
+            "ratio": ratio,
+            "peak_rss_mb": result["peak_rss_mb"],
+            "baseline_peak_rss_mb": old["peak_rss_mb"],
+            "regression": ratio is not None and ratio > 1 + tolerance and result["seconds"] - old["seconds"] > min_seconds,
+        })
+    if baseline["meta"].get("rows") != report["meta"]["rows"]:
+        print("warning: baseline was recorded at a different scale", file=sys.stderr)
+    if baseline["meta"].get("storage", "sqlite") != report["meta"]["storage"]:
+        print("warning: baseline was recorded with a different storage backend", file=sys.stderr)
+    return comparison
+
+def main(argv=None):
+    from storage_utils import STORAGE_BACKENDS
+
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Benchmark core Datos operations on synthetic data.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Approximate player_stats rows (default: %(default)s)")
+    parser.add_argument("--seasons", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Best-of-N timing per operation")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(OPERATIONS)}")
+    parser.add_argument("--train-rows", type=int, default=200_000, help="Row cap for the training benchmark")
+    parser.add_argument("--workers", type=int, default=1, help="Processes/cores for profile, train and predict")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default="sqlite", help="Backend for table reads (default: %(default)s)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown vs baseline (default: 10%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="Ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--workdir", help="Where to write data and the database (default: a temp dir, removed afterwards)")
+    args = parser.parse_args(argv)
+
+    operations = [op.strip() for op in args.only.split(",")] if args.only else OPERATIONS
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(sorted(unknown))}")
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="datos_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    shared_utils.DB_FILE = os.path.join(workdir, "benchmark.db")
+    try:
+        report = run_suite(
+            args.rows, args.seasons, args.seed, args.repeat, operations, args.train_rows, args.workers, args.storage
+        )
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if baseline is not None:
+        report["comparison"] = compare_to_baseline(report, baseline, args.tolerance, args.min_seconds)
+        for row in report["comparison"]:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "n/a"
+            print(f"{row['name']:<10} {ratio} baseline  {flag}", file=sys.stderr)
+        if any(row["regression"] for row in report["comparison"]):
+            status = 1
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
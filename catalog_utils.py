@@ -0,0 +1,174 @@
+import json
+import time
+
+import pandas as pd
+
+from shared_utils import INTERNAL_PREFIX, get_connection, quote_table, get_table_version
+
+CATALOG_TABLE = f"{INTERNAL_PREFIX}column_catalog"
+
+# Columns with at most this many distinct values keep their full value list
+FULL_VALUES_MAX_DISTINCT = 100
+TOP_VALUES = 10
+COLUMNS_PER_SCAN = 150
+# Rows per chunk streamed through the column sketches
+SKETCH_CHUNK_ROWS = 100_000
+# Storage class of one value ranked so MAX() gives the widest in a column
+_STORAGE_RANK = "CASE typeof({c}) WHEN 'null' THEN 0 WHEN 'integer' THEN 1 WHEN 'real' THEN 2 ELSE 3 END"
+
+def _ensure_catalog_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} ("
+        "table_name TEXT NOT NULL, column_name TEXT NOT NULL, position INTEGER NOT NULL, "
+        "version INTEGER NOT NULL, dtype TEXT, row_count INTEGER, null_count INTEGER, "
+        "distinct_count INTEGER, min_value, max_value, mean REAL, std REAL, "
+        "top_values TEXT, values_complete INTEGER, computed_at REAL, "
+        "PRIMARY KEY (table_name, column_name))"
+    )
+
+# Label for the widest SQLite storage class in a column (see _STORAGE_RANK)
+def _dtype_label(widest):
+    return {1: "int64", 2: "float64"}.get(widest, "object")
+
+# Value as stored in SQLite (pandas hands back numpy scalars, and floats for
+# integer columns with nulls)
+def _native(value, dtype):
+    if dtype == "int64":
+        return int(value)
+    if dtype == "float64":
+        return float(value)
+    return value.item() if hasattr(value, "item") else value
+
+# Store per-column statistics for a table. Counts, bounds and storage classes
+# come from one aggregate pass inside SQLite; distinct counts (HyperLogLog),
+# frequent values (Misra-Gries) and mean/std (Chan's parallel update) from the
+# mergeable sketches in profile_utils over one streamed read, so no column
+# needs a COUNT(DISTINCT) or GROUP BY sort.
+def refresh_catalog(table_name, conn=None):
+    from profile_utils import ColumnSketch
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_catalog_table(conn)
+        table = quote_table(table_name)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        version = get_table_version(table_name, conn)
+
+        # One pass for counts, bounds and the widest storage class of every column
+        # (columns are batched to stay under SQLite's result-column limit)
+        stats = []
+        row_count = 0
+        for start in range(0, len(columns), COLUMNS_PER_SCAN):
+            exprs = ["COUNT(*)"]
+            for col in columns[start:start + COLUMNS_PER_SCAN]:
+                c = quote_table(col)
+                exprs += [
+                    f"COUNT({c})",
+                    f"MIN({c})",
+                    f"MAX({c})",
+                    f"MAX({_STORAGE_RANK.format(c=c)})",
+                ]
+            row = conn.execute(f"SELECT {', '.join(exprs)} FROM {table}").fetchone()
+            row_count = row[0]
+            stats += [row[1 + i * 4: 5 + i * 4] for i in range((len(exprs) - 1) // 4)]
+
+        dtypes = [_dtype_label(widest) for _, _, _, widest in stats]
+        # Enough frequent-item counters to hold the full value list of a low-cardinality column
+        sketches = {
+            col: ColumnSketch(dtype != "object", items_k=FULL_VALUES_MAX_DISTINCT, quantiles=False)
+            for col, dtype in zip(columns, dtypes)
+        }
+        if row_count:
+            for chunk in pd.read_sql(f"SELECT * FROM {table}", conn, chunksize=SKETCH_CHUNK_ROWS):
+                for col, sketch in sketches.items():
+                    # Text columns hash as objects so chunks that happen to hold only numbers agree
+                    sketch.update(chunk[col] if sketch.numeric else chunk[col].astype(object))
+
+        records = []
+        for i, col in enumerate(columns):
+            non_null, min_v, max_v = stats[i][:3]
+            dtype = dtypes[i]
+            sketch = sketches[col]
+            numeric = sketch.numeric
+
+            # Frequent values: full list for low-cardinality columns, top-k for text columns
+            complete = sketch.items.complete()
+            if complete:
+                distinct = len(sketch.items.counts)
+            else:
+                distinct = max(int(round(sketch.hll.estimate())), FULL_VALUES_MAX_DISTINCT + 1)
+            top = []
+            if complete or not numeric:
+                limit = FULL_VALUES_MAX_DISTINCT if complete else TOP_VALUES
+                top = [[_native(value, dtype), n] for value, n in sketch.items.top(limit)]
+
+            records.append((
+                table_name, col, i, version, dtype, row_count, row_count - non_null, distinct,
+                min_v, max_v, sketch.mean if numeric and sketch.n else None, sketch.std if numeric else None,
+                json.dumps(top, default=str), int(complete), time.time(),
+            ))
+
+        conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE table_name = ?", (table_name,))
+        conn.executemany(
+            f"INSERT INTO {CATALOG_TABLE} VALUES ({', '.join('?' for _ in range(15))})", records
+        )
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+# Drop catalog rows for a table (e.g. after it is deleted)
+def drop_catalog(table_name, conn):
+    _ensure_catalog_table(conn)
+    conn.execute(f"DELETE FROM {CATALOG_TABLE} WHERE table_name = ?", (table_name,))
+    conn.commit()
+
+# Catalog rows for a table as a DataFrame, recomputed if missing or stale
+def get_catalog(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_catalog_table(conn)
+        stored = conn.execute(
+            f"SELECT version FROM {CATALOG_TABLE} WHERE table_name = ? LIMIT 1", (table_name,)
+        ).fetchone()
+        if stored is None or stored[0] != get_table_version(table_name, conn):
+            refresh_catalog(table_name, conn)
+        catalog = pd.read_sql(
+            f"SELECT * FROM {CATALOG_TABLE} WHERE table_name = ? ORDER BY position", conn, params=[table_name]
+        )
+    finally:
+        if own_conn:
+            conn.close()
+    catalog["top_values"] = catalog["top_values"].map(lambda v: json.loads(v) if v else [])
+    return catalog.set_index("column_name", drop=False)
+
+# Columns whose distinct count is below a threshold (grouping candidates)
+def low_cardinality_columns(table_name, max_distinct=100, conn=None):
+    catalog = get_catalog(table_name, conn)
+    return catalog.loc[catalog["distinct_count"] < max_distinct, "column_name"].tolist()
+
+# Columns whose stored values are all numeric
+def numeric_columns(table_name, conn=None):
+    catalog = get_catalog(table_name, conn)
+    return catalog.loc[catalog["dtype"] != "object", "column_name"].tolist()
+
+# describe(include="all")-style summary built from the catalog
+def catalog_summary(catalog):
+    summary = pd.DataFrame(index=["count", "unique", "top", "freq", "mean", "std", "min", "max"])
+    for col, row in catalog.iterrows():
+        top = row["top_values"][0] if row["top_values"] else [None, None]
+        summary[col] = [
+            row["row_count"] - row["null_count"],
+            row["distinct_count"],
+            top[0],
+            top[1],
+            row["mean"],
+            row["std"],
+            row["min_value"],
+            row["max_value"],
+        ]
+    return summary
@@ -0,0 +1,202 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+import perf_utils
+from shared_utils import (
+    get_connection, quote_table, mark_table_written, staging_table_name, swap_in_table, drop_staging_table,
+)
+from write_utils import write_slot
+from query_utils import table_columns, build_where_clause
+from catalog_utils import numeric_columns
+from schema_utils import get_schema
+
+OUTLIER_METHODS = ["zscore", "iqr", "mad"]
+# Default cut-offs: |z| < 3, 1.5 x IQR fences, modified z-score < 3.5
+DEFAULT_THRESHOLDS = {"zscore": 3.0, "iqr": 1.5, "mad": 3.5}
+DEFAULT_CHUNK_ROWS = 100_000
+# Tables above this many rows default to the chunked path on the cleaning page
+IN_MEMORY_MAX_ROWS = 1_000_000
+
+# Per-column statistics for every numeric column in one vectorized pass
+def compute_outlier_stats(df, method="zscore", columns=None):
+    cols = list(columns) if columns is not None else df.select_dtypes(include=["number"]).columns.tolist()
+    data = df[cols]
+    if method == "zscore":
+        return pd.DataFrame({"mean": data.mean(), "std": data.std()})
+    if method == "iqr":
+        q = data.quantile([0.25, 0.75])
+        return pd.DataFrame({"q1": q.loc[0.25], "q3": q.loc[0.75]})
+    if method == "mad":
+        median = data.median()
+        return pd.DataFrame({"median": median, "mad": (data - median).abs().median()})
+    raise ValueError(f"Unknown outlier method: {method}")
+
+# Keep-mask from precomputed stats. Missing values and zero-spread columns never flag a row.
+def outlier_mask(df, stats, method="zscore", threshold=None):
+    threshold = DEFAULT_THRESHOLDS[method] if threshold is None else threshold
+    cols = [c for c in stats.index if c in df.columns]
+    if not cols:
+        return pd.Series(True, index=df.index)
+    data = df[cols].apply(pd.to_numeric, errors="coerce")
+    stats = stats.loc[cols]
+
+    if method == "zscore":
+        spread = stats["std"].where(stats["std"] > 0)
+        score = (data - stats["mean"]).abs() / spread
+        flagged = score >= threshold
+    elif method == "iqr":
+        iqr = stats["q3"] - stats["q1"]
+        lower, upper = stats["q1"] - threshold * iqr, stats["q3"] + threshold * iqr
+        flagged = data.lt(lower) | data.gt(upper)
+        flagged = flagged & (iqr > 0)
+    else:
+        spread = stats["mad"].where(stats["mad"] > 0)
+        score = 0.6745 * (data - stats["median"]).abs() / spread
+        flagged = score >= threshold
+    return ~flagged.fillna(False).any(axis=1)
+
+# Legacy per-column loop: stats are recomputed on the shrinking frame in column order
+def remove_outliers_sequential(df, threshold=3.0):
+    df_clean = df
+    numeric_cols = df_clean.select_dtypes(include=["number"]).columns
+    for col in numeric_cols:
+        z_scores = np.abs((df_clean[col] - df_clean[col].mean()) / df_clean[col].std())
+        # Nullable integer columns give <NA> rather than False for missing values
+        df_clean = df_clean[(z_scores < threshold).fillna(False)]
+    return df_clean
+
+# In-memory cleaning: optional dropna, then one combined outlier mask
+@perf_utils.timed("clean_frame")
+def clean_frame(df, drop_na=False, remove_outliers=False, method="zscore", threshold=None, sequential=False):
+    df_clean = df.dropna() if drop_na else df
+    if remove_outliers:
+        if sequential:
+            df_clean = remove_outliers_sequential(df_clean, threshold if threshold is not None else 3.0)
+        else:
+            stats = compute_outlier_stats(df_clean, method)
+            df_clean = df_clean[outlier_mask(df_clean, stats, method, threshold)]
+    return df_clean
+
+# q-quantile of the n non-null values, interpolated linearly between the two
+# neighbouring order statistics like pandas' Series.quantile
+def _sql_quantile(conn, source, column, where, params, q, n, expr=None, expr_params=()):
+    value = expr or quote_table(column)
+    position = q * (n - 1)
+    offset = min(int(np.floor(position)), n - 1)
+    rows = conn.execute(
+        f"SELECT {value} AS v FROM {source} WHERE {where} AND {quote_table(column)} IS NOT NULL "
+        f"ORDER BY v LIMIT 2 OFFSET ?",
+        list(expr_params) + list(params) + [offset],
+    ).fetchall()
+    if not rows:
+        return None
+    lower = rows[0][0]
+    if len(rows) == 1 or position == offset:
+        return lower
+    return lower + (rows[1][0] - lower) * (position - offset)
+
+# Stats pass inside SQLite over the rows that survive filters / dropna
+def compute_outlier_stats_sql(table_name, method, columns, where, params, conn):
+    source = quote_table(table_name)
+    where = where or "1"
+    records = {}
+    if method == "zscore":
+        # Two passes: means first, then squared deviations from them. E[x^2] - E[x]^2
+        # cancels to zero for large values with a small spread.
+        exprs = []
+        for col in columns:
+            c = quote_table(col)
+            exprs += [f"COUNT({c})", f"AVG({c})"]
+        row = conn.execute(f"SELECT {', '.join(exprs)} FROM {source} WHERE {where}", list(params)).fetchone()
+        counts, means = row[0::2], row[1::2]
+        spread_cols = [(col, mean) for col, n, mean in zip(columns, counts, means) if n and n > 1]
+        variances = {}
+        if spread_cols:
+            exprs = [f"AVG(({quote_table(col)} - ?) * ({quote_table(col)} - ?))" for col, _ in spread_cols]
+            bound = [value for _, mean in spread_cols for value in (mean, mean)]
+            row = conn.execute(
+                f"SELECT {', '.join(exprs)} FROM {source} WHERE {where}", bound + list(params)
+            ).fetchone()
+            variances = {col: var for (col, _), var in zip(spread_cols, row)}
+        for col, n, mean in zip(columns, counts, means):
+            std = None
+            if col in variances:
+                std = (max(variances[col], 0.0) * n / (n - 1)) ** 0.5
+            records[col] = {"mean": mean, "std": std}
+        return pd.DataFrame.from_dict(records, orient="index", dtype=float)
+
+    for col in columns:
+        c = quote_table(col)
+        n = conn.execute(f"SELECT COUNT({c}) FROM {source} WHERE {where}", list(params)).fetchone()[0]
+        if not n:
+            records[col] = {}
+            continue
+        if method == "iqr":
+            records[col] = {
+                "q1": _sql_quantile(conn, source, col, where, params, 0.25, n),
+                "q3": _sql_quantile(conn, source, col, where, params, 0.75, n),
+            }
+        else:
+            median = _sql_quantile(conn, source, col, where, params, 0.5, n)
+            mad = _sql_quantile(conn, source, col, where, params, 0.5, n, expr=f"ABS({c} - ?)", expr_params=[median])
+            records[col] = {"median": median, "mad": mad}
+    return pd.DataFrame.from_dict(records, orient="index", dtype=float)
+
+# Out-of-core cleaning: a stats pass in SQLite, then a chunked filter-and-write pass.
+# progress(rows_read, rows_kept, elapsed_seconds) is called per chunk; on_wait
+# (queue_position, waited_seconds) while queued behind other writes.
+@perf_utils.timed("clean_table_chunked")
+def clean_table_chunked(table_name, target_table, filters=None, drop_na=False, remove_outliers=True,
+                        method="zscore", threshold=None, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None, on_wait=None):
+    if target_table == table_name:
+        raise ValueError("Cleaned output must go to a different table than the source.")
+    started = time.perf_counter()
+    conn = get_connection()
+    try:
+        where, params = build_where_clause(filters or {})
+        conditions = [where] if where else []
+        if drop_na:
+            conditions += [f"{quote_table(c)} IS NOT NULL" for c in table_columns(table_name, conn)]
+        where = " AND ".join(conditions)
+        schema = get_schema(table_name, conn)
+
+        stats = None
+        if remove_outliers:
+            # Bools are stored as integers but select_dtypes("number") skips them in memory
+            columns = [c for c in numeric_columns(table_name, conn) if schema.get(c) not in ("bool", "boolean")]
+            stats = compute_outlier_stats_sql(table_name, method, columns, where, params, conn)
+
+        sql = f"SELECT * FROM {quote_table(table_name)}" + (f" WHERE {where}" if where else "")
+        read_conn = get_connection()
+        rows_read = rows_kept = 0
+        try:
+            with write_slot(f"clean {target_table}", on_wait=on_wait):
+                # Built in staging and swapped in, so the old target stays readable meanwhile
+                staging = staging_table_name(target_table)
+                try:
+                    for chunk in pd.read_sql(sql, read_conn, params=params, chunksize=chunk_rows):
+                        rows_read += len(chunk)
+                        if stats is not None:
+                            chunk = chunk[outlier_mask(chunk, stats, method, threshold)]
+                        chunk.to_sql(staging, conn, if_exists="append", index=False)
+                        rows_kept += len(chunk)
+                        if progress is not None:
+                            progress(rows_read, rows_kept, time.perf_counter() - started)
+                    if rows_read == 0:
+                        # Keep the schema even when nothing matched
+                        pd.read_sql(f"SELECT * FROM {quote_table(table_name)} LIMIT 0", read_conn).to_sql(
+                            staging, conn, if_exists="replace", index=False
+                        )
+                    swap_in_table(staging, target_table, conn)
+                except BaseException:
+                    drop_staging_table(staging, conn)
+                    raise
+                # The source's recorded dtypes carry its bool/datetime columns over to the target
+                mark_table_written(target_table, conn, {c: schema.get(c, "object") for c in table_columns(table_name, conn)})
+        finally:
+            read_conn.close()
+    finally:
+        conn.close()
+    return {"rows_read": rows_read, "rows_kept": rows_kept, "seconds": time.perf_counter() - started}
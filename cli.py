@@ -0,0 +1,304 @@
+# Headless entry point: run ingest / fuse / clean / features / train / search / score
+# without Streamlit. Every step prints one JSON line with its timings, e.g.
+#
+#     python cli.py ingest data/stats.csv --table player_stats
+#     python cli.py fuse
+#     python cli.py features --table unified_master_dataset
+#     python cli.py train --table unified_master_dataset --features yards,week --target fantasy_points_ppr
+#     python cli.py score --model unified_master_dataset_fantasy_predictor --input grid.parquet --output out.parquet
+#     python cli.py pipeline nightly.json
+#     python cli.py --storage parquet storage
+#
+# A pipeline file is a JSON list of steps, each an object with a "step" key
+# and the same options as the matching subcommand (dashes become underscores).
+import argparse
+import json
+import os
+import sys
+import time
+
+import perf_utils
+import shared_utils
+
+# Logic modules are imported inside each step so a step only pays for what it
+# uses (ingest never loads scikit-learn, nothing here loads Streamlit).
+
+def _csv_list(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if isinstance(value, str) else list(value or [])
+
+def _filters(opts):
+    filters = {}
+    if opts.get("seasons"):
+        lo, _, hi = str(opts["seasons"]).partition("-")
+        filters["season"] = (int(lo), int(hi or lo))
+    if opts.get("positions"):
+        filters["positions"] = _csv_list(opts["positions"])
+    if opts.get("player"):
+        filters["player_search"] = opts["player"]
+    return filters
+
+def step_ingest(opts):
+    from ingest_utils import ingest_file
+
+    table = opts.get("table") or os.path.splitext(os.path.basename(opts["file"]))[0]
+    return ingest_file(opts["file"], opts["file"], table, chunk_rows=int(opts.get("chunk_rows") or 100_000))
+
+def step_fuse(opts):
+    from fusion_utils import DEFAULT_TARGET, fuse_tables
+
+    return fuse_tables(opts.get("target") or DEFAULT_TARGET, incremental=not opts.get("full"))
+
+def step_clean(opts):
+    from cleaning_utils import DEFAULT_CHUNK_ROWS, clean_table_chunked
+
+    return clean_table_chunked(
+        opts["table"], opts.get("target") or f"{opts['table']}_clean",
+        filters=_filters(opts),
+        drop_na=bool(opts.get("drop_na")),
+        remove_outliers=not opts.get("keep_outliers"),
+        method=opts.get("method") or "zscore",
+        threshold=float(opts["threshold"]) if opts.get("threshold") is not None else None,
+        chunk_rows=int(opts.get("chunk_rows") or DEFAULT_CHUNK_ROWS),
+    )
+
+def step_features(opts):
+    from feature_store_utils import PERIOD_COLUMNS, list_features, register_default_features, refresh_features, supports_features
+
+    if not supports_features(opts["table"]):
+        raise ValueError(f"{opts['table']} needs {PERIOD_COLUMNS} columns for features")
+    if opts.get("defaults") or list_features(opts["table"]).empty:
+        register_default_features(opts["table"])
+    stores = refresh_features(opts["table"], full=bool(opts.get("full")))
+    return {"features": list_features(opts["table"])["name"].tolist(), "stores": stores}
+
+# Raw feature columns plus feature-store features, and the artifact entry for the latter
+def _model_features(opts):
+    from feature_store_utils import feature_definitions
+
+    features, store = _csv_list(opts.get("features")), _csv_list(opts.get("store_features"))
+    if not features and not store:
+        raise ValueError("Give --features and/or --store-features")
+    if not store:
+        return features, store, None
+    return features + store, store, {
+        "table": opts["table"], "features": store, "definitions": feature_definitions(opts["table"], store),
+    }
+
+def step_train(opts):
+    from training_utils import load_training_frame, prepare_xy, train_random_forest
+    from registry_utils import register_model
+
+    (features, store, feature_store), target = _model_features(opts), opts["target"]
+    df = load_training_frame(opts["table"], features, target, _filters(opts), store_features=store)
+    X, y = prepare_xy(df, features, target)
+    n_estimators, max_depth = int(opts.get("n_estimators") or 200), int(opts.get("max_depth") or 10)
+    model, metrics, _ = train_random_forest(
+        X, y,
+        test_size=float(opts.get("test_size") or 0.2),
+        n_estimators=n_estimators,
+        max_depth=max_depth,
+        n_jobs=int(opts.get("cores") or 1),
+    )
+    name = opts.get("name") or f"{opts['table']}_fantasy_predictor"
+    version, path = register_model(
+        model, name, features, target, source_table=opts["table"], metrics=metrics,
+        params={"n_estimators": n_estimators, "max_depth": max_depth}, feature_store=feature_store,
+    )
+    return {**metrics, "model": name, "version": version, "path": path}
+
+def step_search(opts):
+    from training_utils import load_training_frame, prepare_xy, search_hyperparameters
+    from registry_utils import register_model
+
+    (features, store, feature_store), target = _model_features(opts), opts["target"]
+    cv = opts.get("cv") or "kfold"
+    df = load_training_frame(
+        opts["table"], features, target, _filters(opts), extra_columns=["season"] if cv == "season" else (),
+        store_features=store,
+    )
+    X, y = prepare_xy(df, features, target)
+    model, metrics, leaderboard = search_hyperparameters(
+        X.to_numpy(), y.to_numpy(),
+        model_name=opts.get("regressor") or "random_forest",
+        strategy=opts.get("strategy") or "random",
+        cv=cv,
+        folds=int(opts.get("folds") or 5),
+        seasons=df["season"].to_numpy() if cv == "season" else None,
+        n_candidates=int(opts.get("candidates") or 20),
+        factor=int(opts.get("factor") or 3),
+        n_jobs=int(opts.get("cores") or 1),
+        feature_names=features,
+    )
+    name = opts.get("name") or f"{opts['table']}_fantasy_predictor"
+    version, path = register_model(
+        model, name, features, target, source_table=opts["table"],
+        metrics={"rmse": metrics["rmse"], "cv": metrics["cv"], "folds": metrics["folds"]},
+        params=metrics["best_params"], feature_store=feature_store,
+    )
+    leaderboard_file = os.path.splitext(path)[0] + "_leaderboard.csv"
+    leaderboard.to_csv(leaderboard_file, index=False)
+    return {**metrics, "regressor": metrics["model"], "model": name, "version": version, "path": path,
+            "leaderboard_file": leaderboard_file}
+
+def step_score(opts):
+    from registry_utils import get_model_entry
+    from scoring_utils import DEFAULT_CHUNK_ROWS, OUTPUT_FORMATS, score_file
+
+    model_path = opts.get("model_path")
+    if not model_path and not opts.get("model"):
+        raise ValueError("Give --model or --model-path")
+    if not model_path:
+        entry = get_model_entry(opts["model"], int(opts["version"]) if opts.get("version") else None)
+        if entry is None:
+            raise ValueError(f"No registered model named {opts['model']!r}")
+        model_path = entry["path"]
+    output = opts["output"]
+    output_format = opts.get("format") or os.path.splitext(output)[1].lstrip(".").lower()
+    if output_format not in OUTPUT_FORMATS:
+        output_format = "sqlite"
+    return score_file(
+        model_path, opts["input"], opts["input"], output, output_format,
+        workers=int(opts.get("workers") or 0),
+        chunk_rows=int(opts.get("chunk_rows") or DEFAULT_CHUNK_ROWS),
+    )
+
+def step_storage(opts):
+    from storage_utils import export_tables
+
+    return {"exported": export_tables(_csv_list(opts.get("tables")) or None)}
+
+STEPS = {
+    "ingest": step_ingest,
+    "fuse": step_fuse,
+    "clean": step_clean,
+    "features": step_features,
+    "train": step_train,
+    "search": step_search,
+    "score": step_score,
+    "storage": step_storage,
+}
+
+def _emit(record):
+    print(json.dumps(record, default=str), flush=True)
+
+# Run steps in order, one JSON line each; stops at the first failure
+def run_steps(steps):
+    started = time.perf_counter()
+    for opts in steps:
+        name = opts["step"]
+        step_started = time.perf_counter()
+        try:
+            with perf_utils.span(name):
+                result = STEPS[name](opts)
+        except Exception as exc:
+            _emit({"step": name, "status": "failed", "error": f"{type(exc).__name__}: {exc}",
+                   "seconds": time.perf_counter() - step_started})
+            return False
+        _emit({"step": name, "status": "ok", **(result or {}), "seconds": time.perf_counter() - step_started})
+    if len(steps) > 1:
+        _emit({"step": "total", "status": "ok", "steps": len(steps), "seconds": time.perf_counter() - started})
+    return True
+
+def _filter_args(parser):
+    parser.add_argument("--seasons", help="Season or season range, e.g. 2021 or 2019-2023")
+    parser.add_argument("--positions", help="Comma-separated positions, e.g. QB,WR")
+    parser.add_argument("--player", help="Player name substring")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Run Datos steps without the Streamlit UI.")
+    parser.add_argument("--db", default=shared_utils.DB_FILE, help="SQLite database file (default: %(default)s)")
+    parser.add_argument("--trace", help="Write spans and SQL timings to this file in Chrome trace format")
+    parser.add_argument("--storage", help="Backend for table reads: sqlite or parquet (default: DATOS_STORAGE or sqlite)")
+    sub = parser.add_subparsers(dest="step", required=True)
+
+    p = sub.add_parser("ingest", help="Load a csv/xlsx/json/jsonl/parquet file into a table")
+    p.add_argument("file")
+    p.add_argument("--table", help="Target table (default: file name)")
+    p.add_argument("--chunk-rows", type=int)
+
+    p = sub.add_parser("fuse", help="Build or refresh the unified master dataset")
+    p.add_argument("--target")
+    p.add_argument("--full", action="store_true", help="Rebuild everything instead of changed weeks only")
+
+    p = sub.add_parser("clean", help="Drop missing values / outliers into a new table")
+    p.add_argument("--table", required=True)
+    p.add_argument("--target")
+    p.add_argument("--drop-na", action="store_true")
+    p.add_argument("--keep-outliers", action="store_true")
+    p.add_argument("--method", choices=["zscore", "iqr", "mad"])
+    p.add_argument("--threshold", type=float)
+    p.add_argument("--chunk-rows", type=int)
+    _filter_args(p)
+
+    p = sub.add_parser("features", help="Build or update a table's feature store")
+    p.add_argument("--table", required=True)
+    p.add_argument("--defaults", action="store_true", help="Register the default features (done automatically when none exist)")
+    p.add_argument("--full", action="store_true", help="Rebuild every store instead of appending new weeks")
+
+    for name, help_text in [("train", "Train a RandomForest and register it"),
+                            ("search", "Hyperparameter search; registers the best model")]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--table", required=True)
+        p.add_argument("--features", help="Comma-separated feature columns")
+        p.add_argument("--store-features", help="Comma-separated feature-store features (see the features step)")
+        p.add_argument("--target", required=True)
+        p.add_argument("--name", help="Registry name (default: <table>_fantasy_predictor)")
+        p.add_argument("--cores", type=int)
+        _filter_args(p)
+        if name == "train":
+            p.add_argument("--test-size", type=float)
+            p.add_argument("--n-estimators", type=int)
+            p.add_argument("--max-depth", type=int)
+        else:
+            p.add_argument("--regressor", choices=["random_forest", "extra_trees", "gradient_boosting", "ridge"])
+            p.add_argument("--strategy", choices=["random", "grid"])
+            p.add_argument("--cv", choices=["kfold", "season"])
+            p.add_argument("--folds", type=int)
+            p.add_argument("--candidates", type=int)
+            p.add_argument("--factor", type=int)
+
+    p = sub.add_parser("score", help="Batch-score a feature file with a registered model")
+    model = p.add_mutually_exclusive_group(required=True)
+    model.add_argument("--model", help="Registered model name")
+    model.add_argument("--model-path", help="Score with a model file instead of a registry entry")
+    p.add_argument("--version", type=int)
+    p.add_argument("--input", required=True)
+    p.add_argument("--output", required=True, help="Output .parquet/.csv file, or a table name")
+    p.add_argument("--format", choices=["parquet", "csv", "sqlite"])
+    p.add_argument("--workers", type=int)
+    p.add_argument("--chunk-rows", type=int)
+
+    p = sub.add_parser("storage", help="Export tables without a current Parquet dataset (parquet backend)")
+    p.add_argument("--tables", help="Comma-separated tables (default: all)")
+
+    p = sub.add_parser("pipeline", help="Run the steps listed in a JSON file")
+    p.add_argument("config")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    shared_utils.DB_FILE = args.db
+    if args.storage:
+        from storage_utils import set_storage_backend
+
+        set_storage_backend(args.storage)
+    if args.step == "pipeline":
+        with open(args.config) as f:
+            steps = json.load(f)
+    else:
+        opts = {k: v for k, v in vars(args).items() if k not in ("db", "trace", "storage")}
+        steps = [opts]
+    if not args.trace:
+        return 0 if run_steps(steps) else 1
+
+    perf_utils.start_trace("cli " + args.step)
+    try:
+        ok = run_steps(steps)
+    finally:
+        trace = perf_utils.finish_trace()
+        with open(args.trace, "w") as f:
+            f.write(perf_utils.traces_to_chrome([trace]))
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
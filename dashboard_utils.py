@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import perf_utils
+import shared_utils
+from result_cache_utils import cached_result
+from shared_utils import get_connection, quote_table, get_table_version
+from query_utils import table_columns, build_where_clause
+
+# Dashboard for the Visualizer page: every KPI and chart aggregate comes from
+# one SQL statement over the filtered rows, long series are downsampled before
+# plotting, and finished figure specs are cached per (database, table version, filters).
+
+POINTS_COL = "fantasy_points_ppr"
+TOP_PLAYERS = 20
+# Line charts with more points than this are downsampled with LTTB
+MAX_LINE_POINTS = 1000
+# Dashboards kept in the in-process cache (override with DATOS_DASHBOARD_CACHE)
+DASHBOARD_CACHE_SIZE = int(os.environ.get("DATOS_DASHBOARD_CACHE", "64"))
+
+_dashboard_cache = OrderedDict()
+_dashboard_lock = threading.Lock()
+
+# Largest-Triangle-Three-Buckets: keeps n_out points that preserve the visual
+# shape of the series (first and last points always kept). x must be sorted.
+def lttb(x, y, n_out):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # The next bucket's mean is the third corner of the triangle
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs(
+            (x[prev] - next_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (next_y - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        keep[i + 1] = prev
+    return keep
+
+# Downsample a (sorted) frame for a line chart; returns the frame and whether it was reduced
+def downsample_series(df, x, y, max_points=MAX_LINE_POINTS):
+    if len(df) <= max_points or not pd.api.types.is_numeric_dtype(df[x]):
+        return df, False
+    return df.iloc[lttb(df[x].to_numpy(), df[y].fillna(0).to_numpy(), max_points)], True
+
+# Every dashboard aggregate in one statement: the filtered rows are materialized
+# once and the GROUP BYs are UNION ALL-ed (SQLite has no GROUPING SETS)
+def dashboard_aggregates(table_name, filters, conn):
+    columns = set(table_columns(table_name, conn))
+    has_points = POINTS_COL in columns
+    pts = quote_table(POINTS_COL) if has_points else "NULL"
+    needed = [c for c in ("player_name", "position", "week", POINTS_COL) if c in columns]
+    where, params = build_where_clause(filters)
+
+    # With a per-player branch the distinct count is just its row count
+    players = "COUNT(DISTINCT player_name)" if "player_name" in columns and not has_points else "NULL"
+    parts = [f"SELECT 'total' AS grp, NULL AS key, SUM({pts}) AS total, AVG({pts}) AS mean, COUNT(*) AS n, {players} AS players FROM f"]
+    if "player_name" in columns and has_points:
+        parts.append(f"SELECT 'player', player_name, SUM({pts}), NULL, COUNT(*), NULL FROM f "
+                     "WHERE player_name IS NOT NULL GROUP BY player_name")
+    if "position" in columns:
+        parts.append("SELECT 'position', position, NULL, NULL, COUNT(*), NULL FROM f "
+                     "WHERE position IS NOT NULL GROUP BY position")
+    if "week" in columns and has_points:
+        parts.append(f"SELECT 'week', CAST(week AS TEXT), SUM({pts}), NULL, COUNT(*), NULL FROM f WHERE week IS NOT NULL GROUP BY week")
+
+    # Older SQLite inlines the CTE into each branch instead (still correct, just more scans)
+    materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
+    select_cols = ", ".join(quote_table(c) for c in needed) or "1"
+    sql = (
+        f"WITH f AS {materialized}(SELECT {select_cols} FROM {quote_table(table_name)}"
+        + (f" WHERE {where}" if where else "")
+        + ") "
+        + " UNION ALL ".join(parts)
+    )
+    return pd.read_sql(sql, conn, params=params)
+
+# Week keys come back as text (so the key column has one type); numbers unless the column holds text
+def _numeric_if_possible(values):
+    try:
+        return pd.to_numeric(values)
+    except (TypeError, ValueError):
+        return values
+
+def _build_dashboard(rows):
+    total = rows[rows["grp"] == "total"].iloc[0]
+    kpis = {
+        "rows": int(total["n"]),
+        "total_points": round(float(total["total"]), 2) if pd.notna(total["total"]) else 0.0,
+        "avg_points": round(float(total["mean"]), 2) if pd.notna(total["mean"]) else float("nan"),
+    }
+    players = rows[rows["grp"] == "player"]
+    kpis["unique_players"] = int(total["players"]) if pd.notna(total["players"]) else len(players)
+    figures = []
+
+    if not players.empty:
+        top = (
+            pd.DataFrame({"player_name": players["key"], POINTS_COL: players["total"].fillna(0)})
+            .sort_values(POINTS_COL, ascending=False)
+            .head(TOP_PLAYERS)
+        )
+        figures.append(px.bar(top, x="player_name", y=POINTS_COL, title="Top Players (PPR Total)"))
+
+    positions = rows[rows["grp"] == "position"]
+    if not positions.empty:
+        pos = pd.DataFrame({"position": positions["key"], "count": positions["n"]}).sort_values("count", ascending=False)
+        figures.append(px.pie(pos, names="position", values="count", title="Position Breakdown"))
+
+    weeks = rows[rows["grp"] == "week"]
+    if not weeks.empty:
+        weekly = pd.DataFrame({"week": _numeric_if_possible(weeks["key"]), POINTS_COL: weeks["total"].fillna(0)})
+        weekly, reduced = downsample_series(weekly.sort_values("week"), "week", POINTS_COL)
+        title = "Weekly Total Fantasy Points (PPR)" + (f" ({len(weekly)} of {len(weeks)} points)" if reduced else "")
+        figures.append(px.line(weekly, x="week", y=POINTS_COL, markers=not reduced, title=title))
+
+    return {"kpis": kpis, "figures": [fig.to_dict() for fig in figures]}
+
+# KPIs and plotly figure specs for a table under a filter spec. Cached by
+# table version, so any write to the table invalidates it; treat as read-only.
+# The aggregate rows are also kept in the shared result cache, so other server
+# processes only rebuild the figures.
+@perf_utils.timed("dashboard")
+def get_dashboard(table_name, filters, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        version = get_table_version(table_name, conn)
+        key = (shared_utils.DB_FILE, table_name, version, json.dumps(filters, sort_keys=True, default=str))
+        with _dashboard_lock:
+            if key in _dashboard_cache:
+                _dashboard_cache.move_to_end(key)
+                return _dashboard_cache[key]
+        with perf_utils.span("dashboard aggregates"):
+            rows = cached_result(
+                table_name, version, "dashboard", filters, lambda: dashboard_aggregates(table_name, filters, conn)
+            )
+    finally:
+        if own_conn:
+            conn.close()
+
+    with perf_utils.span("dashboard figures"):
+        dashboard = _build_dashboard(rows)
+    with _dashboard_lock:
+        _dashboard_cache[key] = dashboard
+        while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+            _dashboard_cache.popitem(last=False)
+    return dashboard
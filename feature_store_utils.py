@@ -0,0 +1,615 @@
+import hashlib
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from shared_utils import INTERNAL_PREFIX, get_connection, quote_table, get_table_version
+from query_utils import table_columns
+from write_utils import write_slot
+
+# Windowed per-entity features for modeling. Rows are summed per
+# (entity, season, week) period and each store table keeps those period sums
+# with running totals, so "mean of the previous N periods" is a difference of
+# two prefix sums and a new week only appends rows to the store (after one
+# grouped scan in SQLite confirms the older weeks are unchanged).
+# Every feature describes the periods strictly before the row's week: it is
+# known before kickoff, so the same value is used to train and to score.
+
+DEFINITIONS_TABLE = f"{INTERNAL_PREFIX}feature_defs"
+STATE_TABLE = f"{INTERNAL_PREFIX}feature_state"
+PERIOD_COLUMNS = ["season", "week"]
+DEFAULT_ENTITY = "player_id"
+STATS = ["mean", "sum", "std", "count"]
+# Besides a number of previous periods: season to date, or everything before
+ALL_WINDOWS = ["season", "all"]
+
+# (name, column, stat, window, entity); registered for the columns a table has
+DEFAULT_FEATURES = [
+    ("ppr_last", "fantasy_points_ppr", "mean", 1, "player_id"),
+    ("ppr_avg_3", "fantasy_points_ppr", "mean", 3, "player_id"),
+    ("ppr_avg_5", "fantasy_points_ppr", "mean", 5, "player_id"),
+    ("ppr_std_5", "fantasy_points_ppr", "std", 5, "player_id"),
+    ("ppr_season_avg", "fantasy_points_ppr", "mean", "season", "player_id"),
+    ("ppr_career_avg", "fantasy_points_ppr", "mean", "all", "player_id"),
+    ("games_season", "fantasy_points_ppr", "count", "season", "player_id"),
+    ("team_ppr_avg_3", "fantasy_points_ppr", "mean", 3, "team"),
+    ("stadium_ppr_avg_8", "fantasy_points_ppr", "mean", 8, "stadium_id"),
+]
+
+# Per-period sums and their running totals (inclusive of the period itself):
+# cum_* over the entity's whole history, s_* within the current season
+_SUMS = ["n", "total", "sq"]
+_RUNNING = [f"cum_{s}" for s in _SUMS] + [f"s_{s}" for s in _SUMS]
+# Stored period sums still match the table when within these tolerances
+HISTORY_RTOL = 1e-12
+HISTORY_ATOL = 1e-9
+
+def _ensure_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {DEFINITIONS_TABLE} ("
+        "table_name TEXT NOT NULL, name TEXT NOT NULL, column_name TEXT NOT NULL, stat TEXT NOT NULL, "
+        "window TEXT NOT NULL, entity TEXT NOT NULL, PRIMARY KEY (table_name, name))"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} ("
+        "table_name TEXT NOT NULL, entity TEXT NOT NULL, column_name TEXT NOT NULL, store_table TEXT NOT NULL, "
+        "signature TEXT NOT NULL, version INTEGER NOT NULL, last_season, last_week, "
+        "rows_through INTEGER NOT NULL, values_through INTEGER NOT NULL, total_through REAL NOT NULL, "
+        "updated_at REAL NOT NULL, PRIMARY KEY (table_name, entity, column_name))"
+    )
+
+def _store_name(table_name, entity, column):
+    digest = hashlib.sha1(f"{table_name}\x00{entity}\x00{column}".encode("utf-8")).hexdigest()[:16]
+    return f"{INTERNAL_PREFIX}fstore_{digest}"
+
+def _parse_window(window):
+    if str(window) in ALL_WINDOWS:
+        return str(window)
+    return int(window)
+
+# Whether a table has the (season, week) columns features are keyed on
+def supports_features(table_name, conn=None):
+    return set(PERIOD_COLUMNS) <= set(table_columns(table_name, conn))
+
+# Add or replace one feature definition. window: number of previous periods,
+# "season" or "all". The store is rebuilt on the next refresh_features.
+def define_feature(table_name, name, column, stat="mean", window=3, entity=DEFAULT_ENTITY, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        columns = set(table_columns(table_name, conn))
+        if stat not in STATS:
+            raise ValueError(f"Unknown stat {stat!r}; expected one of {STATS}")
+        window = _parse_window(window)
+        if isinstance(window, int) and window < 1:
+            raise ValueError("A window must cover at least one period.")
+        missing = [c for c in [column, entity, *PERIOD_COLUMNS] if c not in columns]
+        if missing:
+            raise ValueError(f"{table_name} has no column(s) {missing}")
+        if name in columns:
+            raise ValueError(f"{name!r} is already a column of {table_name}")
+        _ensure_tables(conn)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {DEFINITIONS_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+            (table_name, name, column, stat, str(window), entity),
+        )
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+# Register every DEFAULT_FEATURES entry the table has columns for; returns their names
+def register_default_features(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        columns = set(table_columns(table_name, conn))
+        names = []
+        for name, column, stat, window, entity in DEFAULT_FEATURES:
+            if {column, entity, *PERIOD_COLUMNS} <= columns and name not in columns:
+                define_feature(table_name, name, column, stat, window, entity, conn)
+                names.append(name)
+    finally:
+        if own_conn:
+            conn.close()
+    return names
+
+def drop_feature(table_name, name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_tables(conn)
+        conn.execute(f"DELETE FROM {DEFINITIONS_TABLE} WHERE table_name = ? AND name = ?", (table_name, name))
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+def _definitions(table_name, conn):
+    _ensure_tables(conn)
+    rows = conn.execute(
+        f"SELECT name, column_name, stat, window, entity FROM {DEFINITIONS_TABLE} WHERE table_name = ? ORDER BY rowid",
+        (table_name,),
+    ).fetchall()
+    return [
+        {"name": name, "column": column, "stat": stat, "window": _parse_window(window), "entity": entity}
+        for name, column, stat, window, entity in rows
+    ]
+
+# Feature definitions of a table as a DataFrame (name, column, stat, window, entity);
+# window is text ("3", "season", "all")
+def list_features(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        defs = _definitions(table_name, conn)
+    finally:
+        if own_conn:
+            conn.close()
+    return pd.DataFrame(
+        [dict(d, window=str(d["window"])) for d in defs], columns=["name", "column", "stat", "window", "entity"]
+    )
+
+# Definitions grouped by the store that holds them: {(entity, column): [def, ...]}
+def _stores(defs):
+    stores = {}
+    for d in defs:
+        stores.setdefault((d["entity"], d["column"]), []).append(d)
+    return stores
+
+def _signature(defs):
+    return json.dumps(sorted([d["name"], d["stat"], str(d["window"])] for d in defs))
+
+# Aggregate a statistic from window sums (arrays); NaN where it is undefined
+def _stat(stat, n, total, sq):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if stat == "count":
+            return n
+        if stat == "sum":
+            return total
+        if stat == "mean":
+            return np.where(n > 0, total / n, np.nan)
+        var = (sq - np.where(n > 0, total * total / n, 0.0)) / (n - 1)
+        return np.where(n > 1, np.sqrt(np.clip(var, 0.0, None)), np.nan)
+
+# Rows that belong to a period: entity, season and week all set
+def _keyed_rows(entity):
+    return " AND ".join(f"{quote_table(p)} IS NOT NULL" for p in [entity, *PERIOD_COLUMNS])
+
+# One row per (entity, season, week) with the count, sum and sum of squares
+# of the column; `after` = (season, week) keeps only later periods, `through`
+# only that period and earlier ones
+def _periods_sql(table_name, entity, column, after=None, through=None):
+    e, c = quote_table(entity), quote_table(column)
+    where = _keyed_rows(entity)
+    params = []
+    if after is not None:
+        where += " AND (season, week) > (?, ?)"
+        params += list(after)
+    if through is not None:
+        where += " AND (season, week) <= (?, ?)"
+        params += list(through)
+    sql = (
+        f"SELECT {e} AS key, season, week, COUNT(*) AS rows, COUNT({c}) AS n, TOTAL({c}) AS total, "
+        f"TOTAL({c} * {c}) AS sq FROM {quote_table(table_name)} WHERE {where} GROUP BY {e}, season, week"
+    )
+    return sql, params
+
+def _read_periods(table_name, entity, column, conn, after=None, through=None):
+    sql, params = _periods_sql(table_name, entity, column, after, through)
+    return pd.read_sql(sql, conn, params=params)
+
+# Running totals over a frame sorted by (key, season, week). When the first
+# row of a key carries stored running totals (incremental refresh), the new
+# rows continue from them; otherwise each key starts from zero.
+def _accumulate(frame):
+    idx = np.arange(len(frame))
+    keys, seasons = frame["key"].to_numpy(), frame["season"].to_numpy()
+    new_key = np.r_[True, keys[1:] != keys[:-1]]
+    new_season = new_key | np.r_[True, seasons[1:] != seasons[:-1]]
+    start = np.maximum.accumulate(np.where(new_key, idx, 0))
+    season_start = np.maximum.accumulate(np.where(new_season, idx, 0))
+    first_season = season_start == start
+
+    stored = frame["seq"].to_numpy(dtype=float) if "seq" in frame else np.full(len(frame), np.nan)
+    carried = ~np.isnan(stored[start])
+    frame = frame.assign(seq=idx - start + np.where(carried, stored[start], 0).astype(np.int64))
+    for s in _SUMS:
+        x = frame[s].to_numpy(dtype=float)
+        running = np.cumsum(x)
+        cum = running - (running[start] - x[start])
+        scum = running - (running[season_start] - x[season_start])
+        if f"cum_{s}" in frame:
+            # Stored totals of the key's first row minus what was recomputed for it
+            cum_offset = frame[f"cum_{s}"].to_numpy(dtype=float)[start] - x[start]
+            s_offset = frame[f"s_{s}"].to_numpy(dtype=float)[start] - x[start]
+            cum = cum + np.where(carried, cum_offset, 0.0)
+            scum = scum + np.where(carried & first_season, s_offset, 0.0)
+        frame[f"cum_{s}"] = cum
+        frame[f"s_{s}"] = scum
+    return frame, idx - start
+
+# Feature values for every row of an accumulated frame: sums over the periods
+# before each row are its running totals minus its own period
+def _window_features(frame, local_seq, defs):
+    idx = np.arange(len(frame))
+    seq = frame["seq"].to_numpy()
+    before = {s: frame[f"cum_{s}"].to_numpy() - frame[s].to_numpy(dtype=float) for s in _SUMS}
+    season_before = {s: frame[f"s_{s}"].to_numpy() - frame[s].to_numpy(dtype=float) for s in _SUMS}
+    features = {}
+    for d in defs:
+        window = d["window"]
+        if window == "all":
+            sums = before
+        elif window == "season":
+            sums = season_before
+        else:
+            lag = np.maximum(idx - window, 0)
+            # Rows whose window starts before the loaded context are only context rows
+            sums = {
+                s: before[s] - np.where(
+                    local_seq >= window, before[s][lag], np.where(seq >= window, np.nan, 0.0)
+                )
+                for s in _SUMS
+            }
+        features[d["name"]] = _stat(d["stat"], sums["n"], sums["total"], sums["sq"])
+    return pd.DataFrame(features, index=frame.index)
+
+# Declared SQLite types of the (entity, season, week) columns. Store keys use
+# the same affinity as the table so joins between them can use the index.
+def _key_types(table_name, entity, conn):
+    declared = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({quote_table(table_name)})")}
+    return [declared.get(c, "") for c in [entity, *PERIOD_COLUMNS]]
+
+def _create_store(store, defs, key_types, conn):
+    keys = ", ".join(f"{name} {declared}".strip() for name, declared in zip(["key", *PERIOD_COLUMNS], key_types))
+    feature_cols = "".join(f", {quote_table(d['name'])} REAL" for d in defs)
+    sums = ", ".join(f"{c} REAL" for c in _SUMS + _RUNNING)
+    conn.execute(f"DROP TABLE IF EXISTS {quote_table(store)}")
+    conn.execute(
+        f"CREATE TABLE {quote_table(store)} ({keys}, seq INTEGER NOT NULL, {sums}{feature_cols}, "
+        "PRIMARY KEY (key, season, week)) WITHOUT ROWID"
+    )
+    conn.execute(f"CREATE INDEX {quote_table(store + '_seq')} ON {quote_table(store)} (key, seq)")
+
+def _store_columns(defs):
+    return ["key", "season", "week", "seq"] + _SUMS + _RUNNING + [d["name"] for d in defs]
+
+# Keyed rows at or before the watermark: (rows, non-null values, total) of the
+# column, counted over the same rows _periods_sql groups so they match _save_state
+def _history_totals(table_name, entity, column, watermark, conn):
+    c = quote_table(column)
+    rows, values, total = conn.execute(
+        f"SELECT COUNT(*), COUNT({c}), TOTAL({c}) FROM {quote_table(table_name)} "
+        f"WHERE {_keyed_rows(entity)} AND (season, week) <= (?, ?)",
+        watermark,
+    ).fetchone()
+    return rows, values, total
+
+# Features are a function of each period's count, sum and sum of squares only,
+# so the store is still valid for the rows up to the watermark exactly when the
+# table's periods there match the stored ones (swapped or edited values change
+# at least one period; sums are compared allowing for summation order only).
+# The comparison runs inside SQLite as one grouped scan of the history joined
+# to the store's primary key, so nothing is loaded into pandas, but the scan
+# still reads every row up to the watermark on each incremental refresh.
+def _history_unchanged(table_name, entity, column, store, watermark, conn):
+    periods, params = _periods_sql(table_name, entity, column, through=watermark)
+    differs = " OR ".join(
+        f"ABS(c.{s} - f.{s}) > {HISTORY_ATOL!r} + {HISTORY_RTOL!r} * ABS(f.{s})" for s in ["total", "sq"]
+    )
+    matched, changed = conn.execute(
+        f"SELECT COUNT(*), TOTAL(f.key IS NULL OR c.n != f.n OR {differs}) FROM ({periods}) c "
+        f"LEFT JOIN {quote_table(store)} f ON f.key = c.key AND f.season = c.season AND f.week = c.week",
+        params,
+    ).fetchone()
+    stored = conn.execute(f"SELECT COUNT(*) FROM {quote_table(store)}").fetchone()[0]
+    return matched == stored and not changed
+
+def _save_state(table_name, entity, column, store, defs, version, periods, previous, conn):
+    rows, values, total, watermark = previous
+    if len(periods):
+        watermark = tuple(periods[PERIOD_COLUMNS].sort_values(PERIOD_COLUMNS).iloc[-1].tolist())
+        rows += int(periods["rows"].sum())
+        values += int(periods["n"].sum())
+        total += float(periods["total"].sum())
+    conn.execute(
+        f"INSERT OR REPLACE INTO {STATE_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (table_name, entity, column, store, _signature(defs), version, *watermark, rows, values, total, time.time()),
+    )
+
+def _build_store(table_name, entity, column, store, defs, version, conn):
+    periods = _read_periods(table_name, entity, column, conn).sort_values(["key", *PERIOD_COLUMNS], kind="stable")
+    frame, local_seq = _accumulate(periods.reset_index(drop=True))
+    frame = pd.concat([frame, _window_features(frame, local_seq, defs)], axis=1)
+    _create_store(store, defs, _key_types(table_name, entity, conn), conn)
+    frame[_store_columns(defs)].to_sql(store, conn, if_exists="append", index=False)
+    _save_state(table_name, entity, column, store, defs, version, periods, (0, 0, 0.0, (None, None)), conn)
+    return len(periods)
+
+# Drop stored periods from `first` on; returns the new watermark (None if nothing is left)
+def _truncate_store(store, first, conn):
+    conn.execute(f"DELETE FROM {quote_table(store)} WHERE (season, week) >= (?, ?)", first)
+    last = conn.execute(
+        f"SELECT season, week FROM {quote_table(store)} ORDER BY season DESC, week DESC LIMIT 1"
+    ).fetchone()
+    return tuple(last) if last else None
+
+# Append the periods after the watermark, continuing each key from its last
+# stored rows. Returns None when older rows changed and a rebuild is needed.
+# partitions: the (season, week) pairs rewritten in place, when the writer knows
+# them; the store is then cut back to before the first one instead of checked.
+def _extend_store(table_name, entity, column, store, defs, version, state, conn, partitions=None):
+    watermark = (state["last_season"], state["last_week"])
+    if watermark[0] is None:
+        return None
+    through = (state["rows_through"], state["values_through"], state["total_through"])
+    if partitions is not None:
+        changed = sorted(p for p in partitions if None not in p)
+        if changed and changed[0] <= watermark:
+            watermark = _truncate_store(store, changed[0], conn)
+            if watermark is None:
+                return None
+            through = _history_totals(table_name, entity, column, watermark, conn)
+    else:
+        rows, values, total = _history_totals(table_name, entity, column, watermark, conn)
+        # Cheap check first (rows added or removed at or before the watermark), then
+        # the per-period comparison that also catches edits keeping those totals
+        if (rows, values) != through[:2] or not np.isclose(total, through[2], rtol=1e-10, atol=1e-6):
+            return None
+        if not _history_unchanged(table_name, entity, column, store, watermark, conn):
+            return None
+
+    new = _read_periods(table_name, entity, column, conn, after=watermark)
+    if not new.empty:
+        # The longest window needs that many stored periods before the first new one
+        longest = max([d["window"] for d in defs if isinstance(d["window"], int)], default=0)
+        context = pd.read_sql(
+            f"SELECT s.key, s.season, s.week, s.seq, {', '.join('s.' + c for c in _SUMS + _RUNNING)} "
+            f"FROM {quote_table(store)} s JOIN (SELECT key, MAX(seq) AS last FROM {quote_table(store)} GROUP BY key) t "
+            "ON s.key = t.key WHERE s.seq >= t.last - ?",
+            conn, params=[longest],
+        )
+        context = context[context["key"].isin(new["key"])]
+        combined = pd.concat([context, new.drop(columns="rows")], ignore_index=True)
+        combined["_new"] = np.r_[np.zeros(len(context), dtype=bool), np.ones(len(new), dtype=bool)]
+        combined = combined.sort_values(["key", "_new", *PERIOD_COLUMNS], kind="stable").reset_index(drop=True)
+        frame, local_seq = _accumulate(combined)
+        frame = pd.concat([frame, _window_features(frame, local_seq, defs)], axis=1)
+        frame.loc[frame["_new"], _store_columns(defs)].to_sql(store, conn, if_exists="append", index=False)
+    _save_state(table_name, entity, column, store, defs, version, new, (*through, watermark), conn)
+    return len(new)
+
+# Bring a table's feature stores up to date (called from mark_table_written).
+# Each store is extended with the weeks after its watermark when the older
+# rows are unchanged, and rebuilt otherwise (or when full=True or its
+# definitions changed). partitions: see mark_table_written.
+# Returns one dict per store: entity, column, mode, periods, seconds.
+def refresh_features(table_name, conn=None, full=False, partitions=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        with write_slot(f"features {table_name}"):
+            _ensure_tables(conn)
+            defs = _definitions(table_name, conn)
+            columns = set(table_columns(table_name, conn)) if defs else set()
+            if not set(PERIOD_COLUMNS) <= columns:
+                defs = []
+            stores = {
+                key: store_defs for key, store_defs in _stores(defs).items() if set(key) <= columns
+            }
+            cursor = conn.execute(f"SELECT * FROM {STATE_TABLE} WHERE table_name = ?", (table_name,))
+            names = [d[0] for d in cursor.description]
+            states = {(s["entity"], s["column_name"]): s for s in (dict(zip(names, r)) for r in cursor.fetchall())}
+
+            # Stores whose definitions are all gone
+            for key, state in states.items():
+                if key not in stores:
+                    conn.execute(f"DROP TABLE IF EXISTS {quote_table(state['store_table'])}")
+                    conn.execute(
+                        f"DELETE FROM {STATE_TABLE} WHERE table_name = ? AND entity = ? AND column_name = ?",
+                        (table_name, *key),
+                    )
+
+            version = get_table_version(table_name, conn)
+            report = []
+            for (entity, column), store_defs in stores.items():
+                started = time.perf_counter()
+                store = _store_name(table_name, entity, column)
+                state = states.get((entity, column))
+                periods, mode = None, "current"
+                if state is not None and state["version"] == version and state["signature"] == _signature(store_defs) and not full:
+                    periods = 0
+                elif state is not None and state["signature"] == _signature(store_defs) and not full:
+                    # Partitions only describe the change from the version just before this one
+                    rewritten = partitions if state["version"] == version - 1 else None
+                    periods, mode = _extend_store(
+                        table_name, entity, column, store, store_defs, version, state, conn, rewritten
+                    ), "incremental"
+                if periods is None:
+                    periods, mode = _build_store(table_name, entity, column, store, store_defs, version, conn), "full"
+                conn.commit()
+                report.append({
+                    "entity": entity, "column": column, "mode": mode, "periods": periods,
+                    "seconds": time.perf_counter() - started,
+                })
+    finally:
+        if own_conn:
+            conn.close()
+    return report
+
+# Definitions of the named features, as saved with a model so scoring can
+# check it still gets the features the model was trained on
+def feature_definitions(table_name, names, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        defs = {d["name"]: d for d in _definitions(table_name, conn)}
+    finally:
+        if own_conn:
+            conn.close()
+    return [dict(defs[n], window=str(defs[n]["window"])) for n in names if n in defs]
+
+# Definitions for the requested feature names, refreshing stale stores first.
+# expected: definitions saved at training time; a redefined feature is an error.
+def _current_definitions(table_name, names, conn, expected=None):
+    defs = {d["name"]: d for d in _definitions(table_name, conn)}
+    unknown = [n for n in names if n not in defs]
+    if unknown:
+        raise ValueError(f"Unknown feature(s) for {table_name}: {unknown}")
+    if expected is not None:
+        changed = [e["name"] for e in expected if dict(defs[e["name"]], window=str(defs[e["name"]]["window"])) != e]
+        if changed:
+            raise ValueError(f"Feature(s) {changed} of {table_name} were redefined after the model was trained.")
+    if not _stores_current(table_name, list(defs.values()), conn):
+        refresh_features(table_name, conn)
+    return [defs[n] for n in names]
+
+def _stores_current(table_name, defs, conn):
+    version = get_table_version(table_name, conn)
+    states = {
+        (entity, column): (signature, v)
+        for entity, column, signature, v in conn.execute(
+            f"SELECT entity, column_name, signature, version FROM {STATE_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall()
+    }
+    return all(states.get(key) == (_signature(d), version) for key, d in _stores(defs).items())
+
+# Whether every store of a table matches its current version and definitions
+def features_current(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        current = _stores_current(table_name, _definitions(table_name, conn), conn)
+    finally:
+        if own_conn:
+            conn.close()
+    return current
+
+# Columns a scoring file needs so store features can be looked up for it
+def key_columns(table_name, names, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        defs = {d["name"]: d for d in _definitions(table_name, conn)}
+    finally:
+        if own_conn:
+            conn.close()
+    entities = [defs[n]["entity"] for n in names if n in defs]
+    return list(dict.fromkeys(entities + PERIOD_COLUMNS))
+
+# Table columns plus store features, joined in SQL on (entity, season, week)
+# and returned in table order; the training path of load_training_frame
+def load_with_features(table_name, columns, names, where=None, params=(), conn=None):
+    from schema_utils import apply_schema, get_schema
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        defs = _current_definitions(table_name, list(names), conn)
+        stores = _stores(defs)
+        inner = list(dict.fromkeys(list(columns) + [entity for entity, _ in stores] + PERIOD_COLUMNS))
+        select = [f"s.{quote_table(c)}" for c in columns]
+        joins = []
+        for i, ((entity, column), store_defs) in enumerate(stores.items()):
+            alias = f"f{i}"
+            select += [f"{alias}.{quote_table(d['name'])}" for d in store_defs]
+            joins.append(
+                f"LEFT JOIN {quote_table(_store_name(table_name, entity, column))} {alias} "
+                f"ON {alias}.key = s.{quote_table(entity)} AND {alias}.season = s.season AND {alias}.week = s.week"
+            )
+        sql = (
+            f"SELECT {', '.join(select)} FROM (SELECT rowid AS _datos_rowid, {', '.join(quote_table(c) for c in inner)} "
+            f"FROM {quote_table(table_name)}" + (f" WHERE {where}" if where else "") + ") s "
+            + " ".join(joins) + " ORDER BY s._datos_rowid"
+        )
+        df = pd.read_sql(sql, conn, params=list(params))
+        df = apply_schema(df, get_schema(table_name, conn))
+    finally:
+        if own_conn:
+            conn.close()
+    return df[list(columns) + [d["name"] for d in defs]]
+
+# Store features for arbitrary rows (e.g. a scoring file) as of each row's
+# (season, week): the key's last stored period before it and the periods
+# before that one. Matches the stored values for weeks the table already has
+# and extends them to future weeks. Returns df with the features added.
+# definitions: the feature_definitions saved with the model, if any.
+def attach_features(df, table_name, names, conn=None, definitions=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        defs = _current_definitions(table_name, list(names), conn, definitions)
+        out = df.copy(deep=False)
+        for (entity, column), store_defs in _stores(defs).items():
+            keys = [entity, *PERIOD_COLUMNS]
+            lookup = df[keys].dropna().drop_duplicates().reset_index(drop=True)
+            values = _lookup_features(
+                _store_name(table_name, entity, column), lookup, store_defs, _key_types(table_name, entity, conn), conn
+            )
+            merged = out[keys].merge(pd.concat([lookup, values], axis=1), on=keys, how="left")
+            for d in store_defs:
+                out[d["name"]] = merged[d["name"]].to_numpy()
+    finally:
+        if own_conn:
+            conn.close()
+    return out
+
+def _lookup_features(store, lookup, defs, key_types, conn):
+    st, by_seq = quote_table(store), quote_table(store + "_seq")
+    windows = sorted({d["window"] for d in defs if isinstance(d["window"], int)})
+    sums = ", ".join(f"j.{c}" for c in _RUNNING)
+    lag_cols = "".join(f", b{w}.cum_{s} AS lag{w}_{s}" for w in windows for s in _SUMS)
+    # The planner otherwise walks a key's primary-key range for every seq lookup
+    lag_joins = "".join(
+        f" LEFT JOIN {st} b{w} INDEXED BY {by_seq} ON b{w}.key = l.key AND b{w}.seq = l.seq - {w}" for w in windows
+    )
+    keys = ", ".join(f"{name} {declared}".strip() for name, declared in zip(["key", *PERIOD_COLUMNS], key_types))
+    conn.execute("DROP TABLE IF EXISTS temp._datos_feature_lookup")
+    conn.execute(f"CREATE TEMP TABLE _datos_feature_lookup ({keys}, seq INTEGER)")
+    conn.executemany(
+        "INSERT INTO _datos_feature_lookup (key, season, week) VALUES (?, ?, ?)",
+        lookup.astype(object).itertuples(index=False, name=None),
+    )
+    # j: the key's last stored period before the row's (season, week)
+    conn.execute(
+        f"UPDATE _datos_feature_lookup AS l SET seq = (SELECT x.seq FROM {st} x "
+        "WHERE x.key = l.key AND (x.season, x.week) < (l.season, l.week) ORDER BY x.season DESC, x.week DESC LIMIT 1)"
+    )
+    rows = pd.read_sql(
+        f"SELECT l.season AS p_season, j.season AS j_season, j.seq AS j_seq, {sums}{lag_cols} "
+        f"FROM _datos_feature_lookup l LEFT JOIN {st} j INDEXED BY {by_seq} ON j.key = l.key AND j.seq = l.seq"
+        f"{lag_joins} ORDER BY l.rowid",
+        conn,
+    )
+    conn.execute("DROP TABLE temp._datos_feature_lookup")
+    conn.commit()
+
+    # Sums over the periods up to and including j, the last one before the row
+    found = rows["j_seq"].notna().to_numpy()
+    through = {s: np.where(found, rows[f"cum_{s}"].fillna(0).to_numpy(dtype=float), 0.0) for s in _SUMS}
+    same_season = found & (rows["j_season"].to_numpy() == rows["p_season"].to_numpy())
+    season = {s: np.where(same_season, rows[f"s_{s}"].fillna(0).to_numpy(dtype=float), 0.0) for s in _SUMS}
+    features = {}
+    for d in defs:
+        window = d["window"]
+        if window == "all":
+            window_sums = through
+        elif window == "season":
+            window_sums = season
+        else:
+            window_sums = {s: through[s] - rows[f"lag{window}_{s}"].fillna(0).to_numpy(dtype=float) for s in _SUMS}
+        features[d["name"]] = _stat(d["stat"], window_sums["n"], window_sums["total"], window_sums["sq"])
+    return pd.DataFrame(features)
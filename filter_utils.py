@@ -1,26 +1,80 @@
 import streamlit as st
+import pandas as pd
+from shared_utils import load_table
+import perf_utils
+from query_utils import table_columns, column_bounds, distinct_values
+from text_index_utils import get_text_index, suggest_values
 
-# Universal Filtering Logic
-def apply_universal_filters(df):
-    filtered_df = df.copy()
+# Range slider whose bounds come from SELECT MIN/MAX
+def _range_slider(label, table_name, column, cast):
+    lo, hi = column_bounds(table_name, column)
+    if pd.isna(lo) or pd.isna(hi) or lo == hi:
+        return None
+    lo, hi = cast(lo), cast(hi)
+    return st.slider(label, lo, hi, (lo, hi))
+
+# Substring filter plus autocomplete: picking a suggestion narrows to that exact player
+def _player_filter(table_name, player_search):
+    player_index = get_text_index(table_name, "player_name")
+    if player_index is None:
+        return {"player_search": player_search}
+    filters = {"player_search": player_search, "player_index": player_index}
+    suggestions = suggest_values(table_name, player_search)
+    if suggestions.empty:
+        return filters
+
+    fuzzy = (suggestions["match"] == "fuzzy").all()
+    first = "(no exact match)" if fuzzy else "(all matches)"
+    labels = {row.value: f"{row.value} ({row.rows:,} rows)" for row in suggestions.itertuples()}
+    choice = st.selectbox(
+        "Did you mean" if fuzzy else "Matching players",
+        [first] + list(labels),
+        format_func=lambda value: labels.get(value, value),
+    )
+    if choice != first:
+        return {"player_exact": choice}
+    return filters
+
+# Universal filter widgets backed by SQL metadata queries; returns a filter spec
+def render_universal_filters(table_name, range_columns=None):
+    columns = table_columns(table_name)
+    filters = {}
 
     # Season filter (if exists)
-    if "season" in df.columns:
-        seasons = sorted(df["season"].dropna().unique())
-        season_range = st.slider("Season Range", min(seasons), max(seasons), (min(seasons), max(seasons)))
-        filtered_df = filtered_df[filtered_df["season"].between(*season_range)]
+    if "season" in columns:
+        season_range = _range_slider("Season Range", table_name, "season", int)
+        if season_range is not None:
+            filters["season"] = season_range
 
-    # Player filter (if exists)
-    if "player_name" in df.columns:
+    # Player filter (if exists); served by the trigram index when the table has one
+    if "player_name" in columns:
         player_search = st.text_input("Search by Player Name")
         if player_search:
-            filtered_df = filtered_df[filtered_df["player_name"].str.contains(player_search, case=False, na=False)]
+            filters.update(_player_filter(table_name, player_search))
 
     # Position filter (if exists)
-    if "position" in df.columns:
-        positions = sorted(df["position"].dropna().unique())
+    if "position" in columns:
+        positions = distinct_values(table_name, "position")
         selected_positions = st.multiselect("Position Filter", positions, default=positions)
-        filtered_df = filtered_df[filtered_df["position"].isin(selected_positions)]
+        filters["positions"] = selected_positions
+        filters["all_positions"] = len(selected_positions) == len(positions)
+
+    # Extra numeric ranges requested by the page, as {column: slider label}
+    ranges = {}
+    for column, label in (range_columns or {}).items():
+        if column in columns:
+            value_range = _range_slider(label, table_name, column, float)
+            if value_range is not None:
+                ranges[column] = value_range
+    if ranges:
+        filters["ranges"] = ranges
+
+    return filters
 
+# SQL pushdown variant: only rows matching the filters are loaded into pandas
+@perf_utils.timed("apply_universal_filters_sql")
+def apply_universal_filters_sql(table_name, range_columns=None, columns=None):
+    filters = render_universal_filters(table_name, range_columns)
+    filtered_df = load_table(table_name, columns=columns, filters=filters)
     st.write(f"Filtered rows: {len(filtered_df)}")
-    return filtered_df
+    return filtered_df, filters
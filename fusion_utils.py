@@ -0,0 +1,371 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+import shared_utils
+from shared_utils import (
+    INTERNAL_PREFIX,
+    get_connection,
+    quote_table,
+    list_tables,
+    get_table_version,
+    mark_table_written,
+    staging_table_name,
+    swap_in_table,
+    drop_staging_table,
+    partition_condition,
+)
+from query_utils import table_columns
+from write_utils import write_slot
+
+BASE_TABLE = "player_stats"
+DEFAULT_TARGET = "unified_master_dataset"
+
+# Join steps in order. Each step tries its candidate key sets in priority order
+# and uses the first one whose columns exist on both sides.
+JOIN_STEPS = [
+    {"table": "injuries", "keys": [["player_id", "season", "week"]], "requires": []},
+    {"table": "games", "keys": [["game_id"], ["season", "week", "team"], ["season", "week"]], "requires": []},
+    {"table": "weather", "keys": [["game_id"]], "requires": ["games"]},
+    {"table": "stadiums", "keys": [["stadium_id"]], "requires": ["games"]},
+]
+
+# The unified table is maintained per (season, week) partition of the base table.
+# Partitioned sources are assumed to line up with the base rows of the same week.
+PARTITION_KEYS = ["season", "week"]
+
+# Fusion bookkeeping: plan signature, source versions and per-partition fingerprints
+STATE_TABLE = f"{INTERNAL_PREFIX}fusion_state"
+SOURCES_TABLE = f"{INTERNAL_PREFIX}fusion_sources"
+WATERMARKS_TABLE = f"{INTERNAL_PREFIX}fusion_watermarks"
+# Cardinality reports kept per (plan, source versions)
+CARDINALITY_CACHE_SIZE = 16
+
+_cardinality_cache = OrderedDict()
+_cardinality_lock = threading.Lock()
+
+# Indexes on the join keys used by the plan
+INDEX_KEYS = {
+    "player_stats": ["player_id", "season", "week"],
+    "injuries": ["player_id", "season", "week"],
+    "games": ["game_id"],
+    "weather": ["game_id"],
+    "stadiums": ["stadium_id"],
+}
+
+def _index_name(table, keys):
+    return quote_table(f"idx_datos_{table}_{'_'.join(keys)}")
+
+# Create any missing join-key indexes (a no-op once they exist)
+def ensure_join_indexes(plan, conn):
+    wanted = {plan["base"]: INDEX_KEYS.get(plan["base"])}
+    for step in plan["steps"]:
+        wanted[step["table"]] = step["keys"]
+    for table, keys in wanted.items():
+        if not keys or not set(keys) <= set(table_columns(table, conn)):
+            continue
+        cols = ", ".join(quote_table(k) for k in keys)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_index_name(table, keys)} ON {quote_table(table)} ({cols})")
+    conn.commit()
+
+# Work out which tables to join, on which keys, and the output column list
+def plan_fusion(conn, base=BASE_TABLE):
+    existing = set(list_tables(conn))
+    if base not in existing:
+        return None
+
+    # column name -> (alias, source column) for everything selected so far
+    selected = {col: ("t0", col) for col in table_columns(base, conn)}
+    steps = []
+    skipped = []
+    joined = {base}
+
+    for i, step in enumerate(JOIN_STEPS, start=1):
+        table = step["table"]
+        if table not in existing:
+            skipped.append((table, "table not found"))
+            continue
+        if not set(step["requires"]) <= joined:
+            skipped.append((table, f"requires {', '.join(step['requires'])}"))
+            continue
+
+        right_cols = table_columns(table, conn)
+        keys = next((k for k in step["keys"] if set(k) <= set(selected) and set(k) <= set(right_cols)), None)
+        if keys is None:
+            skipped.append((table, "no usable join keys"))
+            continue
+
+        alias = f"t{i}"
+        on = [(selected[k], k) for k in keys]
+        added = []
+        for col in right_cols:
+            if col in keys:
+                continue
+            out_col = col if col not in selected else f"{col}_{table}"
+            # The renamed column may itself be taken (e.g. a base column "week_games")
+            suffix = 2
+            while out_col in selected:
+                out_col = f"{col}_{table}_{suffix}"
+                suffix += 1
+            selected[out_col] = (alias, col)
+            added.append(out_col)
+
+        steps.append({"table": table, "alias": alias, "keys": keys, "on": on, "columns": added})
+        joined.add(table)
+
+    return {"base": base, "steps": steps, "skipped": skipped, "columns": selected}
+
+# SELECT statement for a plan; base_where filters the driving table (e.g. one partition)
+def build_fusion_sql(plan, base_where=""):
+    select_list = ", ".join(
+        f"{alias}.{quote_table(src)} AS {quote_table(out)}" for out, (alias, src) in plan["columns"].items()
+    )
+    sql = f"SELECT {select_list} FROM {quote_table(plan['base'])} AS t0"
+    for step in plan["steps"]:
+        conditions = " AND ".join(
+            f"{left_alias}.{quote_table(left_col)} = {step['alias']}.{quote_table(key)}"
+            for (left_alias, left_col), key in step["on"]
+        )
+        sql += f" LEFT JOIN {quote_table(step['table'])} AS {step['alias']} ON {conditions}"
+    if base_where:
+        sql += f" WHERE {base_where}"
+    return sql
+
+# Per-step fan-out check: how many right-side rows share one join key
+def estimate_cardinality(plan, conn):
+    base_rows = conn.execute(f"SELECT COUNT(*) FROM {quote_table(plan['base'])}").fetchone()[0]
+    report = []
+    estimate = base_rows
+    for step in plan["steps"]:
+        keys = ", ".join(quote_table(k) for k in step["keys"])
+        max_fanout = conn.execute(
+            f"SELECT COALESCE(MAX(n), 0) FROM (SELECT COUNT(*) AS n FROM {quote_table(step['table'])} GROUP BY {keys})"
+        ).fetchone()[0]
+
+        # Exact output multiplier when every key comes straight from the base table
+        multiplier = None
+        if all(alias == "t0" for (alias, _), _key in step["on"]):
+            join_on = " AND ".join(f"l.{quote_table(k)} = r.{quote_table(k)}" for k in step["keys"])
+            matched = conn.execute(
+                f"SELECT SUM(l.n * COALESCE(r.n, 1)) FROM "
+                f"(SELECT {keys}, COUNT(*) AS n FROM {quote_table(plan['base'])} GROUP BY {keys}) AS l "
+                f"LEFT JOIN (SELECT {keys}, COUNT(*) AS n FROM {quote_table(step['table'])} GROUP BY {keys}) AS r "
+                f"ON {join_on}"
+            ).fetchone()[0] or 0
+            multiplier = matched / base_rows if base_rows else 1.0
+        elif max_fanout > 1:
+            multiplier = float(max_fanout)
+
+        if multiplier is not None:
+            estimate = estimate * multiplier
+        report.append({
+            "table": step["table"],
+            "keys": step["keys"],
+            "max_rows_per_key": max_fanout,
+            "multiplier": multiplier,
+            "fan_out": max_fanout > 1,
+        })
+    return {"base_rows": base_rows, "estimated_rows": int(estimate), "steps": report}
+
+# estimate_cardinality, reused until the plan or a source table's version changes
+def cached_cardinality(plan, conn):
+    key = (
+        shared_utils.DB_FILE,
+        _plan_hash(plan),
+        tuple(get_table_version(t, conn) for t in _plan_sources(plan)),
+    )
+    with _cardinality_lock:
+        if key in _cardinality_cache:
+            _cardinality_cache.move_to_end(key)
+            return _cardinality_cache[key]
+    report = estimate_cardinality(plan, conn)
+    with _cardinality_lock:
+        _cardinality_cache[key] = report
+        while len(_cardinality_cache) > CARDINALITY_CACHE_SIZE:
+            _cardinality_cache.popitem(last=False)
+    return report
+
+# First few fused rows without materializing anything
+def preview_fusion(plan, conn, n=5):
+    return pd.read_sql(build_fusion_sql(plan) + f" LIMIT {int(n)}", conn)
+
+def _ensure_state_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} ("
+        "target TEXT PRIMARY KEY, plan_hash TEXT NOT NULL, target_version INTEGER, refreshed_at REAL NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SOURCES_TABLE} ("
+        "target TEXT NOT NULL, source_table TEXT NOT NULL, version INTEGER NOT NULL, "
+        "PRIMARY KEY (target, source_table))"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} ("
+        "target TEXT NOT NULL, source_table TEXT NOT NULL, season, week, fingerprint TEXT NOT NULL, "
+        "PRIMARY KEY (target, source_table, season, week))"
+    )
+
+def _plan_hash(plan):
+    return hashlib.sha1(build_fusion_sql(plan).encode("utf-8")).hexdigest()
+
+def _plan_sources(plan):
+    return [plan["base"]] + [step["table"] for step in plan["steps"]]
+
+def _is_partitioned(table, conn):
+    return set(PARTITION_KEYS) <= set(table_columns(table, conn))
+
+# Content fingerprint per (season, week), built inside SQLite: each row is
+# rendered with quote() (exact for reals, 1 and '1' differ), rows are sorted
+# within their partition so reordering a table leaves it unchanged, and
+# group_concat hands back one string per partition for a SHA-1. Any edit,
+# including same-length text changes or values swapped between rows, changes it.
+def partition_fingerprints(table, conn):
+    keys = [quote_table(k) for k in PARTITION_KEYS]
+    others = [quote_table(c) for c in table_columns(table, conn) if c not in PARTITION_KEYS]
+    row_text = " || ',' || ".join(f"quote({c})" for c in others) or "''"
+    cursor = conn.execute(
+        f"SELECT {keys[0]}, {keys[1]}, group_concat(row_text, char(10)) FROM ("
+        f"SELECT {keys[0]}, {keys[1]}, {row_text} AS row_text FROM {quote_table(table)} "
+        f"ORDER BY {keys[0]}, {keys[1]}, row_text"
+        f") GROUP BY {keys[0]}, {keys[1]}"
+    )
+    return {
+        (season, week): hashlib.sha1(rows.encode("utf-8")).hexdigest()
+        for season, week, rows in cursor
+    }
+
+def _stored_fingerprints(target, table, conn):
+    rows = conn.execute(
+        f"SELECT season, week, fingerprint FROM {WATERMARKS_TABLE} WHERE target = ? AND source_table = ?",
+        (target, table),
+    ).fetchall()
+    return {(season, week): fingerprint for season, week, fingerprint in rows}
+
+def _record_source(target, table, conn, fingerprints=None):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {SOURCES_TABLE} (target, source_table, version) VALUES (?, ?, ?)",
+        (target, table, get_table_version(table, conn)),
+    )
+    if fingerprints is not None:
+        conn.execute(f"DELETE FROM {WATERMARKS_TABLE} WHERE target = ? AND source_table = ?", (target, table))
+        conn.executemany(
+            f"INSERT INTO {WATERMARKS_TABLE} (target, source_table, season, week, fingerprint) VALUES (?, ?, ?, ?, ?)",
+            [(target, table, season, week, fp) for (season, week), fp in fingerprints.items()],
+        )
+
+def _record_state(plan, target, conn, fingerprints_by_source):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {STATE_TABLE} (target, plan_hash, refreshed_at) VALUES (?, ?, ?)",
+        (target, _plan_hash(plan), time.time()),
+    )
+    conn.execute(f"DELETE FROM {SOURCES_TABLE} WHERE target = ?", (target,))
+    conn.execute(f"DELETE FROM {WATERMARKS_TABLE} WHERE target = ?", (target,))
+    for table in _plan_sources(plan):
+        _record_source(target, table, conn, fingerprints_by_source.get(table))
+
+# The target's version after fusion wrote it; any other write (e.g. a page
+# saving over the fused table) changes it and forces a full rebuild
+def _record_target_version(target, version, conn):
+    conn.execute(f"UPDATE {STATE_TABLE} SET target_version = ? WHERE target = ?", (version, target))
+    conn.commit()
+
+def _ensure_partition_index(target, conn):
+    if set(PARTITION_KEYS) <= set(table_columns(target, conn)):
+        cols = ", ".join(quote_table(k) for k in PARTITION_KEYS)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_index_name(target, PARTITION_KEYS)} ON {quote_table(target)} ({cols})")
+
+# Materialize the fused table inside SQLite with CREATE TABLE AS into a
+# staging table, then swap it in so the previous version stays readable
+def run_fusion(plan, conn, target=DEFAULT_TARGET, on_wait=None):
+    with write_slot(f"fusion {target}", on_wait=on_wait):
+        ensure_join_indexes(plan, conn)
+        _ensure_state_tables(conn)
+        fingerprints = {t: partition_fingerprints(t, conn) for t in _plan_sources(plan) if _is_partitioned(t, conn)}
+        staging = staging_table_name(target)
+        try:
+            conn.execute(f"CREATE TABLE {quote_table(staging)} AS {build_fusion_sql(plan)}")
+            swap_in_table(staging, target, conn)
+        except BaseException:
+            drop_staging_table(staging, conn)
+            raise
+        _ensure_partition_index(target, conn)
+        _record_state(plan, target, conn, fingerprints)
+        conn.commit()
+        rows = conn.execute(f"SELECT COUNT(*) FROM {quote_table(target)}").fetchone()[0]
+        _record_target_version(target, mark_table_written(target, conn), conn)
+    return rows
+
+# Which (season, week) partitions changed since the last fusion, or None if a full rebuild is needed
+def changed_partitions(plan, conn, target=DEFAULT_TARGET):
+    _ensure_state_tables(conn)
+    if target not in list_tables(conn) or not set(PARTITION_KEYS) <= set(plan["columns"]):
+        return None
+    state = conn.execute(f"SELECT plan_hash, target_version FROM {STATE_TABLE} WHERE target = ?", (target,)).fetchone()
+    if state is None or state[0] != _plan_hash(plan) or state[1] != get_table_version(target, conn):
+        return None
+
+    stored_versions = dict(conn.execute(
+        f"SELECT source_table, version FROM {SOURCES_TABLE} WHERE target = ?", (target,)
+    ).fetchall())
+    changed = set()
+    fingerprints = {}
+    for table in _plan_sources(plan):
+        if stored_versions.get(table) == get_table_version(table, conn):
+            continue
+        if not _is_partitioned(table, conn):
+            # Un-partitioned sources (weather, stadiums) can touch any week
+            return None
+        current = partition_fingerprints(table, conn)
+        stored = _stored_fingerprints(target, table, conn)
+        changed |= {p for p in current.keys() | stored.keys() if current.get(p) != stored.get(p)}
+        fingerprints[table] = current
+    return {"partitions": sorted(changed, key=lambda p: tuple(str(v) for v in p)), "fingerprints": fingerprints}
+
+# Recompute only changed (season, week) partitions and swap them in within one transaction.
+# Falls back to a full rebuild when the plan or an un-partitioned source changed.
+# Runs in the write slot; on_wait(queue_position, waited_seconds) reports queueing.
+def refresh_fusion(plan, conn, target=DEFAULT_TARGET, on_wait=None):
+    with write_slot(f"fusion {target}", on_wait=on_wait):
+        return _refresh_fusion(plan, conn, target)
+
+def _refresh_fusion(plan, conn, target):
+    started = time.perf_counter()
+    delta = changed_partitions(plan, conn, target)
+    if delta is None:
+        rows = run_fusion(plan, conn, target)
+        return {"mode": "full", "partitions": None, "rows": rows, "seconds": time.perf_counter() - started}
+
+    partitions = delta["partitions"]
+    if partitions:
+        ensure_join_indexes(plan, conn)
+        _ensure_partition_index(plan["base"], conn)
+        conn.execute(f"DELETE FROM {quote_table(target)} WHERE {partition_condition(partitions, conn, target)}")
+        base_where = partition_condition(partitions, conn, plan["base"], "t0.")
+        conn.execute(f"INSERT INTO {quote_table(target)} {build_fusion_sql(plan, base_where)}")
+    for table in _plan_sources(plan):
+        if table in delta["fingerprints"]:
+            _record_source(target, table, conn, delta["fingerprints"][table])
+        else:
+            _record_source(target, table, conn)
+    conn.execute(f"UPDATE {STATE_TABLE} SET refreshed_at = ? WHERE target = ?", (time.time(), target))
+    conn.commit()
+    if partitions:
+        _record_target_version(target, mark_table_written(target, conn, partitions=partitions), conn)
+    rows = conn.execute(f"SELECT COUNT(*) FROM {quote_table(target)}").fetchone()[0]
+    return {"mode": "incremental", "partitions": partitions, "rows": rows, "seconds": time.perf_counter() - started}
+
+# Convenience wrapper used outside the page (own connection, default plan)
+def fuse_tables(target=DEFAULT_TARGET, incremental=True):
+    conn = get_connection()
+    try:
+        plan = plan_fusion(conn)
+        if plan is None:
+            raise ValueError(f"No primary '{BASE_TABLE}' table loaded — cannot generate master dataset.")
+        if incremental:
+            return refresh_fusion(plan, conn, target)
+        return {"mode": "full", "partitions": None, "rows": run_fusion(plan, conn, target)}
+    finally:
+        conn.close()
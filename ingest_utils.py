@@ -0,0 +1,214 @@
+import os
+import time
+
+import pandas as pd
+
+from shared_utils import (
+    get_connection, quote_table, mark_table_written, staging_table_name, swap_in_table, drop_staging_table,
+)
+from write_utils import write_slot
+
+# Upload formats accepted by the Home page uploader
+SUPPORTED_EXTENSIONS = ["csv", "xlsx", "json", "jsonl", "parquet"]
+
+DEFAULT_CHUNK_ROWS = 100_000
+INSERT_BATCH_ROWS = 10_000
+# Number of leading chunks used to infer the table schema
+SCHEMA_SAMPLE_CHUNKS = 2
+
+# Pragmas applied to the ingest connection (cache_size is in KiB when negative)
+BULK_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -262144,
+    "temp_store": "MEMORY",
+}
+
+def _extension(file_name):
+    return os.path.splitext(file_name)[1].lstrip(".").lower()
+
+def _excel_chunks(file, chunk_rows):
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) if h is not None else f"column_{i}" for i, h in enumerate(next(rows, []))]
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch or not header:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+def _parquet_chunks(file):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file)
+    if parquet_file.num_row_groups == 0:
+        # Still yield the header of an empty file
+        yield parquet_file.schema_arrow.empty_table().to_pandas()
+    # One row group at a time keeps peak memory at a single group
+    for i in range(parquet_file.num_row_groups):
+        yield parquet_file.read_row_group(i).to_pandas()
+
+# Stream an uploaded file as DataFrame chunks based on its extension
+def read_upload_chunks(file, file_name, chunk_rows=DEFAULT_CHUNK_ROWS):
+    ext = _extension(file_name)
+    if ext == "csv":
+        yield from pd.read_csv(file, chunksize=chunk_rows)
+    elif ext == "xlsx":
+        yield from _excel_chunks(file, chunk_rows)
+    elif ext == "jsonl":
+        yield from pd.read_json(file, lines=True, chunksize=chunk_rows)
+    elif ext == "json":
+        # Plain JSON documents cannot be parsed incrementally; slice after loading
+        df = pd.read_json(file)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    elif ext == "parquet":
+        yield from _parquet_chunks(file)
+    else:
+        raise ValueError(f"Unsupported file type: .{ext}")
+
+# Small preview of an upload without reading all of it
+def preview_upload(file, file_name, n=5):
+    ext = _extension(file_name)
+    if ext == "csv":
+        df = pd.read_csv(file, nrows=n)
+    elif ext == "xlsx":
+        df = pd.read_excel(file, nrows=n)
+    elif ext == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(file)
+        batch = next(parquet_file.iter_batches(batch_size=n), None)
+        df = (batch if batch is not None else parquet_file.schema_arrow.empty_table()).to_pandas()
+    else:
+        df = next(read_upload_chunks(file, file_name, chunk_rows=n), pd.DataFrame())
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return df.head(n)
+
+def _sqlite_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+# Column -> SQLite type from the first chunks; mixed numeric/text widens to TEXT
+def infer_sqlite_schema(chunks):
+    schema = {}
+    for chunk in chunks:
+        for column, dtype in chunk.dtypes.items():
+            sql_type = _sqlite_type(dtype)
+            # All-null columns carry no type information
+            if chunk[column].isna().all():
+                schema.setdefault(column, None)
+                continue
+            current = schema.get(column)
+            if current is None or current == sql_type:
+                schema[column] = sql_type
+            elif {current, sql_type} == {"INTEGER", "REAL"}:
+                schema[column] = "REAL"
+            else:
+                schema[column] = "TEXT"
+    return {column: sql_type or "TEXT" for column, sql_type in schema.items()}
+
+# Align a chunk to the fixed schema and convert it to DB-API rows
+def _chunk_rows(chunk, schema):
+    chunk = chunk.reindex(columns=list(schema))
+    for column, sql_type in schema.items():
+        series = chunk[column]
+        if sql_type == "TEXT" and pd.api.types.is_datetime64_any_dtype(series):
+            chunk[column] = series.astype(str).where(series.notna(), None)
+    chunk = chunk.astype(object).where(chunk.notna(), None)
+    return chunk.itertuples(index=False, name=None)
+
+def apply_bulk_pragmas(conn):
+    for pragma, value in BULK_PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma}={value}")
+
+# Stream an upload into a staging table (one transaction per chunk, batched
+# executemany inserts), then swap it in for table_name. The live table stays
+# readable throughout and other writers get the lock between chunks.
+# progress(rows_written, elapsed_seconds, fraction_or_None) is called per chunk;
+# on_wait(queue_position, waited_seconds) while queued behind other writes.
+def ingest_file(file, file_name, table_name, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None, on_wait=None):
+    started = time.perf_counter()
+    total_bytes = getattr(file, "size", None)
+    chunks = read_upload_chunks(file, file_name, chunk_rows)
+
+    sample = []
+    for chunk in chunks:
+        sample.append(chunk)
+        if len(sample) >= SCHEMA_SAMPLE_CHUNKS:
+            break
+    schema = infer_sqlite_schema(sample)
+    if not schema:
+        raise ValueError("Uploaded file has no columns.")
+    source_dtypes = sample[0].dtypes
+
+    conn = get_connection()
+    conn.isolation_level = None
+    rows_written = 0
+    try:
+        with write_slot(f"ingest {table_name}", on_wait=on_wait):
+            apply_bulk_pragmas(conn)
+            staging = staging_table_name(table_name)
+            column_sql = ", ".join(f"{quote_table(c)} {t}" for c, t in schema.items())
+            insert_sql = f"INSERT INTO {quote_table(staging)} VALUES ({', '.join('?' for _ in schema)})"
+
+            def write(chunk):
+                nonlocal rows_written, insert_sql
+                # Columns first seen after the sample (e.g. new keys in later JSON
+                # lines) are added to the staging table; earlier rows get NULL
+                added = infer_sqlite_schema([chunk[[c for c in chunk.columns if c not in schema]]])
+                for column, sql_type in added.items():
+                    conn.execute(f"ALTER TABLE {quote_table(staging)} ADD COLUMN {quote_table(column)} {sql_type}")
+                    schema[column] = sql_type
+                if added:
+                    insert_sql = f"INSERT INTO {quote_table(staging)} VALUES ({', '.join('?' for _ in schema)})"
+                rows = _chunk_rows(chunk, schema)
+                conn.execute("BEGIN IMMEDIATE")
+                while True:
+                    batch = [row for _, row in zip(range(INSERT_BATCH_ROWS), rows)]
+                    if not batch:
+                        break
+                    conn.executemany(insert_sql, batch)
+                    rows_written += len(batch)
+                conn.execute("COMMIT")
+                if progress is not None:
+                    fraction = None
+                    if total_bytes and hasattr(file, "tell"):
+                        fraction = min(file.tell() / total_bytes, 1.0)
+                    progress(rows_written, time.perf_counter() - started, fraction)
+
+            try:
+                conn.execute(f"CREATE TABLE {quote_table(staging)} ({column_sql})")
+                for chunk in sample:
+                    write(chunk)
+                del sample
+                for chunk in chunks:
+                    write(chunk)
+                swap_in_table(staging, table_name, conn)
+            except BaseException:
+                drop_staging_table(staging, conn)
+                raise
+            mark_table_written(table_name, conn, source_dtypes=source_dtypes)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "table": table_name,
+        "rows": rows_written,
+        "columns": len(schema),
+        "seconds": elapsed,
+        "rows_per_sec": rows_written / elapsed if elapsed > 0 else float("inf"),
+    }
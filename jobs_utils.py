@@ -0,0 +1,399 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import shared_utils
+from shared_utils import INTERNAL_PREFIX, get_connection
+
+JOBS_TABLE = f"{INTERNAL_PREFIX}jobs"
+JOBS_DIR = os.path.join("models", "jobs")
+
+# Pool size and default cores per job (override with DATOS_JOB_WORKERS / DATOS_JOB_CORES)
+JOB_WORKERS = int(os.environ.get("DATOS_JOB_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+JOB_CORES = int(os.environ.get("DATOS_JOB_CORES", max(1, (os.cpu_count() or 1) // JOB_WORKERS)))
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+
+# Every server process refreshes the heartbeat of the jobs it owns (its pool runs
+# them); an active job is orphaned once its owner process is gone or its heartbeat
+# is older than JOB_STALE_SECONDS (override with DATOS_JOB_STALE_SECONDS)
+HEARTBEAT_SECONDS = 15
+JOB_STALE_SECONDS = float(os.environ.get("DATOS_JOB_STALE_SECONDS", "300"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_heartbeat = None
+
+def _ensure_jobs_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {JOBS_TABLE} ("
+        "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, "
+        "message TEXT, params TEXT, result TEXT, artifact TEXT, "
+        "submitted_at REAL, started_at REAL, finished_at REAL, pid INTEGER, "
+        "owner_host TEXT, owner_pid INTEGER, heartbeat_at REAL)"
+    )
+    conn.commit()
+
+def _update_job(job_id, conn=None, **fields):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn.execute(f"UPDATE {JOBS_TABLE} SET {assignments} WHERE job_id = ?", list(fields.values()) + [job_id])
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+def _job_status(job_id, conn):
+    row = conn.execute(f"SELECT status FROM {JOBS_TABLE} WHERE job_id = ?", (job_id,)).fetchone()
+    return row[0] if row else None
+
+def _pid_alive(pid):
+    # os.kill(pid, 0) would terminate the process on Windows; rely on the heartbeat there
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# An active job can't finish once the server process that owns it is gone
+def _is_orphaned(owner_host, owner_pid, heartbeat_at, now):
+    if owner_pid is None or heartbeat_at is None or now - heartbeat_at > JOB_STALE_SECONDS:
+        return True
+    return owner_host == socket.gethostname() and not _pid_alive(owner_pid)
+
+# Fail active jobs whose owner died; jobs owned by live server processes are left alone
+def _fail_orphaned_jobs(conn):
+    now = time.time()
+    rows = conn.execute(
+        f"SELECT job_id, owner_host, owner_pid, heartbeat_at FROM {JOBS_TABLE} "
+        f"WHERE status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+        ACTIVE_STATUSES,
+    ).fetchall()
+    orphaned = [job_id for job_id, host, pid, beat in rows if _is_orphaned(host, pid, beat, now)]
+    if orphaned:
+        conn.executemany(
+            f"UPDATE {JOBS_TABLE} SET status = 'failed', message = 'Interrupted by server restart', "
+            f"finished_at = ? WHERE job_id = ? AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+            [(now, job_id, *ACTIVE_STATUSES) for job_id in orphaned],
+        )
+        conn.commit()
+    return orphaned
+
+# Background thread: keep this process's jobs alive and sweep up orphans of dead peers
+def _heartbeat_loop(db_file):
+    while True:
+        try:
+            conn = sqlite3.connect(db_file, timeout=shared_utils.BUSY_TIMEOUT_SECONDS)
+            try:
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET heartbeat_at = ? WHERE owner_host = ? AND owner_pid = ? "
+                    f"AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                    (time.time(), socket.gethostname(), os.getpid(), *ACTIVE_STATUSES),
+                )
+                conn.commit()
+                _fail_orphaned_jobs(conn)
+            finally:
+                conn.close()
+        except sqlite3.OperationalError:
+            # Database busy with a long write; try again next beat
+            pass
+        time.sleep(HEARTBEAT_SECONDS)
+
+# Shared process pool for the whole server process (all sessions)
+def get_job_pool():
+    global _pool, _heartbeat
+    with _pool_lock:
+        if _pool is None:
+            conn = get_connection()
+            try:
+                _ensure_jobs_table(conn)
+                _fail_orphaned_jobs(conn)
+            finally:
+                conn.close()
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+            _heartbeat = threading.Thread(
+                target=_heartbeat_loop, args=(shared_utils.DB_FILE,), name="datos-job-heartbeat", daemon=True
+            )
+            _heartbeat.start()
+        return _pool
+
+# Claim a queued job atomically so a concurrent cancel can't be overwritten
+def _claim_job(job_id, conn):
+    claimed = conn.execute(
+        f"UPDATE {JOBS_TABLE} SET status = 'running', started_at = ?, pid = ?, message = 'Loading data' "
+        "WHERE job_id = ? AND status = 'queued'",
+        (time.time(), os.getpid(), job_id),
+    ).rowcount
+    conn.commit()
+    return bool(claimed)
+
+# Artifact entry for the feature-store features a job trained on (None if none)
+def _feature_store(params, conn):
+    from feature_store_utils import feature_definitions
+
+    if not params.get("store_features"):
+        return None
+    features = list(params["store_features"])
+    return {"table": params["table"], "features": features,
+            "definitions": feature_definitions(params["table"], features, conn)}
+
+# Worker: load the rows itself, train in rounds, persist progress and results
+def _run_training_job(db_file, job_id, params):
+    shared_utils.DB_FILE = db_file
+    # Workers are long-lived; don't let them accumulate cached tables
+    shared_utils.set_cache_budget(0)
+    from training_utils import load_training_frame, prepare_xy, train_random_forest
+    from registry_utils import register_model
+
+    conn = get_connection()
+    try:
+        if not _claim_job(job_id, conn):
+            return
+
+        df = load_training_frame(
+            params["table"], params["feature_cols"], params["target_col"], params.get("filters"), conn=conn,
+            store_features=params.get("store_features", ()),
+        )
+        X, y = prepare_xy(df, params["feature_cols"], params["target_col"])
+        _update_job(job_id, conn, message=f"Training on {len(df):,} rows")
+
+        def on_round(fraction):
+            _update_job(job_id, conn, progress=fraction * 0.95)
+            return _job_status(job_id, conn) != "cancelling"
+
+        trained = train_random_forest(
+            X, y,
+            test_size=params["test_size"],
+            n_estimators=params["n_estimators"],
+            max_depth=params["max_depth"],
+            n_jobs=params.get("cores", JOB_CORES),
+            on_round=on_round,
+        )
+        if trained is None:
+            _update_job(job_id, conn, status="cancelled", message="Cancelled", finished_at=time.time())
+            return
+        model, metrics, predictions = trained
+
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        predictions_file = os.path.join(JOBS_DIR, f"{job_id}_predictions.parquet")
+        predictions.to_parquet(predictions_file, index=False)
+        registry_name = params.get("registry_name") or f"{params['table']}_fantasy_predictor"
+        version, artifact = register_model(
+            model, registry_name,
+            params["feature_cols"], params["target_col"], source_table=params["table"],
+            feature_store=_feature_store(params, conn),
+            metrics=metrics, params={"n_estimators": params["n_estimators"], "max_depth": params["max_depth"]},
+            conn=conn,
+        )
+
+        result = {**metrics, "predictions_file": predictions_file, "registry_name": registry_name, "model_version": version}
+        _update_job(
+            job_id, conn, status="done", progress=1.0, message="Finished",
+            result=json.dumps(result), artifact=artifact, finished_at=time.time(),
+        )
+    except Exception as exc:
+        _update_job(job_id, conn, status="failed", message=f"{type(exc).__name__}: {exc}", finished_at=time.time())
+        raise
+    finally:
+        conn.close()
+
+# Worker: hyperparameter search. The feature matrix is written once to a .npy
+# file and memory-mapped, so CV workers share its pages instead of each
+# receiving a pickled copy.
+def _run_search_job(db_file, job_id, params):
+    shared_utils.DB_FILE = db_file
+    shared_utils.set_cache_budget(0)
+    from training_utils import load_training_frame, prepare_xy, search_hyperparameters
+    from registry_utils import register_model
+    import numpy as np
+
+    conn = get_connection()
+    matrix_file = os.path.join(JOBS_DIR, f"{job_id}_X.npy")
+    try:
+        if not _claim_job(job_id, conn):
+            return
+
+        season_cv = params["cv"] == "season"
+        df = load_training_frame(
+            params["table"], params["feature_cols"], params["target_col"], params.get("filters"),
+            extra_columns=["season"] if season_cv else (), conn=conn,
+            store_features=params.get("store_features", ()),
+        )
+        X, y = prepare_xy(df, params["feature_cols"], params["target_col"])
+        seasons = df["season"].to_numpy() if season_cv else None
+        os.makedirs(JOBS_DIR, exist_ok=True)
+        np.save(matrix_file, X.to_numpy(dtype=np.float64))
+        X_shared = np.load(matrix_file, mmap_mode="r")
+        del df, X
+        _update_job(job_id, conn, progress=0.05, message=f"Searching {params['model_name']} on {len(y):,} rows")
+
+        model, metrics, leaderboard = search_hyperparameters(
+            X_shared, y.to_numpy(),
+            model_name=params["model_name"],
+            strategy=params["strategy"],
+            cv=params["cv"],
+            folds=params["folds"],
+            seasons=seasons,
+            n_candidates=params["n_candidates"],
+            factor=params["factor"],
+            n_jobs=params.get("cores", JOB_CORES),
+            feature_names=params["feature_cols"],
+        )
+        # A search can't be interrupted mid-round; a late cancel just discards the result
+        if _job_status(job_id, conn) == "cancelling":
+            _update_job(job_id, conn, status="cancelled", message="Cancelled", finished_at=time.time())
+            return
+
+        registry_name = params.get("registry_name") or f"{params['table']}_fantasy_predictor"
+        version, artifact = register_model(
+            model, registry_name,
+            params["feature_cols"], params["target_col"], source_table=params["table"],
+            feature_store=_feature_store(params, conn),
+            metrics={"rmse": metrics["rmse"], "cv": metrics["cv"], "folds": metrics["folds"]},
+            params=metrics["best_params"], conn=conn,
+        )
+        leaderboard_file = os.path.splitext(artifact)[0] + "_leaderboard.csv"
+        leaderboard.to_csv(leaderboard_file, index=False)
+
+        result = {**metrics, "leaderboard_file": leaderboard_file, "registry_name": registry_name, "model_version": version}
+        _update_job(
+            job_id, conn, status="done", progress=1.0, message="Finished",
+            result=json.dumps(result, default=str), artifact=artifact, finished_at=time.time(),
+        )
+    except Exception as exc:
+        _update_job(job_id, conn, status="failed", message=f"{type(exc).__name__}: {exc}", finished_at=time.time())
+        raise
+    finally:
+        conn.close()
+        if os.path.exists(matrix_file):
+            os.remove(matrix_file)
+
+def _submit(kind, runner, params):
+    job_id = uuid.uuid4().hex[:12]
+    pool = get_job_pool()
+    conn = get_connection()
+    try:
+        _ensure_jobs_table(conn)
+        now = time.time()
+        conn.execute(
+            f"INSERT INTO {JOBS_TABLE} (job_id, kind, status, progress, message, params, submitted_at, "
+            "owner_host, owner_pid, heartbeat_at) VALUES (?, ?, 'queued', 0, 'Waiting for a worker', ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params, default=list), now, socket.gethostname(), os.getpid(), now),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    future = pool.submit(runner, shared_utils.DB_FILE, job_id, params)
+    future.add_done_callback(lambda f: _fail_if_lost(job_id, f))
+    return job_id
+
+# A worker that died without recording an outcome (e.g. killed) leaves the job failed, not running
+def _fail_if_lost(job_id, future):
+    if future.cancelled() or future.exception() is None:
+        return
+    conn = get_connection()
+    try:
+        conn.execute(
+            f"UPDATE {JOBS_TABLE} SET status = 'failed', message = ?, finished_at = ? "
+            f"WHERE job_id = ? AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+            (f"Worker lost: {type(future.exception()).__name__}", time.time(), job_id, *ACTIVE_STATUSES),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+# Queue a RandomForest training job; returns its id immediately
+def submit_training_job(table, feature_cols, target_col, filters=None, test_size=0.2,
+                        n_estimators=200, max_depth=10, cores=None, registry_name=None, store_features=()):
+    return _submit("train", _run_training_job, {
+        "table": table,
+        "feature_cols": list(feature_cols),
+        "target_col": target_col,
+        "filters": filters or {},
+        "test_size": test_size,
+        "n_estimators": int(n_estimators),
+        "max_depth": int(max_depth),
+        "cores": int(cores or JOB_CORES),
+        "registry_name": registry_name,
+        "store_features": list(store_features),
+    })
+
+# Queue a successive-halving hyperparameter search; returns its id immediately
+def submit_search_job(table, feature_cols, target_col, filters=None, model_name="random_forest",
+                      strategy="random", cv="kfold", folds=5, n_candidates=20, factor=3,
+                      cores=None, registry_name=None, store_features=()):
+    return _submit("search", _run_search_job, {
+        "table": table,
+        "feature_cols": list(feature_cols),
+        "target_col": target_col,
+        "filters": filters or {},
+        "model_name": model_name,
+        "strategy": strategy,
+        "cv": cv,
+        "folds": int(folds),
+        "n_candidates": int(n_candidates),
+        "factor": int(factor),
+        "cores": int(cores or JOB_CORES),
+        "registry_name": registry_name,
+        "store_features": list(store_features),
+    })
+
+# Ask a job to stop; queued jobs never start, running ones stop at the next round
+def cancel_job(job_id):
+    conn = get_connection()
+    try:
+        _ensure_jobs_table(conn)
+        conn.execute(
+            f"UPDATE {JOBS_TABLE} SET status = CASE status WHEN 'queued' THEN 'cancelled' ELSE 'cancelling' END, "
+            "message = 'Cancellation requested', finished_at = CASE status WHEN 'queued' THEN ? ELSE finished_at END "
+            "WHERE job_id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def _decode(job):
+    job["params"] = json.loads(job["params"]) if job.get("params") else {}
+    job["result"] = json.loads(job["result"]) if job.get("result") else None
+    return job
+
+# One job as a dict (params/result decoded)
+def get_job(job_id):
+    conn = get_connection()
+    try:
+        _ensure_jobs_table(conn)
+        cursor = conn.execute(f"SELECT * FROM {JOBS_TABLE} WHERE job_id = ?", (job_id,))
+        row = cursor.fetchone()
+        names = [d[0] for d in cursor.description]
+    finally:
+        conn.close()
+    return _decode(dict(zip(names, row))) if row else None
+
+# Most recent jobs, optionally for one table
+def list_jobs(table=None, limit=20):
+    conn = get_connection()
+    try:
+        _ensure_jobs_table(conn)
+        cursor = conn.execute(
+            f"SELECT * FROM {JOBS_TABLE} ORDER BY submitted_at DESC LIMIT ?", (limit * 5 if table else limit,)
+        )
+        names = [d[0] for d in cursor.description]
+        jobs = [_decode(dict(zip(names, row))) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    if table is not None:
+        jobs = [job for job in jobs if job["params"].get("table") == table]
+    return jobs[:limit]
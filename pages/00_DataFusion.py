@@ -1,6 +1,11 @@
 import streamlit as st
 import pandas as pd
 from shared_utils import get_connection
+from query_utils import count_rows
+from fusion_utils import BASE_TABLE, DEFAULT_TARGET, JOIN_STEPS, plan_fusion, cached_cardinality, preview_fusion, run_fusion, refresh_fusion
+from ui_utils import start_page_trace, render_diagnostics_panel, queue_wait_reporter
+
+start_page_trace("Data Fusion")
 
 st.header("🔗 Universal Data Fusion Engine 4.0")
 
@@ -9,68 +14,73 @@ This module dynamically merges all uploaded tables into a single enriched datase
 
 - Automatically detects which tables exist in your database.
 - Merges on common keys: player_id, week, season, game_id, stadium_id.
-- Produces a fully enriched master dataset.
+- Runs the joins inside SQLite on indexed keys, so the merged dataset never has to fit in memory.
+- Refreshes only the (season, week) partitions whose source rows changed.
 """)
 
 # Connect to DB
 conn = get_connection()
-existing_tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)["name"].tolist()
-
-# Dynamically load any existing tables
-dfs = {}
+plan = plan_fusion(conn)
 
-for table in ["player_stats", "injuries", "weather", "stadiums", "games"]:
-    if table in existing_tables:
-        dfs[table] = pd.read_sql(f"SELECT * FROM {table}", conn)
-        st.write(f"✅ Loaded table: {table} ({len(dfs[table])} rows)")
+# Report which source tables will take part
+for table in [BASE_TABLE] + [step["table"] for step in JOIN_STEPS]:
+    planned = plan is not None and (table == BASE_TABLE or any(s["table"] == table for s in plan["steps"]))
+    if planned:
+        st.write(f"✅ Found table: {table} ({count_rows(table, conn=conn)} rows)")
     else:
-        st.write(f"⚠️ Table not found: {table}")
-
-# Begin dynamic joins
-df_final = None
-
-if "player_stats" in dfs:
-    df_final = dfs["player_stats"]
-
-    if "injuries" in dfs:
-        df_final = df_final.merge(
-            dfs["injuries"],
-            on=["player_id", "season", "week"],
-            how="left"
-        )
-
-    if "games" in dfs:
-        df_final = df_final.merge(
-            dfs["games"],
-            on=["season", "week"],
-            how="left"
-        )
-
-    if "weather" in dfs and "games" in dfs:
-        df_final = df_final.merge(
-            dfs["weather"],
-            on=["game_id"],
-            how="left"
-        )
-
-    if "stadiums" in dfs and "games" in dfs:
-        df_final = df_final.merge(
-            dfs["stadiums"],
-            on=["stadium_id"],
-            how="left"
-        )
-
-if df_final is not None:
-    st.success(f"✅ Merged final dataset: {len(df_final)} rows")
-    st.dataframe(df_final.head())
+        reason = dict(plan["skipped"]).get(table, "table not found") if plan else "table not found"
+        st.write(f"⚠️ Skipping table: {table} ({reason})")
+
+if plan is not None:
+    st.subheader("Join Plan")
+    # Join-key indexes are created by the fusion itself (inside the write slot);
+    # the cardinality check is cached until a source table is rewritten
+    cardinality = cached_cardinality(plan, conn)
+    st.dataframe(pd.DataFrame([
+        {
+            "table": step["table"],
+            "join keys": ", ".join(step["keys"]),
+            "max rows per key": step["max_rows_per_key"],
+            "row multiplier": round(step["multiplier"], 3) if step["multiplier"] is not None else None,
+        }
+        for step in cardinality["steps"]
+    ]))
+
+    for step in cardinality["steps"]:
+        if step["fan_out"]:
+            st.warning(
+                f"⚠️ Join with '{step['table']}' on {step['keys']} is one-to-many "
+                f"(up to {step['max_rows_per_key']} rows per key) and will multiply rows."
+            )
+
+    st.success(
+        f"✅ Planned unified dataset: ~{cardinality['estimated_rows']} rows "
+        f"from {cardinality['base_rows']} {BASE_TABLE} rows"
+    )
+    st.dataframe(preview_fusion(plan, conn))
 
     # Optionally save to DB as master table
-    save_name = st.text_input("Save unified dataset as table name:", value="unified_master_dataset")
+    save_name = st.text_input("Save unified dataset as table name:", value=DEFAULT_TARGET)
     if st.button("💾 Save Unified Table"):
-        df_final.to_sql(save_name, conn, if_exists="replace", index=False)
-        st.success(f"✅ Saved unified dataset as '{save_name}'")
+        with st.spinner("Running fusion inside SQLite..."):
+            rows = run_fusion(plan, conn, save_name, on_wait=queue_wait_reporter(st.empty()))
+        st.success(f"✅ Saved unified dataset as '{save_name}' ({rows} rows)")
+
+    # Incremental refresh: only recompute (season, week) partitions whose sources changed
+    if st.button("🔄 Refresh Changed Weeks"):
+        with st.spinner("Refreshing changed partitions..."):
+            result = refresh_fusion(plan, conn, save_name, on_wait=queue_wait_reporter(st.empty()))
+        if result["mode"] == "full":
+            st.info(f"Plan or un-partitioned source changed — rebuilt '{save_name}' in full ({result['rows']} rows).")
+        elif result["partitions"]:
+            weeks = ", ".join(f"{season} wk {week}" for season, week in result["partitions"])
+            st.success(f"✅ Refreshed {len(result['partitions'])} partition(s) in {result['seconds']:.1f}s: {weeks}")
+        else:
+            st.success(f"✅ '{save_name}' is already up to date.")
 
 else:
     st.warning("No primary 'player_stats' table loaded — cannot generate master dataset.")
 
 conn.close()
+
+render_diagnostics_panel()
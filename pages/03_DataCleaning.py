@@ -1,9 +1,9 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from shared_utils import get_connection, quote_table
-from ui_utils import render_page_header, render_instructions_block
-from filter_utils import apply_universal_filters
+from shared_utils import list_tables, load_table
+from ui_utils import render_page_header, render_instructions_block, render_data_grid, render_frame_grid, render_diagnostics_panel, save_table_with_progress, queue_wait_reporter
+from filter_utils import render_universal_filters
+from query_utils import count_rows
+from cleaning_utils import OUTLIER_METHODS, DEFAULT_THRESHOLDS, IN_MEMORY_MAX_ROWS, clean_frame, clean_table_chunked
 
 render_page_header("Data Cleaner PRO v4", "🧹 Filter + Clean your fantasy datasets")
 
@@ -14,48 +14,74 @@ render_instructions_block("""
 """)
 
 # Load tables
-conn = get_connection()
-tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)
-conn.close()
+tables = list_tables()
 
-selected_table = st.selectbox("Select table to clean", tables["name"].tolist() if not tables.empty else ["No tables found"])
+selected_table = st.selectbox("Select table to clean", tables if tables else ["No tables found"])
 
 if selected_table != "No tables found":
-    conn = get_connection()
-    df = pd.read_sql(f"SELECT * FROM {quote_table(selected_table)}", conn)
-    conn.close()
-
-    st.write(f"Total rows: {len(df)}")
-    st.dataframe(df.head())
+    total_rows = count_rows(selected_table)
+    st.write(f"Total rows: {total_rows}")
+    st.dataframe(load_table(selected_table, limit=5))
 
     st.header("Apply Universal Filters")
-    df_filtered = apply_universal_filters(df)
-    st.dataframe(df_filtered)
+    # Only the filter spec here; rows are loaded into pandas by the in-memory path alone
+    filters = render_universal_filters(selected_table)
+    render_data_grid(selected_table, filters, key="clean_input")
 
     st.header("Cleaning Options")
     drop_na = st.checkbox("Drop rows with missing values?")
-    remove_outliers = st.checkbox("Remove numeric outliers? (Z-score > 3)")
+    remove_outliers = st.checkbox("Remove numeric outliers?")
 
-    df_clean = df_filtered.copy()
+    method = "zscore"
+    threshold = None
+    sequential = False
+    if remove_outliers:
+        method = st.selectbox(
+            "Outlier method", OUTLIER_METHODS,
+            format_func={"zscore": "Z-score", "iqr": "IQR fences", "mad": "Median absolute deviation"}.get,
+        )
+        threshold = st.number_input("Threshold", min_value=0.5, max_value=10.0, value=DEFAULT_THRESHOLDS[method], step=0.5)
+        if method == "zscore":
+            sequential = st.checkbox("Sequential mode (legacy: re-score each column on the shrinking table)")
 
-    if drop_na:
-        df_clean = df_clean.dropna()
+    modes = ["In memory (preview before saving)", "Chunked (large tables)"]
+    mode = st.radio("Cleaning mode", modes, index=int(total_rows > IN_MEMORY_MAX_ROWS), horizontal=True)
+    new_table_name = st.text_input("Save cleaned table as:")
 
-    if remove_outliers:
-        numeric_cols = df_clean.select_dtypes(include=["number"]).columns
-        for col in numeric_cols:
-            z_scores = np.abs((df_clean[col] - df_clean[col].mean()) / df_clean[col].std())
-            df_clean = df_clean[z_scores < 3]
+    if mode == modes[0]:
+        df_filtered = load_table(selected_table, filters=filters)
+        st.write(f"Filtered rows: {len(df_filtered)}")
 
-    st.write(f"Remaining rows after full cleaning: {len(df_clean)}")
-    st.dataframe(df_clean)
+        # One vectorized pass over all numeric columns and a single combined mask
+        df_clean = clean_frame(df_filtered, drop_na, remove_outliers, method, threshold, sequential)
 
-    new_table_name = st.text_input("Save cleaned table as:")
-    if st.button("💾 Save Cleaned Table"):
-        if new_table_name:
-            conn = get_connection()
-            df_clean.to_sql(new_table_name, conn, if_exists="replace", index=False)
-            conn.close()
-            st.success(f"✅ Cleaned table saved as '{new_table_name}'")
-        else:
-            st.warning("Enter table name before saving.")
+        st.write(f"Remaining rows after full cleaning: {len(df_clean)}")
+        render_frame_grid(df_clean, key="cleaned")
+
+        if st.button("💾 Save Cleaned Table"):
+            if new_table_name:
+                if save_table_with_progress(df_clean, new_table_name):
+                    st.success(f"✅ Cleaned table saved as '{new_table_name}'")
+            else:
+                st.warning("Enter table name before saving.")
+    else:
+        # Out-of-core path for tables that don't fit in memory
+        st.caption("Computes statistics inside SQLite, then streams the table in chunks straight into the new table.")
+        if st.button("🧹 Clean in Chunks and Save"):
+            if not new_table_name:
+                st.warning("Enter table name before saving.")
+            elif sequential:
+                st.warning("Sequential mode needs the whole table in memory; use the in-memory mode instead.")
+            else:
+                status = st.empty()
+
+                def report(rows_read, rows_kept, elapsed):
+                    status.write(f"Read {rows_read:,} rows, kept {rows_kept:,} ({elapsed:.1f}s)")
+
+                result = clean_table_chunked(
+                    selected_table, new_table_name, filters, drop_na, remove_outliers, method, threshold, progress=report,
+                    on_wait=queue_wait_reporter(status),
+                )
+                st.success(f"✅ Cleaned table saved as '{new_table_name}' ({result['rows_kept']:,} of {result['rows_read']:,} rows)")
+
+render_diagnostics_panel()
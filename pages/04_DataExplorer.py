@@ -1,10 +1,12 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
 import plotly.express as px
-from shared_utils import get_connection, quote_table
-from ui_utils import render_page_header, render_instructions_block
-from filter_utils import apply_universal_filters
+import perf_utils
+from shared_utils import list_tables, load_table
+from ui_utils import render_page_header, render_instructions_block, render_data_grid, render_diagnostics_panel, save_table_with_progress
+from filter_utils import render_universal_filters
+from query_utils import table_columns, build_where_clause, count_rows
+from catalog_utils import low_cardinality_columns, numeric_columns
+from aggregate_utils import AGG_FUNCS, aggregate
 
 render_page_header("Data Explorer PRO v4", "Explore, aggregate & visualize datasets")
 
@@ -15,30 +17,29 @@ render_instructions_block("""
 """)
 
 # Load tables
-conn = get_connection()
-tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)
-conn.close()
+tables = list_tables()
 
-selected_table = st.selectbox("Select table to explore", tables["name"].tolist() if not tables.empty else ["No tables found"])
+selected_table = st.selectbox("Select table to explore", tables if tables else ["No tables found"])
 
 if selected_table != "No tables found":
-    conn = get_connection()
-    df = pd.read_sql(f"SELECT * FROM {quote_table(selected_table)}", conn)
-    conn.close()
-
-    st.write(f"Total rows: {len(df)}")
-    st.dataframe(df.head())
+    st.write(f"Total rows: {count_rows(selected_table)}")
+    st.dataframe(load_table(selected_table, limit=5))
 
     st.header("Apply Filters")
-    df_filtered = apply_universal_filters(df)
-    st.dataframe(df_filtered)
+    # Only the filter spec is needed: rows are paged by the grid and grouped in SQLite
+    filters = render_universal_filters(selected_table)
+    where, params = build_where_clause(filters)
+    st.write(f"Filtered rows: {count_rows(selected_table, where, params)}")
+    render_data_grid(selected_table, filters, key="explore")
 
     st.header("Group & Aggregate")
-    group_cols = [col for col in df_filtered.columns if df_filtered[col].nunique() < 100]
+    # Grouping candidates come from the column catalog instead of a nunique() scan
+    columns = table_columns(selected_table)
+    group_cols = [col for col in low_cardinality_columns(selected_table) if col in columns]
 
     if group_cols:
         group_col = st.selectbox("Group by column", group_cols)
-        numeric_cols = df_filtered.select_dtypes(include=["number"]).columns.tolist()
+        numeric_cols = [col for col in numeric_columns(selected_table) if col in columns]
 
         # Default to fantasy_points_ppr
         if "fantasy_points_ppr" in numeric_cols:
@@ -47,28 +48,32 @@ if selected_table != "No tables found":
             default_idx = 0
 
         agg_col = st.selectbox("Aggregate numeric column", numeric_cols, index=default_idx)
-        agg_func = st.selectbox("Aggregation function", ["sum", "mean", "max", "min", "count"])
+        agg_func = st.selectbox("Aggregation function", AGG_FUNCS)
 
-        grouped = df_filtered.groupby(group_col)[agg_col].agg(agg_func).reset_index()
+        # GROUP BY runs in SQLite (or on a cached rollup) with the same filters
+        grouped, served_from = aggregate(selected_table, group_col, agg_col, agg_func, filters)
+        value_col = grouped.columns[1]
+        st.caption(f"Aggregated in SQLite ({served_from})")
         st.write(grouped)
 
         st.header("📈 Chart Builder")
         chart_type = st.selectbox("Chart Type", ["Bar", "Line", "Pie"])
-        if chart_type == "Bar":
-            fig = px.bar(grouped, x=group_col, y=agg_col)
-        elif chart_type == "Line":
-            fig = px.line(grouped, x=group_col, y=agg_col)
-        else:
-            fig = px.pie(grouped, names=group_col, values=agg_col)
+        with perf_utils.span("plot", chart=chart_type):
+            if chart_type == "Bar":
+                fig = px.bar(grouped, x=group_col, y=value_col)
+            elif chart_type == "Line":
+                fig = px.line(grouped, x=group_col, y=value_col)
+            else:
+                fig = px.pie(grouped, names=group_col, values=value_col)
 
-        st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
 
         new_table_name = st.text_input("Save Aggregated Table")
         if st.button("💾 Save Aggregated Table"):
             if new_table_name:
-                conn = get_connection()
-                grouped.to_sql(new_table_name, conn, if_exists="replace", index=False)
-                conn.close()
-                st.success(f"✅ Saved aggregated table '{new_table_name}'.")
+                if save_table_with_progress(grouped, new_table_name):
+                    st.success(f"✅ Saved aggregated table '{new_table_name}'.")
             else:
                 st.warning("Please enter a table name to save.")
+
+render_diagnostics_panel()
@@ -1,19 +1,21 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
 import os
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.ensemble import RandomForestRegressor
-
-from shared_utils import get_connection, quote_table
-from ui_utils import render_page_header, render_instructions_block
-from filter_utils import apply_universal_filters
+from shared_utils import list_tables, load_table
+from ui_utils import render_page_header, render_instructions_block, render_data_grid, render_diagnostics_panel
+from filter_utils import render_universal_filters
+from catalog_utils import numeric_columns
+from query_utils import table_columns
+from training_utils import SEARCH_SPACES, SEARCH_STRATEGIES, CV_STRATEGIES, search_space_size
+from feature_store_utils import (
+    STATS, ALL_WINDOWS, DEFAULT_ENTITY, supports_features, list_features, define_feature,
+    register_default_features, refresh_features, features_current,
+)
+from jobs_utils import ACTIVE_STATUSES, JOB_CORES, submit_training_job, submit_search_job, cancel_job, list_jobs
 
 render_page_header("Prediction Engine PRO v4", "🔮 Build forecasts with unified filters")
 
@@ -21,64 +23,186 @@ render_instructions_block("""
 - Apply filters to limit dataset scope (Season, Player, Position)
 - Select model features and predict `fantasy_points_ppr`
 - Train Random Forest regression models for forecasting weekly performance
+- Training runs as a background job; you can leave the page and come back for results
+- Use Hyperparameter search to compare many configurations with cross-validation
+- Add feature-store features (e.g. a player's average over the previous 3 weeks) alongside raw columns
 """)
 
 os.makedirs("models", exist_ok=True)
 
 # Load tables
-conn = get_connection()
-tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table'", conn)
-conn.close()
+tables = list_tables()
 
-selected_table = st.selectbox("Select dataset for modeling", tables["name"].tolist() if not tables.empty else ["No tables found"])
+selected_table = st.selectbox("Select dataset for modeling", tables if tables else ["No tables found"])
 
 if selected_table != "No tables found":
-    conn = get_connection()
-    df = pd.read_sql(f"SELECT * FROM {quote_table(selected_table)}", conn)
-    conn.close()
-
     st.write("Sample of selected data:")
-    st.dataframe(df.head())
+    st.dataframe(load_table(selected_table, limit=5))
 
     st.header("Apply Filters")
-    filtered_df = apply_universal_filters(df)
-    st.dataframe(filtered_df)
+    filters = render_universal_filters(selected_table)
+    render_data_grid(selected_table, filters, key="predict")
 
-    numeric_cols = filtered_df.select_dtypes(include=["number"]).columns.tolist()
+    numeric_cols = numeric_columns(selected_table)
 
     feature_cols = st.multiselect("Select input features (X)", numeric_cols)
-    target_col = st.selectbox("Target column (y)", numeric_cols, index=numeric_cols.index("fantasy_points_ppr") if "fantasy_points_ppr" in numeric_cols else 0)
-
-    if feature_cols and target_col:
-        X = filtered_df[feature_cols].fillna(0)
-        y = filtered_df[target_col].fillna(0)
-
-        test_size = st.slider("Test Set Size (%)", 10, 40, 20, step=5)
-        n_estimators = st.slider("Random Forest: n_estimators", 50, 500, 200, 50)
-        max_depth = st.slider("Random Forest: max_depth", 3, 20, 10, 1)
-
-        if st.button("Train Model"):
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size/100, random_state=42)
 
-            model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=42)
-            model.fit(X_train, y_train)
-
-            preds = model.predict(X_test)
-            rmse = mean_squared_error(y_test, preds) ** 0.5
-            r2 = r2_score(y_test, preds)
-
-            st.success(f"✅ Model Trained!  RMSE: {rmse:.2f}  |  R²: {r2:.2%}")
-
-            model_file = f"models/{selected_table}_fantasy_predictor.pkl"
-            joblib.dump((model, feature_cols, target_col), model_file)
-            st.info(f"Model saved as {model_file}")
+    # Windowed per-player features, kept up to date as new weeks are written
+    store_cols = []
+    if supports_features(selected_table):
+        definitions = list_features(selected_table)
+        with st.expander("Feature store"):
+            if st.session_state.get("feature_store_report"):
+                st.success(st.session_state.pop("feature_store_report"))
+            if definitions.empty:
+                st.write("No features defined for this table yet.")
+            else:
+                st.dataframe(definitions, hide_index=True)
+                if not features_current(selected_table):
+                    st.caption("The store is behind this table's latest write; it is refreshed before training.")
+
+            all_columns = table_columns(selected_table)
+            with st.form("define_feature"):
+                c1, c2, c3 = st.columns(3)
+                name = c1.text_input("Feature name", "my_feature")
+                column = c2.selectbox("Column", numeric_cols)
+                entity = c3.selectbox("Per", all_columns, index=all_columns.index(DEFAULT_ENTITY) if DEFAULT_ENTITY in all_columns else 0)
+                c4, c5 = st.columns(2)
+                stat = c4.selectbox("Statistic", STATS)
+                window = c5.selectbox(
+                    "Window", [1, 2, 3, 4, 5, 8, 10, *ALL_WINDOWS],
+                    index=2, format_func=lambda w: f"previous {w} weeks" if isinstance(w, int) else f"{w} to date",
+                )
+                add = st.form_submit_button("Add feature")
+            defaults = st.button("Add default features")
+            if add or defaults:
+                try:
+                    if add:
+                        define_feature(selected_table, name, column, stat, window, entity)
+                    else:
+                        register_default_features(selected_table)
+                    with st.spinner("Building feature store..."):
+                        report = refresh_features(selected_table)
+                    st.session_state["feature_store_report"] = " · ".join(
+                        f"{r['entity']}/{r['column']}: {r['mode']}, {r['periods']:,} periods ({r['seconds']:.1f}s)" for r in report
+                    )
+                    st.rerun()
+                except ValueError as e:
+                    st.error(str(e))
+
+        store_cols = st.multiselect("Feature store features (from previous weeks)", definitions["name"].tolist())
 
+    target_col = st.selectbox("Target column (y)", numeric_cols, index=numeric_cols.index("fantasy_points_ppr") if "fantasy_points_ppr" in numeric_cols else 0)
+    model_features = feature_cols + store_cols
+
+    if model_features and target_col:
+        mode = st.radio("Training mode", ["Single model", "Hyperparameter search"], horizontal=True)
+        cores = st.number_input("CPU cores for this job", min_value=1, max_value=os.cpu_count() or 1, value=min(JOB_CORES, os.cpu_count() or 1))
+        registry_name = f"{selected_table}_fantasy_predictor"
+
+        if mode == "Single model":
+            test_size = st.slider("Test Set Size (%)", 10, 40, 20, step=5)
+            n_estimators = st.slider("Random Forest: n_estimators", 50, 500, 200, 50)
+            max_depth = st.slider("Random Forest: max_depth", 3, 20, 10, 1)
+
+            # Training runs in the shared background pool; this session only polls its status
+            if st.button("Train Model"):
+                job_id = submit_training_job(
+                    selected_table, model_features, target_col, filters,
+                    test_size=test_size / 100, n_estimators=n_estimators, max_depth=max_depth, cores=cores,
+                    registry_name=registry_name, store_features=store_cols,
+                )
+                st.session_state["predictor_job"] = job_id
+                st.success(f"✅ Training job {job_id} queued.")
+        else:
+            model_name = st.selectbox("Regressor", list(SEARCH_SPACES), format_func=lambda m: m.replace("_", " ").title())
+            strategy = st.radio("Search strategy", SEARCH_STRATEGIES, horizontal=True, format_func=str.title)
+            cv_options = CV_STRATEGIES if "season" in table_columns(selected_table) else ["kfold"]
+            cv = st.radio(
+                "Cross-validation", cv_options, horizontal=True,
+                format_func=lambda c: "Season walk-forward" if c == "season" else "K-fold",
+            )
+            folds = st.slider("Folds", 2, 10, 3 if cv == "season" else 5)
+            space_size = search_space_size(model_name)
+            if strategy == "random":
+                n_candidates = st.slider("Candidates to sample", 2, space_size, min(20, space_size))
+            else:
+                n_candidates = space_size
+                st.caption(f"Grid search starts with all {space_size} combinations.")
+            factor = st.slider("Halving factor (higher drops weak candidates faster)", 2, 5, 3)
+
+            if st.button("Run Search"):
+                job_id = submit_search_job(
+                    selected_table, model_features, target_col, filters,
+                    model_name=model_name, strategy=strategy, cv=cv, folds=folds,
+                    n_candidates=n_candidates, factor=factor, cores=cores, registry_name=registry_name,
+                    store_features=store_cols,
+                )
+                st.session_state["predictor_job"] = job_id
+                st.success(f"✅ Search job {job_id} queued.")
+
+    st.header("Training Jobs")
+
+    def render_jobs():
+        jobs = list_jobs(selected_table)
+        if not jobs:
+            st.write("No training jobs for this table yet.")
+            return
+
+        st.dataframe(pd.DataFrame([
+            {
+                "job": job["job_id"],
+                "status": job["status"],
+                "progress": f"{job['progress']:.0%}",
+                "message": job["message"],
+                "kind": job["kind"],
+                "RMSE": job["result"]["rmse"] if job["result"] else None,
+                "R²": job["result"].get("r2") if job["result"] else None,
+            }
+            for job in jobs
+        ]), hide_index=True)
+
+        job_ids = [job["job_id"] for job in jobs]
+        default = job_ids.index(st.session_state["predictor_job"]) if st.session_state.get("predictor_job") in job_ids else 0
+        job = jobs[st.selectbox("Inspect job", range(len(jobs)), index=default, format_func=lambda i: job_ids[i])]
+
+        if job["status"] in ACTIVE_STATUSES:
+            st.progress(job["progress"], text=f"{job['status']}: {job['message']}")
+            if st.button("⛔ Cancel Job", key=f"cancel_{job['job_id']}"):
+                cancel_job(job["job_id"])
+                st.rerun()
+        elif job["status"] == "done" and job["kind"] == "search":
+            result = job["result"]
+            st.success(
+                f"✅ Best {result['model'].replace('_', ' ')}: CV RMSE {result['rmse']:.2f} "
+                f"({result['candidates']} candidates, {result['rounds']} halving rounds, {result['folds']} folds)"
+            )
+            st.write("Best parameters:", result["best_params"])
+            st.info(f"Model registered as {result.get('registry_name')} v{result.get('model_version')} ({job['artifact']})")
+
+            leaderboard = pd.read_csv(result["leaderboard_file"])
+            st.dataframe(leaderboard, hide_index=True)
+            st.download_button("📥 Download Leaderboard", leaderboard.to_csv(index=False), file_name="leaderboard.csv")
+        elif job["status"] == "done":
+            result = job["result"]
+            st.success(f"✅ Model Trained!  RMSE: {result['rmse']:.2f}  |  R²: {result['r2']:.2%}")
+            st.info(f"Model registered as {result.get('registry_name')} v{result.get('model_version')} ({job['artifact']})")
+
+            pred_df = pd.read_parquet(result["predictions_file"])
             fig, ax = plt.subplots()
-            sns.scatterplot(x=y_test, y=preds, ax=ax)
-            ax.plot([y.min(), y.max()], [y.min(), y.max()], '--', color='gray')
+            sns.scatterplot(x=pred_df["Actual"], y=pred_df["Predicted"], ax=ax)
+            lo, hi = pred_df["Actual"].min(), pred_df["Actual"].max()
+            ax.plot([lo, hi], [lo, hi], '--', color='gray')
             ax.set_xlabel("Actual")
             ax.set_ylabel("Predicted")
             st.pyplot(fig)
 
-            pred_df = pd.DataFrame({"Actual": y_test, "Predicted": preds})
             st.download_button("📥 Download Predictions", pred_df.to_csv(index=False), file_name="predictions.csv")
+        else:
+            st.warning(f"Job {job['status']}: {job['message']}")
+
+    # Poll every couple of seconds while any job for this table is still running
+    active = any(job["status"] in ACTIVE_STATUSES for job in list_jobs(selected_table))
+    st.fragment(run_every=2 if active else None)(render_jobs)()
+
+render_diagnostics_panel()
@@ -1,33 +1,61 @@
 import streamlit as st
-import pandas as pd
-from shared_utils import get_connection, quote_table
+import os
+from shared_utils import list_tables, load_table
+from catalog_utils import get_catalog, catalog_summary
+from profile_utils import PROFILE_MODES, profile_table
+from ui_utils import start_page_trace, render_diagnostics_panel
+
+start_page_trace("Profile Report")
 
 st.title("Profile Report")
 
-conn = get_connection()
-cursor = conn.cursor()
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-tables = [t[0] for t in cursor.fetchall()]
-conn.close()
+tables = list_tables()
 
 selected_table = st.selectbox("Select table to profile", tables if tables else ["No tables found"])
 
 if selected_table != "No tables found":
-    conn = get_connection()
-    df = pd.read_sql(f"SELECT * FROM {quote_table(selected_table)}", conn)
-    conn.close()
+    # Statistics come from the column catalog maintained at write time
+    catalog = get_catalog(selected_table)
+    summary = catalog_summary(catalog)
 
-    st.write(f"Total rows: {len(df)}")
-    st.dataframe(df.head())
+    st.write(f"Total rows: {int(catalog['row_count'].iloc[0]) if not catalog.empty else 0}")
+    st.dataframe(load_table(selected_table, limit=5))
 
     st.subheader("Summary Statistics")
-    st.write(df.describe(include="all"))
+    st.write(summary)
 
     st.subheader("Missing Values")
-    st.write(df.isnull().sum())
+    st.write(catalog["null_count"])
 
     st.subheader("Column Data Types")
-    st.write(df.dtypes)
+    st.write(catalog["dtype"])
 
-    csv = df.describe(include="all").to_csv().encode("utf-8")
+    csv = summary.to_csv().encode("utf-8")
     st.download_button("Download Summary CSV", csv, file_name=f"{selected_table}_summary.csv", mime="text/csv")
+
+    st.subheader("Streaming Profile")
+    st.markdown("""
+- **sketch** streams every row and uses HyperLogLog / quantile sketches (small, bounded error).
+- **sample** profiles random row blocks only and reports 95% error bounds.
+- **exact** streams every row and computes exact distinct counts and quantiles inside SQLite.
+""")
+    mode = st.radio("Profiling mode", PROFILE_MODES, horizontal=True)
+    workers = int(st.number_input("Parallel workers", min_value=1, max_value=64, value=min(4, os.cpu_count() or 1)))
+    sample_pct = st.slider("Sample size (%)", 1, 50, 5) if mode == "sample" else 100
+
+    if st.button("Run Streaming Profile"):
+        with st.spinner("Profiling in chunks..."):
+            profile = profile_table(selected_table, mode=mode, workers=workers, sample_fraction=sample_pct / 100)
+        st.caption(
+            f"Mode: {profile.attrs['mode']} — scanned {profile.attrs['rows_scanned']:,} "
+            f"of {profile.attrs['total_rows']:,} rows"
+        )
+        st.write(profile.T)
+        st.download_button(
+            "Download Profile CSV",
+            profile.to_csv().encode("utf-8"),
+            file_name=f"{selected_table}_profile_{mode}.csv",
+            mime="text/csv",
+        )
+
+render_diagnostics_panel()
@@ -1,67 +1,173 @@
 # pages/08_Prediction_Playground.py  (core changes only)
 import streamlit as st
-import pandas as pd
-import numpy as np
-import joblib
+import hashlib
 import os
+import sklearn
+
+from shared_utils import list_tables, get_table_version, load_table
+from registry_utils import list_models, load_model, load_artifact
+from ingest_utils import SUPPORTED_EXTENSIONS, preview_upload
+from scoring_utils import OUTPUT_FORMATS, DATA_DIR, SCORES_DIR, DEFAULT_CHUNK_ROWS, input_columns, resolve_under, score_file
+from ui_utils import start_page_trace, render_diagnostics_panel
+
+start_page_trace("Prediction Playground")
+
+# Outputs above this size are left on disk rather than offered as a download
+DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
 
 st.title("🔮 Prediction Playground PRO v4 (Pipeline-Ready)")
-st.markdown("Upload raw features; the saved Pipeline handles preprocessing.")
+st.markdown("Upload raw features; the saved Pipeline handles preprocessing. Models trained in the Prediction Engine appear under Model registry.")
 
 os.makedirs("models", exist_ok=True)
 
 # ===== Step 1: Load pipeline =====
-src = st.radio("Choose Model Source:", ["Upload .pkl", "Select from /models"])
+src = st.radio("Choose Model Source:", ["Model registry", "Upload .pkl", "Select from /models"])
 
 meta = None
-if src == "Upload .pkl":
+model_path = None
+if src == "Model registry":
+    entries = list_models()
+    if not entries:
+        st.info("No registered models yet. Train one in the Prediction Engine.")
+    else:
+        pick = st.selectbox(
+            "Pick a registered model", range(len(entries)),
+            format_func=lambda i: f"{entries[i]['name']} v{entries[i]['version']}  ·  {entries[i]['kind']}",
+        )
+        entry = entries[pick]
+        meta = load_model(entry["name"], entry["version"])
+        model_path = entry["path"]
+        st.success(f"✅ Loaded {entry['name']} v{entry['version']}")
+
+        details = {"trained on": entry["source_table"], "sklearn": entry["sklearn_version"], **entry["metrics"]}
+        st.write(details)
+        if entry["sklearn_version"] != sklearn.__version__:
+            st.warning(f"Model was trained with scikit-learn {entry['sklearn_version']}; this server runs {sklearn.__version__}.")
+        if entry["source_table"] in list_tables() and get_table_version(entry["source_table"]) != entry["table_version"]:
+            st.warning(f"`{entry['source_table']}` has been rewritten since this model was trained.")
+elif src == "Upload .pkl":
     f = st.file_uploader("Upload pipeline (.pkl)", type=["pkl"])
     if f:
-        meta = joblib.load(f)
-        st.success("✅ Pipeline loaded from upload.")
+        # Keep the upload on disk so scoring workers can memory-map it. Named by
+        # content and written once, so sessions never overwrite each other's
+        # file and reruns keep its mtime (and the artifact cache entry).
+        data = f.getbuffer()
+        os.makedirs(os.path.join("models", "uploads"), exist_ok=True)
+        upload_path = os.path.join("models", "uploads", hashlib.sha1(data).hexdigest() + ".pkl")
+        if not os.path.exists(upload_path):
+            partial = f"{upload_path}.{os.getpid()}.tmp"
+            with open(partial, "wb") as out:
+                out.write(data)
+            os.replace(partial, upload_path)
+        try:
+            meta = load_artifact(upload_path)
+            model_path = upload_path
+            st.success("✅ Pipeline loaded from upload.")
+        except ValueError as e:
+            st.error(str(e))
 else:
-    local = [f for f in os.listdir("models") if f.endswith(".pkl")]
+    registered = {os.path.abspath(e["path"]) for e in list_models()}
+    local = [f for f in os.listdir("models") if f.endswith(".pkl") and os.path.abspath(os.path.join("models", f)) not in registered]
     name = st.selectbox("Pick a saved model", ["—"] + local)
     if name != "—":
-        meta = joblib.load(os.path.join("models", name))
-        st.success(f"✅ Loaded models/{name}")
+        try:
+            model_path = os.path.join("models", name)
+            meta = load_artifact(model_path)
+            st.success(f"✅ Loaded models/{name}")
+        except ValueError as e:
+            st.error(str(e))
 
 if meta:
-    pipe       = meta["pipeline"]
     feat_cols  = meta["feature_cols"]
     target_col = meta["target_col"]
 
+    raw_cols = input_columns(meta)
+    store = meta.get("feature_store")
+
     st.write("Target:", target_col)
-    st.write("Expected raw feature columns:", feat_cols)
+    st.write("Expected raw feature columns:", raw_cols)
+    if store:
+        st.info(f"Feature-store features {store['features']} are looked up from `{store['table']}` by {[c for c in raw_cols if c not in feat_cols]}.")
 
-    # ===== Step 2: Upload future features =====
-    csv = st.file_uploader("Upload future features CSV (raw columns)", type=["csv"])
-    if csv:
-        future_df = pd.read_csv(csv)
-        st.write("Preview:")
-        st.dataframe(future_df.head())
+    # ===== Step 2: Feature file =====
+    input_src = st.radio("Feature file source:", ["Upload", "Path on server"], horizontal=True)
+    feature_file, feature_name = None, None
+    if input_src == "Upload":
+        upload = st.file_uploader("Upload future features (raw columns)", type=SUPPORTED_EXTENSIONS)
+        if upload:
+            feature_file, feature_name = upload, upload.name
+    else:
+        # Only files under the server's data directory can be read
+        server_path = st.text_input(f"Feature file under {DATA_DIR}/ (csv, parquet, jsonl, ...)")
+        if server_path:
+            try:
+                resolved = resolve_under(DATA_DIR, server_path)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if os.path.isfile(resolved):
+                    feature_file, feature_name = resolved, resolved
+                else:
+                    st.error(f"File not found: {DATA_DIR}/{server_path}")
 
-        missing = [c for c in feat_cols if c not in future_df.columns]
-        extra   = [c for c in future_df.columns if c not in feat_cols]
+    if feature_file is not None:
+        preview = preview_upload(feature_file, feature_name)
+        st.write("Preview:")
+        st.dataframe(preview)
 
+        missing = [c for c in raw_cols if c not in preview.columns]
         if missing:
             st.error(f"Missing required columns: {missing}")
         else:
-            # Align order; Pipeline will impute/encode/scale internally
-            X_new = future_df.reindex(columns=feat_cols)
-
             # ===== Step 3: Predict =====
-            if st.button("Predict"):
+            col1, col2, col3 = st.columns(3)
+            output_format = col1.selectbox("Write predictions to", OUTPUT_FORMATS, format_func=lambda f: "SQLite table" if f == "sqlite" else f.upper())
+            workers = col2.number_input("Scoring processes (0 = in this process)", min_value=0, max_value=os.cpu_count() or 1, value=0)
+            chunk_rows = col3.number_input("Rows per chunk", min_value=1_000, max_value=2_000_000, value=DEFAULT_CHUNK_ROWS, step=50_000)
+            stem = os.path.splitext(os.path.basename(feature_name))[0]
+            default_output = f"{stem}_predictions" if output_format == "sqlite" else f"{stem}_predictions.{output_format}"
+            output = st.text_input("Output table" if output_format == "sqlite" else f"Output file under {SCORES_DIR}/", default_output)
+
+            # Output files are confined to the predictions directory
+            output_error = None
+            if output_format != "sqlite":
                 try:
-                    preds = pipe.predict(X_new)
-                    future_df[f"Predicted_{target_col}"] = preds
-                    st.success("✅ Predictions complete!")
-                    st.dataframe(future_df.tail(10))
-                    st.download_button(
-                        "📥 Download Predictions",
-                        future_df.to_csv(index=False),
-                        file_name="future_predictions.csv"
+                    output = resolve_under(SCORES_DIR, output)
+                except ValueError as e:
+                    output_error = str(e)
+
+            if output_error:
+                st.error(output_error)
+            elif st.button("Predict"):
+                if output_format != "sqlite":
+                    os.makedirs(os.path.dirname(output), exist_ok=True)
+                bar = st.progress(0.0, text="Scoring...")
+
+                # Chunks are streamed, so the bar tracks throughput rather than a known total
+                def report(rows, seconds):
+                    rate = rows / seconds if seconds else 0.0
+                    bar.progress(min(0.99, rows / (rows + chunk_rows)), text=f"Scored {rows:,} rows · {rate:,.0f} rows/sec")
+
+                try:
+                    stats = score_file(
+                        model_path, feature_file, feature_name, output, output_format,
+                        workers=workers, chunk_rows=chunk_rows, progress=report,
                     )
+                    bar.progress(1.0, text=f"Scored {stats['rows']:,} rows in {stats['seconds']:.1f}s")
+                    st.success(f"✅ Predictions complete! {stats['rows_per_sec']:,.0f} rows/sec → {output}")
+
+                    if output_format == "sqlite":
+                        st.dataframe(load_table(output, limit=10))
+                    else:
+                        st.dataframe(preview_upload(output, output, n=10))
+                        # Large outputs stay on disk instead of being pulled into the page
+                        if os.path.getsize(output) < DOWNLOAD_MAX_BYTES:
+                            with open(output, "rb") as fh:
+                                st.download_button("📥 Download Predictions", fh, file_name=os.path.basename(output))
+                        else:
+                            st.info(f"Output is {os.path.getsize(output) / 1e6:,.0f} MB; find it at {output} on the server.")
                 except Exception as e:
                     st.error("Prediction failed.")
                     st.exception(e)
+
+render_diagnostics_panel()
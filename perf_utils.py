@@ -0,0 +1,214 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+
+# Per-rerun performance traces: timing spans, SQL statements and DataFrame
+# footprints. Recording is per thread (one Streamlit script run = one thread)
+# and only happens between start_trace() and finish_trace(); outside a trace
+# every hook is a single thread-local lookup.
+
+# Default for the diagnostics toggle (DATOS_PERF=1 turns recording on for new sessions)
+PERF_DEFAULT_ON = os.environ.get("DATOS_PERF", "0").lower() in ("1", "true", "yes", "on")
+# Longest SQL text kept per statement
+MAX_SQL_CHARS = 2000
+
+_local = threading.local()
+_NO_SPAN = nullcontext()
+
+class Trace:
+    def __init__(self, label):
+        self.label = label
+        self.thread = threading.get_ident()
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []
+        self.queries = []
+        self.frames = []
+        self._stack = []
+
+    @property
+    def seconds(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self):
+        return {
+            "label": self.label,
+            "started_at": self.wall_start,
+            "seconds": self.seconds,
+            "spans": len(self.spans),
+            "queries": len(self.queries),
+            "sql_seconds": sum(q["seconds"] for q in self.queries),
+            "rows_fetched": sum(q["rows"] or 0 for q in self.queries),
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "spans": [dict(s, start=s["start"] - self.start, end=s["end"] - self.start) for s in self.spans],
+            "queries": [dict(q, start=q["start"] - self.start) for q in self.queries],
+            "frames": [dict(f, at=f["at"] - self.start) for f in self.frames],
+        }
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+def active():
+    return getattr(_local, "trace", None) is not None
+
+# Begin recording for this thread; an unfinished previous trace is closed and returned
+def start_trace(label):
+    previous = finish_trace()
+    _local.trace = Trace(label)
+    return previous
+
+def finish_trace():
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return None
+    trace.end = time.perf_counter()
+    _local.trace = None
+    return trace
+
+class _Span:
+    __slots__ = ("trace", "record")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.record = {"name": name, "start": 0.0, "end": 0.0, "depth": 0, "attrs": attrs}
+
+    def __enter__(self):
+        self.record["depth"] = len(self.trace._stack)
+        self.trace._stack.append(self.record)
+        self.record["start"] = time.perf_counter()
+        return self.record
+
+    def __exit__(self, *exc):
+        self.record["end"] = time.perf_counter()
+        self.trace._stack.pop()
+        self.trace.spans.append(self.record)
+        return False
+
+# Timing span context manager; a shared no-op when nothing is recording
+def span(name, **attrs):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name, attrs)
+
+# Decorator form of span()
+def timed(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = getattr(_local, "trace", None)
+            if trace is None:
+                return fn(*args, **kwargs)
+            with _Span(trace, name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Shallow memory footprint of a DataFrame produced inside a trace
+def record_frame(name, df):
+    trace = getattr(_local, "trace", None)
+    if trace is None or df is None:
+        return
+    trace.frames.append({
+        "name": name,
+        "rows": int(len(df)),
+        "columns": int(df.shape[1]),
+        "bytes": int(df.memory_usage(index=True, deep=False).sum()),
+        "at": time.perf_counter(),
+    })
+
+def _record_query(sql, seconds, rows):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return None
+    record = {"sql": " ".join(str(sql).split())[:MAX_SQL_CHARS], "seconds": seconds, "rows": rows,
+              "start": time.perf_counter() - seconds}
+    trace.queries.append(record)
+    return record
+
+# Cursor that times execute() and counts fetched rows into the last query record
+class TracedCursor(sqlite3.Cursor):
+    _record = None
+
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        result = method(self, sql, *args)
+        self._record = _record_query(sql, time.perf_counter() - started, self.rowcount if self.rowcount >= 0 else None)
+        return result
+
+    def execute(self, sql, *args):
+        return self._timed(sqlite3.Cursor.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(sqlite3.Cursor.executemany, sql, *args)
+
+    def _fetched(self, rows, started):
+        if self._record is not None:
+            self._record["rows"] = (self._record["rows"] or 0) + len(rows)
+            self._record["seconds"] += time.perf_counter() - started
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        return self._fetched(super().fetchall(), started)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        return self._fetched(super().fetchmany(*args), started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], started)
+        return row
+
+# Connection whose cursors and conn.execute shortcuts are traced
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+# JSON export of one or more traces
+def traces_to_json(traces):
+    return json.dumps([trace.to_dict() for trace in traces], indent=2, default=str)
+
+# Chrome trace-event format (load in chrome://tracing or Perfetto)
+def traces_to_chrome(traces):
+    events = []
+    for trace in traces:
+        base = trace.wall_start * 1e6
+        tid = trace.thread
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": trace.label}})
+        for s in trace.spans:
+            events.append({
+                "name": s["name"], "cat": "span", "ph": "X", "pid": 1, "tid": tid,
+                "ts": base + (s["start"] - trace.start) * 1e6, "dur": (s["end"] - s["start"]) * 1e6,
+                "args": s["attrs"],
+            })
+        for q in trace.queries:
+            events.append({
+                "name": q["sql"][:80], "cat": "sql", "ph": "X", "pid": 1, "tid": tid,
+                "ts": base + (q["start"] - trace.start) * 1e6, "dur": q["seconds"] * 1e6,
+                "args": {"sql": q["sql"], "rows": q["rows"]},
+            })
+        for f in trace.frames:
+            events.append({
+                "name": f"frame {f['name']}", "cat": "memory", "ph": "i", "s": "t", "pid": 1, "tid": tid,
+                "ts": base + (f["at"] - trace.start) * 1e6,
+                "args": {"rows": f["rows"], "columns": f["columns"], "bytes": f["bytes"]},
+            })
+    return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, default=str)
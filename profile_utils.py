@@ -0,0 +1,383 @@
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import perf_utils
+import shared_utils
+from shared_utils import get_connection, quote_table
+from catalog_utils import get_catalog
+
+DEFAULT_CHUNK_ROWS = 100_000
+# Rows per randomly chosen block in fast-sample mode
+SAMPLE_BLOCK_ROWS = 1_000
+HLL_PRECISION = 14
+QUANTILE_K = 256
+FREQUENT_ITEMS_K = 64
+QUANTILES = [0.25, 0.5, 0.75]
+
+PROFILE_MODES = ["sketch", "sample", "exact"]
+
+# HyperLogLog distinct counter over 64-bit pandas hashes
+class HyperLogLog:
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, series):
+        values = series.dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes & np.uint64((1 << (64 - self.p)) - 1)).astype(np.float64)
+        # frexp gives the exact bit length for integers below 2**53
+        _, bit_length = np.frexp(rest)
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    # Relative standard error of the estimate
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+# KLL-style mergeable quantile sketch: level h holds items of weight 2**h
+class QuantileSketch:
+    def __init__(self, k=QUANTILE_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self._rng = random.Random(seed)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self.count += values.size
+            self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if level.size > self.k:
+                level = np.sort(level)
+                keep = level[-1:] if level.size % 2 else level[:0]
+                even = level[:level.size - keep.size]
+                promoted = even[self._rng.randint(0, 1)::2]
+                self.levels[h] = keep
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        items = np.concatenate(self.levels)
+        if items.size == 0:
+            return [None for _ in qs]
+        weights = np.concatenate([np.full(level.size, 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cumulative = items[order], np.cumsum(weights[order])
+        total = cumulative[-1]
+        return [float(items[min(np.searchsorted(cumulative, q * total), items.size - 1)]) for q in qs]
+
+    # Rough normalized rank error, grows with the number of compaction levels
+    def rank_error(self):
+        return min(1.0, 1.7 * math.sqrt(max(len(self.levels) - 1, 0)) / self.k) if self.count else 0.0
+
+# Misra-Gries frequent items; counts are underestimated by at most n / (k + 1)
+class FrequentItems:
+    def __init__(self, k=FREQUENT_ITEMS_K):
+        self.k = k
+        self.counts = {}
+        self.count = 0
+
+    def _trim(self):
+        if len(self.counts) > self.k:
+            cutoff = sorted(self.counts.values(), reverse=True)[self.k]
+            self.counts = {v: c - cutoff for v, c in self.counts.items() if c > cutoff}
+
+    def update(self, series):
+        counts = series.dropna().value_counts()
+        self.count += int(counts.sum())
+        # Trim the chunk's own counts first (merging trimmed summaries keeps the same bound)
+        if len(counts) > self.k:
+            cutoff = counts.iloc[self.k]
+            counts = counts[counts > cutoff] - cutoff
+        for value, c in counts.items():
+            self.counts[value] = self.counts.get(value, 0) + int(c)
+        self._trim()
+
+    def merge(self, other):
+        for value, c in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + c
+        self.count += other.count
+        self._trim()
+        return self
+
+    def top(self, n=1):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+    # Every value seen is still counted exactly (nothing was trimmed yet)
+    def complete(self):
+        return sum(self.counts.values()) == self.count
+
+# All sketches for one column; mergeable across chunks and workers.
+# quantiles=False skips the quantile sketch (the column catalog has no use for it).
+class ColumnSketch:
+    def __init__(self, numeric, seed=None, items_k=FREQUENT_ITEMS_K, quantiles=True):
+        self.numeric = numeric
+        self.rows = 0
+        self.nulls = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.hll = HyperLogLog()
+        self.items = FrequentItems(items_k)
+        self.quantiles = QuantileSketch(seed=seed) if numeric and quantiles else None
+
+    def update(self, series):
+        self.rows += len(series)
+        self.nulls += int(series.isna().sum())
+        self.items.update(series)
+        if not self.numeric:
+            self.hll.update(series)
+            return
+        # Hash numbers as float64 so 3 and 3.0 from differently typed chunks agree
+        numbers = pd.to_numeric(series, errors="coerce").astype(np.float64).dropna()
+        self.hll.update(numbers)
+        values = numbers.to_numpy()
+        if values.size == 0:
+            return
+        if self.quantiles is not None:
+            self.quantiles.update(values)
+        # Chan et al. parallel update of the running mean / M2
+        n_b, mean_b = values.size, float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        self._combine(n_b, mean_b, m2_b)
+        lo, hi = float(values.min()), float(values.max())
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    def _combine(self, n_b, mean_b, m2_b):
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.hll.merge(other.hll)
+        self.items.merge(other.items)
+        if self.numeric and other.n:
+            if self.quantiles is not None:
+                self.quantiles.merge(other.quantiles)
+            self._combine(other.n, other.mean, other.m2)
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else None
+
+def _numeric_columns(table_name, conn):
+    catalog = get_catalog(table_name, conn)
+    return {col: dtype != "object" for col, dtype in catalog["dtype"].items()}
+
+# Worker entry point: sketch the rows in the given rowid blocks
+def _sketch_blocks(db_file, table_name, kinds, blocks, chunk_rows, seed):
+    import sqlite3
+
+    sketches = {col: ColumnSketch(numeric, seed=seed) for col, numeric in kinds.items()}
+    cols = ", ".join(quote_table(c) for c in kinds)
+    conn = sqlite3.connect(db_file)
+    try:
+        for lo, hi in blocks:
+            sql = f"SELECT {cols} FROM {quote_table(table_name)} WHERE rowid BETWEEN ? AND ?"
+            for chunk in pd.read_sql(sql, conn, params=[lo, hi], chunksize=chunk_rows):
+                for col, sketch in sketches.items():
+                    # Text columns hash as objects so chunks that happen to hold only numbers agree
+                    sketch.update(chunk[col] if sketch.numeric else chunk[col].astype(object))
+    finally:
+        conn.close()
+    return sketches
+
+def _rowid_blocks(conn, table_name, block_rows):
+    lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {quote_table(table_name)}").fetchone()
+    if lo is None:
+        return []
+    return [(start, min(start + block_rows - 1, hi)) for start in range(lo, hi + 1, block_rows)]
+
+# Values the exact quantiles rank: numbers only, as stored in SQLite
+def _quantile_filter(column):
+    c = quote_table(column)
+    return f"typeof({c}) IN ('integer', 'real')"
+
+def _quantile_count(conn, table_name, column):
+    return conn.execute(
+        f"SELECT COUNT(*) FROM {quote_table(table_name)} WHERE {_quantile_filter(column)}"
+    ).fetchone()[0]
+
+# Exact quantile by ORDER BY/OFFSET inside SQLite (no rows held in Python);
+# n is the _quantile_count of the column, so the offset stays within the ranked rows
+def _exact_quantile(conn, table_name, column, q, n):
+    c = quote_table(column)
+    offset = min(int(q * (n - 1)), n - 1)
+    row = conn.execute(
+        f"SELECT {c} FROM {quote_table(table_name)} WHERE {_quantile_filter(column)} "
+        f"ORDER BY {c} LIMIT 1 OFFSET ?",
+        (offset,),
+    ).fetchone()
+    return row[0] if row else None
+
+# Stream a table from SQLite and build mergeable sketches in parallel.
+# mode: "sketch" (full scan, approximate distinct/quantiles), "sample" (random
+# rowid blocks with error bounds) or "exact" (full scan plus exact SQL lookups).
+@perf_utils.timed("profile_table")
+def profile_table(table_name, mode="sketch", workers=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                  sample_fraction=0.05, seed=0):
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    workers = workers or os.cpu_count() or 1
+
+    conn = get_connection()
+    try:
+        kinds = _numeric_columns(table_name, conn)
+        total_rows = conn.execute(f"SELECT COUNT(*) FROM {quote_table(table_name)}").fetchone()[0]
+        if mode == "sample":
+            blocks = _rowid_blocks(conn, table_name, SAMPLE_BLOCK_ROWS)
+            rng = random.Random(seed)
+            blocks = sorted(rng.sample(blocks, max(1, math.ceil(len(blocks) * sample_fraction)))) if blocks else []
+        else:
+            blocks = _rowid_blocks(conn, table_name, chunk_rows)
+    finally:
+        conn.close()
+
+    # Deal blocks round-robin so every worker sees a spread of the table
+    tasks = [blocks[i::workers] for i in range(workers) if blocks[i::workers]]
+    merged = {col: ColumnSketch(numeric, seed=seed) for col, numeric in kinds.items()}
+    if len(tasks) <= 1:
+        results = [_sketch_blocks(shared_utils.DB_FILE, table_name, kinds, t, chunk_rows, seed) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            futures = [
+                pool.submit(_sketch_blocks, shared_utils.DB_FILE, table_name, kinds, t, chunk_rows, seed + i)
+                for i, t in enumerate(tasks)
+            ]
+            results = [f.result() for f in futures]
+    for partial in results:
+        for col, sketch in partial.items():
+            merged[col].merge(sketch)
+
+    exact = None
+    if mode == "exact":
+        exact = _exact_stats(table_name, merged)
+    return _summarize(merged, mode, total_rows, exact)
+
+# Exact distinct count and most frequent value by SQL (the catalog only keeps estimates)
+def _exact_counts(conn, table_name, column):
+    c = quote_table(column)
+    table = quote_table(table_name)
+    distinct = conn.execute(f"SELECT COUNT(DISTINCT {c}) FROM {table}").fetchone()[0]
+    top = conn.execute(
+        f"SELECT {c}, COUNT(*) AS n FROM {table} WHERE {c} IS NOT NULL GROUP BY {c} ORDER BY n DESC LIMIT 1"
+    ).fetchone()
+    return distinct, list(top) if top else [None, None]
+
+def _exact_stats(table_name, sketches):
+    conn = get_connection()
+    try:
+        stats = {}
+        for col, sketch in sketches.items():
+            quantiles = [None] * len(QUANTILES)
+            n = _quantile_count(conn, table_name, col) if sketch.numeric else 0
+            if n:
+                quantiles = [_exact_quantile(conn, table_name, col, q, n) for q in QUANTILES]
+            distinct, top = _exact_counts(conn, table_name, col)
+            stats[col] = {"distinct": distinct, "quantiles": quantiles, "top": top}
+    finally:
+        conn.close()
+    return stats
+
+# One row per column: describe()-like values plus the error bound for each estimate
+def _summarize(sketches, mode, total_rows, exact=None):
+    rows = []
+    for col, s in sketches.items():
+        sampled = s.rows
+        scale = total_rows / sampled if mode == "sample" and sampled else 1.0
+        fpc = math.sqrt(max(total_rows - sampled, 0) / max(total_rows - 1, 1)) if mode == "sample" else 0.0
+        top = s.items.top(1)
+        quantiles = s.quantiles.quantiles(QUANTILES) if s.numeric else [None] * len(QUANTILES)
+        rank_error = s.quantiles.rank_error() if s.numeric else None
+        distinct = s.hll.estimate()
+        distinct_error = s.hll.relative_error()
+
+        if mode == "sample" and s.numeric and s.n:
+            # DKW bound on the sample's empirical CDF at 95% confidence
+            rank_error += math.sqrt(math.log(2 / 0.05) / (2 * s.n))
+
+        row = {
+            "column": col,
+            "count": (s.rows - s.nulls) * scale,
+            "null_count": s.nulls * scale,
+            "distinct": distinct,
+            "distinct_rel_error": distinct_error,
+            "mean": s.mean if s.n else None,
+            "mean_error_95": 1.96 * s.std / math.sqrt(s.n) * fpc if mode == "sample" and s.std else 0.0,
+            "std": s.std,
+            "min": s.min,
+            **{f"{int(q * 100)}%": v for q, v in zip(QUANTILES, quantiles)},
+            "max": s.max,
+            "quantile_rank_error": rank_error,
+            "top": top[0][0] if top else None,
+            "freq": top[0][1] * scale if top else None,
+        }
+        if mode == "sample":
+            # Null share is a binomial proportion; distinct counts cannot be scaled from a sample
+            p = s.nulls / sampled if sampled else 0.0
+            row["null_count_error_95"] = 1.96 * math.sqrt(p * (1 - p) / max(sampled, 1)) * total_rows * fpc
+            row["distinct_is_lower_bound"] = True
+        if exact is not None:
+            row.update({
+                "distinct": exact[col]["distinct"],
+                "distinct_rel_error": 0.0,
+                **{f"{int(q * 100)}%": v for q, v in zip(QUANTILES, exact[col]["quantiles"])},
+                "quantile_rank_error": 0.0 if s.numeric else None,
+                "top": exact[col]["top"][0],
+                "freq": exact[col]["top"][1],
+            })
+        rows.append(row)
+
+    profile = pd.DataFrame(rows).set_index("column")
+    profile.attrs.update({"mode": mode, "total_rows": total_rows, "rows_scanned": max((s.rows for s in sketches.values()), default=0)})
+    return profile
@@ -0,0 +1,128 @@
+from shared_utils import get_connection, quote_table
+from catalog_utils import get_catalog
+
+# Column names of a table without reading any rows
+def table_columns(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        rows = conn.execute(f"PRAGMA table_info({quote_table(table_name)})").fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    return [row[1] for row in rows]
+
+# MIN/MAX of a column, from the column catalog when it is current
+def column_bounds(table_name, column, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        catalog = get_catalog(table_name, conn)
+        if column in catalog.index:
+            entry = catalog.loc[column]
+            return entry["min_value"], entry["max_value"]
+        col = quote_table(column)
+        row = conn.execute(f"SELECT MIN({col}), MAX({col}) FROM {quote_table(table_name)}").fetchone()
+    finally:
+        if own_conn:
+            conn.close()
+    return row
+
+# Sorted non-null distinct values of a column (catalog value list for low-cardinality columns)
+def distinct_values(table_name, column, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        catalog = get_catalog(table_name, conn)
+        if column in catalog.index and catalog.loc[column, "values_complete"]:
+            # Numbers before text, as ORDER BY sorts them below; a mixed column can't compare int to str
+            values = [value for value, _ in catalog.loc[column, "top_values"]]
+            return sorted(values, key=lambda v: (isinstance(v, str), v))
+        col = quote_table(column)
+        rows = conn.execute(
+            f"SELECT DISTINCT {col} FROM {quote_table(table_name)} WHERE {col} IS NOT NULL ORDER BY {col}"
+        ).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    return [row[0] for row in rows]
+
+# Escape LIKE wildcards for use with ESCAPE '\'
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+# Shorter queries can't use the trigram tokenizer and scan the indexed values instead
+TRIGRAM_MIN_CHARS = 3
+
+# Substring query as an FTS5 phrase (case-insensitive, LIKE wildcards are literal)
+def match_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+# Condition on a text index's value column (see text_index_utils) selecting values containing text
+def text_index_condition(text):
+    if len(text) >= TRIGRAM_MIN_CHARS:
+        return "value MATCH ?", [match_phrase(text)]
+    return "value LIKE ? ESCAPE '\\'", [f"%{escape_like(text)}%"]
+
+# Turn a universal filter spec into a parameterized WHERE clause.
+# Spec keys: season (lo, hi), player_search str, player_index (FTS table
+# used for player_search), player_exact str, positions list,
+# ranges {column: (lo, hi)}. Missing keys mean "no filter".
+def build_where_clause(filters):
+    clauses = []
+    params = []
+
+    season = filters.get("season")
+    if season is not None:
+        clauses.append('"season" BETWEEN ? AND ?')
+        params.extend(season)
+
+    player_search = filters.get("player_search")
+    if player_search and filters.get("player_index"):
+        condition, condition_params = text_index_condition(player_search)
+        clauses.append(f'"player_name" IN (SELECT value FROM {quote_table(filters["player_index"])} WHERE {condition})')
+        params.extend(condition_params)
+    elif player_search:
+        clauses.append("\"player_name\" LIKE ? ESCAPE '\\'")
+        params.append(f"%{escape_like(player_search)}%")
+
+    player_exact = filters.get("player_exact")
+    if player_exact:
+        clauses.append('"player_name" = ?')
+        params.append(player_exact)
+
+    positions = filters.get("positions")
+    if positions is not None:
+        if filters.get("all_positions"):
+            # Matches the pandas isin() behaviour of dropping NULL positions
+            clauses.append('"position" IS NOT NULL')
+        elif positions:
+            clauses.append(f'"position" IN ({", ".join("?" for _ in positions)})')
+            params.extend(positions)
+        else:
+            clauses.append("0")
+
+    for column, (lo, hi) in (filters.get("ranges") or {}).items():
+        clauses.append(f"{quote_table(column)} BETWEEN ? AND ?")
+        params.extend([lo, hi])
+
+    where = " AND ".join(clauses)
+    return where, params
+
+# Row count of a table (optionally filtered) without loading rows
+def count_rows(table_name, where="", params=(), conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        sql = f"SELECT COUNT(*) FROM {quote_table(table_name)}"
+        if where:
+            sql += f" WHERE {where}"
+        total = conn.execute(sql, list(params)).fetchone()[0]
+    finally:
+        if own_conn:
+            conn.close()
+    return total
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import joblib
+import sklearn
+
+from shared_utils import INTERNAL_PREFIX, get_connection, get_table_version
+
+MODELS_DIR = "models"
+MODELS_TABLE = f"{INTERNAL_PREFIX}models"
+
+# Bumped whenever the artifact layout changes; older layouts are upgraded on load
+ARTIFACT_FORMAT = 1
+
+# Loaded models kept in memory across reruns (override with DATOS_MODEL_CACHE)
+MODEL_CACHE_SIZE = int(os.environ.get("DATOS_MODEL_CACHE", "4"))
+
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+def _ensure_models_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {MODELS_TABLE} ("
+        "name TEXT NOT NULL, version INTEGER NOT NULL, path TEXT NOT NULL, kind TEXT, "
+        "feature_cols TEXT NOT NULL, target_col TEXT NOT NULL, source_table TEXT, table_version INTEGER, "
+        "metrics TEXT, params TEXT, sklearn_version TEXT, format INTEGER NOT NULL, "
+        "size_bytes INTEGER, created_at REAL NOT NULL, PRIMARY KEY (name, version))"
+    )
+
+def _decode(entry):
+    entry["feature_cols"] = json.loads(entry["feature_cols"])
+    entry["metrics"] = json.loads(entry["metrics"]) if entry.get("metrics") else {}
+    entry["params"] = json.loads(entry["params"]) if entry.get("params") else {}
+    return entry
+
+# Upgrade any artifact layout we have ever written to the current dict layout:
+# the Predictor's (model, feature_cols, target_col) tuple or a bare pipeline dict
+def normalize_artifact(obj):
+    if isinstance(obj, tuple) and len(obj) == 3:
+        model, feature_cols, target_col = obj
+        return {"format": ARTIFACT_FORMAT, "pipeline": model, "feature_cols": list(feature_cols), "target_col": target_col}
+    if isinstance(obj, dict) and "pipeline" in obj:
+        return {"format": ARTIFACT_FORMAT, **obj}
+    raise ValueError("Unrecognised model file: expected a pipeline dict or a (model, features, target) tuple.")
+
+# Save a fitted model as the next version of `name` and index its metadata.
+# Artifacts are written uncompressed so they can be memory-mapped on load.
+# feature_store: {"table", "features"} when some feature_cols come from the
+# feature store; scoring looks those up instead of reading them from the file.
+# The artifact is dumped to a private temp file first; the version is then
+# reserved, the file moved to its versioned path and the row inserted inside one
+# BEGIN IMMEDIATE transaction, so concurrent registrations never share a version.
+def register_model(model, name, feature_cols, target_col, source_table=None, kind=None,
+                   metrics=None, params=None, conn=None, feature_store=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    tmp = os.path.join(MODELS_DIR, f".tmp-{uuid.uuid4().hex}.pkl")
+    try:
+        _ensure_models_table(conn)
+        artifact = {"format": ARTIFACT_FORMAT, "pipeline": model, "feature_cols": list(feature_cols), "target_col": target_col}
+        if feature_store:
+            artifact["feature_store"] = feature_store
+        joblib.dump(artifact, tmp)
+        size = os.path.getsize(tmp)
+        table_version = get_table_version(source_table, conn) if source_table else None
+
+        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute(
+                f"SELECT COALESCE(MAX(version), 0) + 1 FROM {MODELS_TABLE} WHERE name = ?", (name,)
+            ).fetchone()[0]
+            path = os.path.join(MODELS_DIR, f"{name}_v{version}.pkl")
+            conn.execute(
+                f"INSERT INTO {MODELS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    name, version, path, kind or type(model).__name__,
+                    json.dumps(list(feature_cols)), target_col, source_table, table_version,
+                    json.dumps(metrics or {}, default=str), json.dumps(params or {}, default=str),
+                    sklearn.__version__, ARTIFACT_FORMAT, size, time.time(),
+                ),
+            )
+            os.replace(tmp, path)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        if own_conn:
+            conn.close()
+    return version, path
+
+# Registry entries, newest first, optionally for one model name
+def list_models(name=None, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_models_table(conn)
+        sql = f"SELECT * FROM {MODELS_TABLE}"
+        params = ()
+        if name is not None:
+            sql += " WHERE name = ?"
+            params = (name,)
+        cursor = conn.execute(sql + " ORDER BY created_at DESC", params)
+        names = [d[0] for d in cursor.description]
+        entries = [_decode(dict(zip(names, row))) for row in cursor.fetchall()]
+    finally:
+        if own_conn:
+            conn.close()
+    return entries
+
+# One registry entry; the latest version when version is None
+def get_model_entry(name, version=None, conn=None):
+    entries = list_models(name, conn)
+    if version is not None:
+        entries = [e for e in entries if e["version"] == version]
+    else:
+        entries = sorted(entries, key=lambda e: e["version"], reverse=True)
+    return entries[0] if entries else None
+
+# Load an artifact from disk through the LRU cache. Arrays the estimator keeps
+# as plain ndarrays (linear-model coefficients, scaler statistics) stay
+# memory-mapped read-only and are shared between processes loading the same
+# file. Tree ensembles are not: sklearn's Tree copies its node and value arrays
+# into its own buffers on unpickling, so each process holds a private copy and
+# only the in-process cache saves repeat loads.
+def load_artifact(path):
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _model_cache_lock:
+        if key in _model_cache:
+            _model_cache.move_to_end(key)
+            return _model_cache[key]
+    artifact = normalize_artifact(joblib.load(path, mmap_mode="r"))
+    with _model_cache_lock:
+        _model_cache[key] = artifact
+        while len(_model_cache) > MODEL_CACHE_SIZE:
+            _model_cache.popitem(last=False)
+    return artifact
+
+# Load a registered model as {"pipeline", "feature_cols", "target_col", "entry"}
+def load_model(name, version=None):
+    entry = get_model_entry(name, version)
+    if entry is None:
+        raise KeyError(f"No registered model named {name!r}" + (f" with version {version}" if version else ""))
+    return {**load_artifact(entry["path"]), "entry": entry}
+
+def clear_model_cache():
+    with _model_cache_lock:
+        _model_cache.clear()
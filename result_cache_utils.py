@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import pyarrow as pa
+
+import shared_utils
+
+# Disk-backed result cache shared by every process serving the same database.
+# Results are uncompressed Arrow IPC files keyed by (table, table version,
+# kind, normalized spec) and are read back memory-mapped, so sessions and
+# server processes reading the same result share the OS page cache instead of
+# each holding a private copy. A write to a table bumps its version, which
+# makes its old results unreachable; bump_table_version also deletes them.
+
+# Total size of cached results across processes (override with DATOS_RESULT_CACHE_MB; 0 disables)
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("DATOS_RESULT_CACHE_MB", "2048")) * 1024 * 1024)
+# Where result files live (default: .datos_cache next to the database file)
+RESULT_CACHE_DIR = os.environ.get("DATOS_RESULT_CACHE_DIR")
+# Table reads smaller than this stay in the in-process cache only
+RESULT_CACHE_MIN_BYTES = 256 * 1024
+
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+def _root():
+    db = os.path.abspath(shared_utils.DB_FILE)
+    return RESULT_CACHE_DIR or os.path.join(os.path.dirname(db), ".datos_cache")
+
+# One directory per database file; the inode is part of the name so a
+# replaced database never sees the previous file's results
+def _db_dir():
+    db = os.path.abspath(shared_utils.DB_FILE)
+    try:
+        inode = os.stat(db).st_ino
+    except OSError:
+        inode = 0
+    return os.path.join(_root(), hashlib.sha1(f"{db}\x00{inode}".encode("utf-8")).hexdigest()[:16])
+
+def _table_dir(table_name):
+    return os.path.join(_db_dir(), hashlib.sha1(str(table_name).encode("utf-8")).hexdigest()[:16])
+
+def _path(table_name, version, kind, spec):
+    key = hashlib.sha1(json.dumps([kind, spec], sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+    return os.path.join(_table_dir(table_name), f"v{version}_{kind}_{key}.arrow")
+
+# Memory-mapped read; numeric columns without nulls stay backed by the file
+def _read(path):
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+def _write(path, df):
+    table = pa.Table.from_pandas(df)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        # Readers in other processes see either no file or the complete one
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return os.path.getsize(path)
+
+def _result_files():
+    files = []
+    for dirpath, _, names in os.walk(_root()):
+        for name in names:
+            if name.endswith(".arrow"):
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+    return files
+
+# Delete least recently used results until the cache fits its budget.
+# Files another process still has mapped stay readable until it lets go.
+def _evict_to_budget():
+    files = sorted(_result_files())
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= RESULT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            _count("evictions")
+        except FileNotFoundError:
+            pass
+        total -= size
+
+# The result for (table, version, kind, spec) from disk, or compute() it and
+# store it. spec must be JSON-serializable and describe the result fully.
+# Returns a memory-mapped frame whenever the result is (or could be) stored,
+# so it is read-only (copy before writing into it). Results smaller than
+# min_bytes are not stored.
+def cached_result(table_name, version, kind, spec, compute, min_bytes=0):
+    if RESULT_CACHE_MAX_BYTES <= 0:
+        return compute()
+    path = _path(table_name, version, kind, spec)
+    try:
+        df = _read(path)
+        os.utime(path)
+        _count("hits")
+        return df
+    except FileNotFoundError:
+        pass
+    except (OSError, pa.ArrowInvalid):
+        # A corrupt file (e.g. disk full mid-write elsewhere) is just recomputed
+        _remove(path)
+    _count("misses")
+
+    df = compute()
+    if int(df.memory_usage(deep=True).sum()) < min_bytes:
+        return df
+    try:
+        size = _write(path, df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Mixed-type object columns have no Arrow type; keep them uncached
+        return df
+    except OSError:
+        return df
+    _count("writes")
+    if size > RESULT_CACHE_MAX_BYTES:
+        _remove(path)
+        return df
+    _evict_to_budget()
+    try:
+        return _read(path)
+    except (OSError, pa.ArrowInvalid):
+        return df
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Delete a table's results from versions other than keep_version (called when it is written)
+def drop_results(table_name, keep_version=None):
+    table_dir = _table_dir(table_name)
+    try:
+        names = os.listdir(table_dir)
+    except FileNotFoundError:
+        return
+    keep = f"v{keep_version}_" if keep_version is not None else None
+    for name in names:
+        if keep is None or not name.startswith(keep):
+            _remove(os.path.join(table_dir, name))
+
+# Delete every stored result of every database under the cache directory
+def clear_results():
+    for _, _, path in _result_files():
+        _remove(path)
+
+# Change the shared cache budget for this process (0 turns the cache off)
+def set_result_cache_budget(max_bytes):
+    global RESULT_CACHE_MAX_BYTES
+    RESULT_CACHE_MAX_BYTES = int(max_bytes)
+    if RESULT_CACHE_MAX_BYTES > 0:
+        _evict_to_budget()
+
+# This process's hit/miss/write/eviction counters plus the cache's size on disk
+def result_cache_stats():
+    files = _result_files()
+    with _stats_lock:
+        return {
+            **_stats,
+            "files": len(files),
+            "bytes": sum(size for _, size, _ in files),
+            "budget_bytes": RESULT_CACHE_MAX_BYTES,
+        }
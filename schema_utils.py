@@ -0,0 +1,199 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from shared_utils import INTERNAL_PREFIX, get_connection, get_table_version, quote_table, partition_condition
+
+# Optional: reads straight into Arrow without building Python row tuples
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+SCHEMA_TABLE = f"{INTERNAL_PREFIX}dtype_schema"
+
+# Text columns become categoricals when distinct values are at most this share of the rows
+CATEGORY_MAX_RATIO = 0.5
+# Real columns are stored as float32 when every value is within +/- this bound
+# and has at most FLOAT32_MAX_DECIMALS decimals, so 7 significant digits hold it exactly
+FLOAT32_MAX_ABS = 1e4
+FLOAT32_MAX_DECIMALS = 2
+# Significant digits kept when float32 columns are written back as REAL
+FLOAT32_DIGITS = 7
+
+# (table, version) -> {column: dtype}; schemas only change when the version does
+_schema_cache = {}
+_schema_lock = threading.Lock()
+
+def _ensure_schema_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+        "table_name TEXT NOT NULL, column_name TEXT NOT NULL, dtype TEXT NOT NULL, "
+        "PRIMARY KEY (table_name, column_name))"
+    )
+
+def _int_dtype(lo, hi, nullable):
+    for bits in (8, 16, 32):
+        info = np.iinfo(f"int{bits}")
+        if info.min <= lo and hi <= info.max:
+            return f"Int{bits}" if nullable else f"int{bits}"
+    return "Int64" if nullable else "int64"
+
+# Real columns (from catalog rows) that fit float32 without losing digits.
+# With partitions (see mark_table_written) only columns already float32 are
+# candidates and only the rewritten rows are checked; the rest were checked before.
+def _float32_columns(table_name, catalog, conn, partitions=None, previous=None):
+    candidates = [
+        col for col, row in catalog.iterrows()
+        if row["dtype"] == "float64" and row["null_count"] < row["row_count"]
+        and max(abs(row["min_value"]), abs(row["max_value"])) <= FLOAT32_MAX_ABS
+    ]
+    where = ""
+    if partitions is not None:
+        candidates = [col for col in candidates if (previous or {}).get(col) == "float32"]
+        where = f" WHERE {partition_condition(partitions, conn, table_name)}"
+    if not candidates:
+        return set()
+    exprs = [
+        f"COALESCE(SUM(ROUND({quote_table(c)}, {FLOAT32_MAX_DECIMALS}) != {quote_table(c)}), 0)" for c in candidates
+    ]
+    inexact = conn.execute(f"SELECT {', '.join(exprs)} FROM {quote_table(table_name)}{where}").fetchone()
+    return {col for col, n in zip(candidates, inexact) if n == 0}
+
+# Compact dtype for one catalog row; None keeps whatever read_sql produces
+def _compact_dtype(row, float32_ok):
+    non_null = row["row_count"] - row["null_count"]
+    if non_null <= 0:
+        return None
+    if row["dtype"] == "int64":
+        return _int_dtype(row["min_value"], row["max_value"], row["null_count"] > 0)
+    if row["dtype"] == "float64":
+        return "float32" if float32_ok else None
+    if row["dtype"] == "object" and row["distinct_count"] <= CATEGORY_MAX_RATIO * non_null:
+        return "category"
+    return None
+
+# Types SQLite can't represent, taken from the DataFrame that was written
+def _hinted_dtype(dtype, row):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean" if row["null_count"] else "bool"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime64[ns]"
+    return None
+
+# Hints stay valid across rewrites as long as the stored values still fit them
+def _hint_still_fits(dtype, row):
+    if dtype in ("bool", "boolean"):
+        return row["dtype"] == "int64" and row["min_value"] in (0, 1) and row["max_value"] in (0, 1)
+    if dtype == "datetime64[ns]":
+        return row["dtype"] == "object"
+    return False
+
+# Record the intended dtype of every column (called from mark_table_written).
+# source_dtypes: dtypes of the DataFrame just written, when there is one;
+# partitions: the (season, week) pairs rewritten in place, if that is all that changed.
+def refresh_schema(table_name, conn=None, source_dtypes=None, partitions=None):
+    from catalog_utils import get_catalog
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_schema_table(conn)
+        previous = dict(conn.execute(
+            f"SELECT column_name, dtype FROM {SCHEMA_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall())
+        catalog = get_catalog(table_name, conn)
+        float32_ok = _float32_columns(table_name, catalog, conn, partitions, previous)
+        schema = {}
+        for col, row in catalog.iterrows():
+            dtype = None
+            if source_dtypes is not None and col in source_dtypes:
+                dtype = _hinted_dtype(source_dtypes[col], row)
+            elif _hint_still_fits(previous.get(col), row):
+                dtype = previous[col]
+            dtype = dtype or _compact_dtype(row, col in float32_ok)
+            if dtype is not None:
+                schema[col] = dtype
+
+        conn.execute(f"DELETE FROM {SCHEMA_TABLE} WHERE table_name = ?", (table_name,))
+        conn.executemany(
+            f"INSERT INTO {SCHEMA_TABLE} VALUES (?, ?, ?)", [(table_name, c, d) for c, d in schema.items()]
+        )
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    return schema
+
+# Recorded dtypes for a table ({} for tables never written through mark_table_written)
+def get_schema(table_name, conn=None, version=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        version = get_table_version(table_name, conn) if version is None else version
+        with _schema_lock:
+            if (table_name, version) in _schema_cache:
+                return _schema_cache[(table_name, version)]
+        _ensure_schema_table(conn)
+        schema = dict(conn.execute(
+            f"SELECT column_name, dtype FROM {SCHEMA_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall())
+    finally:
+        if own_conn:
+            conn.close()
+    with _schema_lock:
+        _schema_cache[(table_name, version)] = schema
+    return schema
+
+# Cast a freshly read frame to its recorded dtypes. Columns whose values no
+# longer fit (e.g. the table was changed outside Datos) are left as read.
+def apply_schema(df, schema):
+    for col, dtype in schema.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        try:
+            if dtype.startswith("datetime"):
+                # to_datetime picks a resolution from the strings; the recorded one keeps reads consistent
+                df[col] = pd.to_datetime(df[col]).astype(dtype)
+            elif dtype in ("bool", "boolean"):
+                df[col] = df[col].astype("Int8").astype(dtype)
+            else:
+                df[col] = df[col].astype(dtype)
+        except (TypeError, ValueError, OverflowError):
+            continue
+    return df
+
+# Query db_file through ADBC into Arrow, dictionary-encoding category columns
+# before pandas sees them. None when ADBC is unavailable or can't type a column
+# (mixed storage classes), so the caller falls back to sqlite3.
+def read_sql_arrow(db_file, sql, params, schema):
+    if adbc_sqlite is None:
+        return None
+    try:
+        with adbc_sqlite.connect(db_file) as conn, conn.cursor() as cur:
+            cur.execute(sql, list(params))
+            table = cur.fetch_arrow_table()
+    except adbc_sqlite.Error:
+        return None
+    for i, name in enumerate(table.column_names):
+        if schema.get(name) == "category":
+            table = table.set_column(i, name, table.column(i).dictionary_encode())
+    return table.to_pandas()
+
+# float32 columns widened back to float64 for writing, rounded to the digits
+# float32 actually holds so 12.34 is stored as 12.34 and not 12.340000152587891
+def widen_for_storage(df):
+    narrow = [col for col, dtype in df.dtypes.items() if dtype == "float32"]
+    if not narrow:
+        return df
+    df = df.copy(deep=False)
+    for col in narrow:
+        values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            magnitude = np.floor(np.log10(np.abs(values)))
+        scale = 10.0 ** (FLOAT32_DIGITS - 1 - np.nan_to_num(magnitude, nan=0.0, posinf=0.0, neginf=0.0))
+        df[col] = np.round(values * scale) / scale
+    return df
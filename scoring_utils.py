@@ -0,0 +1,214 @@
+import itertools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from shared_utils import (
+    get_connection, mark_table_written, staging_table_name, swap_in_table, drop_staging_table,
+)
+from write_utils import write_slot
+from ingest_utils import SCHEMA_SAMPLE_CHUNKS, read_upload_chunks, infer_sqlite_schema
+from registry_utils import load_artifact
+from feature_store_utils import attach_features, key_columns
+
+OUTPUT_FORMATS = ["parquet", "csv", "sqlite"]
+# The page reads "path on server" feature files from DATA_DIR and writes output
+# files under SCORES_DIR (override with DATOS_DATA_DIR / DATOS_SCORES_DIR)
+DATA_DIR = os.environ.get("DATOS_DATA_DIR", "data")
+SCORES_DIR = os.environ.get("DATOS_SCORES_DIR", "predictions")
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Resolve a user-supplied path inside base_dir. Absolute paths and anything
+# that still lands outside base_dir once resolved (.., symlinks) are rejected.
+def resolve_under(base_dir, relative_path):
+    if os.path.isabs(relative_path) or os.path.splitdrive(relative_path)[0]:
+        raise ValueError(f"Give a path relative to {base_dir}/, not an absolute path.")
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, relative_path))
+    if path == base or os.path.commonpath([base, path]) != base:
+        raise ValueError(f"{relative_path!r} is outside {base_dir}/.")
+    return path
+
+# Per-process model loaded by the pool initializer. Only ndarray-backed
+# estimators share the artifact's pages (see load_artifact); forests are
+# copied into each worker.
+_worker_artifact = None
+
+def _init_worker(model_path):
+    global _worker_artifact
+    _worker_artifact = load_artifact(model_path)
+    # Parallelism comes from the pool; a model fitted with n_jobs > 1 would oversubscribe
+    if "n_jobs" in _worker_artifact["pipeline"].get_params():
+        _worker_artifact["pipeline"].set_params(n_jobs=1)
+
+def _predict_chunk(X):
+    return np.asarray(_worker_artifact["pipeline"].predict(X))
+
+# Input columns pinned for a Parquet file, whose schema is fixed by its first
+# chunk: types come from the first chunks (as in ingest) and are widened so
+# later chunks still fit. Integers go to float64, since read_csv turns them into
+# floats in any chunk with fractions or gaps; text and all-empty columns to string.
+def _pin_column(series, sql_type):
+    if sql_type == "TEXT":
+        return series.astype(str).where(series.notna(), None)
+    values = pd.to_numeric(series, errors="coerce")
+    if (values.isna() & series.notna()).any():
+        raise ValueError(
+            f"Column {series.name!r} holds text after {SCHEMA_SAMPLE_CHUNKS} numeric chunks; "
+            "write CSV or SQLite output, or convert the column before scoring."
+        )
+    return values.astype("float64")
+
+# Appends scored chunks to a Parquet file, CSV file or SQLite table.
+# column_types: {column: SQLite type} of the input, used to pin Parquet columns.
+class _ScoreWriter:
+    def __init__(self, output_format, output, column_types=None):
+        self.output_format = output_format
+        self.output = output
+        self.column_types = column_types or {}
+        self._parquet = None
+        self._conn = None
+        self._staging = None
+        self._first = True
+
+    def write(self, chunk):
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            pinned = {c: _pin_column(chunk[c], t) for c, t in self.column_types.items() if c in chunk.columns}
+            table = pa.Table.from_pandas(chunk.assign(**pinned), preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.output, table.schema)
+            elif table.schema != self._parquet.schema:
+                table = table.cast(self._parquet.schema)
+            self._parquet.write_table(table)
+        elif self.output_format == "csv":
+            chunk.to_csv(self.output, mode="w" if self._first else "a", header=self._first, index=False)
+        else:
+            if self._conn is None:
+                # Rows go to a private staging table that is swapped in at the end
+                self._conn = get_connection()
+                self._staging = staging_table_name(self.output)
+            # The write slot is taken per chunk, so page saves can run between chunks
+            with write_slot(f"score {self.output}"):
+                chunk.to_sql(self._staging, self._conn, if_exists="append", index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._conn is not None:
+            try:
+                with write_slot(f"score {self.output}"):
+                    try:
+                        swap_in_table(self._staging, self.output, self._conn)
+                    except BaseException:
+                        drop_staging_table(self._staging, self._conn)
+                        raise
+                    mark_table_written(self.output, self._conn)
+            finally:
+                self._conn.close()
+
+    # Drop a partly written staging table after a failed run
+    def abort(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._conn is not None:
+            try:
+                with write_slot(f"score {self.output}"):
+                    drop_staging_table(self._staging, self._conn)
+            finally:
+                self._conn.close()
+
+# Columns a feature file must provide: the model's raw features, plus the
+# keys its feature-store features are looked up by
+def input_columns(artifact):
+    store = artifact.get("feature_store")
+    if not store:
+        return list(artifact["feature_cols"])
+    raw = [c for c in artifact["feature_cols"] if c not in store["features"]]
+    return list(dict.fromkeys(raw + key_columns(store["table"], store["features"])))
+
+# Stream a feature file through a saved model in chunks and write the
+# predictions incrementally. Feature-store features the model was trained on
+# are looked up per chunk by (entity, season, week). With workers > 0 chunks
+# are scored in a process pool; at most 2 x workers chunks are in flight, so
+# memory stays bounded.
+# progress(rows_scored, elapsed_seconds) is called per chunk.
+def score_file(model_path, file, file_name, output, output_format="parquet", workers=0,
+               chunk_rows=DEFAULT_CHUNK_ROWS, keep_columns=True, progress=None):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    artifact = load_artifact(model_path)
+    feature_cols, target_col = artifact["feature_cols"], artifact["target_col"]
+    prediction_col = f"Predicted_{target_col}"
+    required = input_columns(artifact)
+    store = artifact.get("feature_store")
+    store_conn = get_connection() if store else None
+
+    started = time.perf_counter()
+    chunks = read_upload_chunks(file, file_name, chunk_rows)
+    column_types = None
+    # Parquet inputs already have one schema for every row group
+    if output_format == "parquet" and keep_columns and not file_name.lower().endswith(".parquet"):
+        sample = list(itertools.islice(chunks, SCHEMA_SAMPLE_CHUNKS))
+        column_types = infer_sqlite_schema(sample)
+        chunks = itertools.chain(sample, chunks)
+    writer = _ScoreWriter(output_format, output, column_types)
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(model_path,)) if workers else None
+    pending = deque()
+    rows = 0
+    header = required
+
+    def finish(chunk, predictions):
+        nonlocal rows
+        out = chunk if keep_columns else chunk[[]]
+        out = out.assign(**{prediction_col: predictions})
+        writer.write(out)
+        rows += len(out)
+        if progress is not None:
+            progress(rows, time.perf_counter() - started)
+
+    try:
+        for chunk in chunks:
+            missing = [c for c in required if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing required columns: {missing}")
+            if chunk.empty:
+                header = chunk.columns
+                continue
+            if store:
+                chunk = attach_features(chunk, store["table"], store["features"], store_conn, store.get("definitions"))
+            X = chunk.reindex(columns=feature_cols)
+            if pool is None:
+                finish(chunk, artifact["pipeline"].predict(X))
+                continue
+            pending.append((chunk, pool.submit(_predict_chunk, X)))
+            # Write in input order; block on the oldest chunk once the window is full
+            while len(pending) >= 2 * workers:
+                done_chunk, future = pending.popleft()
+                finish(done_chunk, future.result())
+        while pending:
+            done_chunk, future = pending.popleft()
+            finish(done_chunk, future.result())
+        if not rows:
+            # An empty input still gets an output: its header plus the prediction column
+            columns = list(dict.fromkeys([*header, *(store["features"] if store else [])])) if keep_columns else []
+            writer.write(pd.DataFrame(columns=columns).assign(**{prediction_col: pd.Series(dtype="float64")}))
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if store_conn is not None:
+            store_conn.close()
+    writer.close()
+
+    seconds = time.perf_counter() - started
+    return {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else 0.0, "output": output}
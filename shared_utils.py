@@ -1,12 +1,324 @@
+import hashlib
+import os
 import sqlite3
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+import perf_utils
+from write_utils import write_slot
 
 # Global DB file path
 DB_FILE = "universal_data.db"
 
-# Simple connection function
+# Internal bookkeeping tables share this prefix and are hidden from table pickers
+INTERNAL_PREFIX = "_datos_"
+VERSIONS_TABLE = f"{INTERNAL_PREFIX}table_versions"
+
+# Seconds a connection waits on another process's write lock (override with DATOS_BUSY_TIMEOUT)
+BUSY_TIMEOUT_SECONDS = float(os.environ.get("DATOS_BUSY_TIMEOUT", "30"))
+# Rows per committed batch when filling a staging table
+WRITE_CHUNK_ROWS = 50_000
+
+# In-process table cache budget (override with DATOS_CACHE_MB)
+CACHE_MAX_BYTES = int(float(os.environ.get("DATOS_CACHE_MB", "1024")) * 1024 * 1024)
+
+_table_cache = OrderedDict()
+_cache_bytes = 0
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_cache_lock = threading.Lock()
+_wal_files = set()
+
+# Simple connection function (traced while a diagnostics trace is recording).
+# The database is switched to WAL once per process so readers never wait on
+# a writer; WAL is persistent, NORMAL sync is per connection.
 def get_connection():
-    return sqlite3.connect(DB_FILE)
+    if perf_utils.active():
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_SECONDS, factory=perf_utils.TracedConnection)
+    else:
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_SECONDS)
+    if DB_FILE not in _wal_files:
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_files.add(DB_FILE)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
 
 # Clean table quoting for dynamic queries
 def quote_table(table_name):
-    return f'"{table_name}"'
+    return '"' + str(table_name).replace('"', '""') + '"'
+
+# User-visible tables (internal bookkeeping tables excluded)
+def list_tables(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    return [name for (name,) in rows if not name.startswith(INTERNAL_PREFIX) and not name.startswith("sqlite_")]
+
+def _ensure_versions_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} ("
+        "table_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+    )
+
+# Current write version of a table (0 if it was never written through save_table)
+def get_table_version(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_versions_table(conn)
+        row = conn.execute(
+            f"SELECT version FROM {VERSIONS_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchone()
+    finally:
+        if own_conn:
+            conn.close()
+    return row[0] if row else 0
+
+# Mark a table as rewritten so every cached copy of it goes stale
+def bump_table_version(table_name, conn=None):
+    from result_cache_utils import drop_results
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_versions_table(conn)
+        conn.execute(
+            f"INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (?, 1) "
+            "ON CONFLICT(table_name) DO UPDATE SET version = version + 1",
+            (table_name,),
+        )
+        conn.commit()
+        version = conn.execute(
+            f"SELECT version FROM {VERSIONS_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchone()[0]
+    finally:
+        if own_conn:
+            conn.close()
+    invalidate_table_cache(table_name)
+    drop_results(table_name, keep_version=version)
+    return version
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+def _evict_to_budget():
+    global _cache_bytes
+    while _table_cache and _cache_bytes > CACHE_MAX_BYTES:
+        _, (_, size) = _table_cache.popitem(last=False)
+        _cache_bytes -= size
+        _cache_stats["evictions"] += 1
+
+# Cached table loader keyed by (table, version, columns, filter); treat the result as read-only.
+# Misses go to the shared on-disk result cache (see result_cache_utils) before storage.
+# filters: a universal filter spec (see query_utils.build_where_clause) instead of
+# where/params; the parquet backend (see storage_utils) can push it down.
+def load_table(table_name, columns=None, where=None, params=(), limit=None, conn=None, filters=None):
+    if filters is not None:
+        from query_utils import build_where_clause
+
+        where, params = build_where_clause(filters)
+    with perf_utils.span("load_table", table=table_name, where=where, limit=limit):
+        df = _load_table(table_name, columns, where, params, limit, conn, filters)
+    perf_utils.record_frame(table_name, df)
+    return df
+
+def _load_table(table_name, columns=None, where=None, params=(), limit=None, conn=None, filters=None):
+    from result_cache_utils import RESULT_CACHE_MIN_BYTES, cached_result
+
+    # Raw SQL conditions can only run in SQLite
+    pushdown = filters if filters is not None else (None if where else {})
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        version = get_table_version(table_name, conn)
+        key = (table_name, version, tuple(columns) if columns else None, where or None, tuple(params), limit)
+        with _cache_lock:
+            if key in _table_cache:
+                _table_cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return _table_cache[key][0]
+            _cache_stats["misses"] += 1
+
+        select_cols = ", ".join(quote_table(c) for c in columns) if columns else "*"
+        sql = f"SELECT {select_cols} FROM {quote_table(table_name)}"
+        if where:
+            sql += f" WHERE {where}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        spec = {"columns": list(columns) if columns else None, "where": where or None, "params": list(params), "limit": limit}
+        df = cached_result(
+            table_name, version, "table", spec,
+            lambda: _read_rows(table_name, columns, pushdown, limit, sql, params, version, conn, own_conn),
+            min_bytes=RESULT_CACHE_MIN_BYTES,
+        )
+    finally:
+        if own_conn:
+            conn.close()
+
+    global _cache_bytes
+    size = _frame_bytes(df)
+    with _cache_lock:
+        if size <= CACHE_MAX_BYTES and key not in _table_cache:
+            _table_cache[key] = (df, size)
+            _cache_bytes += size
+            _evict_to_budget()
+    return df
+
+# Rows for load_table: from the table's Parquet dataset when the parquet
+# backend has a current one and the filters can be pushed down, else SQLite.
+# LIMIT reads stay on SQLite so they return the same rows on either backend.
+def _read_rows(table_name, columns, filters, limit, sql, params, version, conn, own_conn):
+    from storage_utils import read_dataset
+
+    if filters is not None and limit is None:
+        df = read_dataset(table_name, version, columns, filters, conn)
+        if df is not None:
+            return df
+    return _read_sql_compact(table_name, sql, params, version, conn, arrow=own_conn)
+
+# Read a query and restore the table's recorded dtypes (see schema_utils).
+# With the optional adbc-driver-sqlite package the rows go straight into Arrow
+# and become categoricals there; otherwise sqlite3 rows are cast after the read.
+# A caller's connection may hold uncommitted writes, so only our own reads use Arrow.
+def _read_sql_compact(table_name, sql, params, version, conn, arrow=False):
+    from schema_utils import apply_schema, get_schema, read_sql_arrow
+
+    schema = get_schema(table_name, conn, version)
+    df = read_sql_arrow(DB_FILE, sql, params, schema) if arrow else None
+    if df is None:
+        df = pd.read_sql(sql, conn, params=list(params))
+    return apply_schema(df, schema)
+
+# Drop cached frames for one table (or everything)
+def invalidate_table_cache(table_name=None):
+    global _cache_bytes
+    with _cache_lock:
+        for key in list(_table_cache):
+            if table_name is None or key[0] == table_name:
+                _, size = _table_cache.pop(key)
+                _cache_bytes -= size
+
+# Change the cache memory budget at runtime
+def set_cache_budget(max_bytes):
+    global CACHE_MAX_BYTES
+    with _cache_lock:
+        CACHE_MAX_BYTES = int(max_bytes)
+        _evict_to_budget()
+
+# Hit/miss/eviction counters plus current footprint
+def cache_stats():
+    with _cache_lock:
+        return {
+            **_cache_stats,
+            "entries": len(_table_cache),
+            "bytes": _cache_bytes,
+            "budget_bytes": CACHE_MAX_BYTES,
+        }
+
+# Post-write maintenance shared by every write path (pages, ingest, fusion).
+# source_dtypes: dtypes of the written DataFrame, to remember bool/datetime columns.
+# partitions: (season, week) pairs rewritten in place when the rest of the table
+# is untouched (incremental fusion); the dtype check, feature stores and Parquet
+# dataset then only revisit those. The catalog and text indexes are rebuilt in full.
+def mark_table_written(table_name, conn=None, source_dtypes=None, partitions=None):
+    from catalog_utils import refresh_catalog
+    from aggregate_utils import drop_rollups
+    from schema_utils import refresh_schema
+    from text_index_utils import refresh_text_indexes
+    from feature_store_utils import refresh_features
+    from storage_utils import refresh_dataset
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        with write_slot(f"index {table_name}"):
+            version = bump_table_version(table_name, conn)
+            refresh_catalog(table_name, conn)
+            refresh_schema(table_name, conn, source_dtypes, partitions=partitions)
+            refresh_text_indexes(table_name, conn)
+            drop_rollups(table_name, conn)
+            refresh_features(table_name, conn, partitions=partitions)
+            refresh_dataset(table_name, conn, partitions=partitions)
+    finally:
+        if own_conn:
+            conn.close()
+    return version
+
+# SQL condition matching the rows of table_name in the given (season, week)
+# partitions, NULL keys included; alias qualifies rowid (e.g. "t0."). Written
+# as a rowid lookup so a (season, week) index serves it. The pairs are loaded
+# into a temp table on conn, so the condition is only valid on that connection.
+def partition_condition(partitions, conn, table_name, alias=""):
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS datos_changed_partitions (season, week)")
+    conn.execute("DELETE FROM temp.datos_changed_partitions")
+    conn.executemany("INSERT INTO temp.datos_changed_partitions VALUES (?, ?)", list(partitions))
+    return (
+        f"{alias}rowid IN (SELECT p.rowid FROM temp.datos_changed_partitions AS c "
+        f"JOIN {quote_table(table_name)} AS p ON p.season IS c.season AND p.week IS c.week)"
+    )
+
+# Private name for building a new copy of a table before it is swapped in
+def staging_table_name(table_name):
+    digest = hashlib.sha1(str(table_name).encode("utf-8")).hexdigest()[:12]
+    return f"{INTERNAL_PREFIX}staging_{digest}_{uuid.uuid4().hex[:8]}"
+
+# Replace table_name with a fully built staging table in one short transaction;
+# readers see either the old table or the new one, never neither
+def swap_in_table(staging, table_name, conn):
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_table(table_name)}")
+        conn.execute(f"ALTER TABLE {quote_table(staging)} RENAME TO {quote_table(table_name)}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+# Drop a staging table left behind by a failed write
+def drop_staging_table(staging, conn):
+    if conn.in_transaction:
+        conn.rollback()
+    conn.execute(f"DROP TABLE IF EXISTS {quote_table(staging)}")
+    conn.commit()
+
+# Single save path for every page: build the new table in staging (committing
+# every WRITE_CHUNK_ROWS rows), swap it in and mark it written. Saves queue
+# in the write slot; progress(rows_written, total_rows) and
+# on_wait(queue_position, waited_seconds) report on long saves.
+def save_table(df, table_name, conn=None, progress=None, on_wait=None):
+    from schema_utils import widen_for_storage
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        with write_slot(f"save {table_name}", on_wait=on_wait):
+            staging = staging_table_name(table_name)
+            out = widen_for_storage(df)
+            try:
+                out.iloc[:0].to_sql(staging, conn, index=False)
+                for start in range(0, len(out), WRITE_CHUNK_ROWS):
+                    out.iloc[start:start + WRITE_CHUNK_ROWS].to_sql(staging, conn, if_exists="append", index=False)
+                    if progress is not None:
+                        progress(min(start + WRITE_CHUNK_ROWS, len(out)), len(out))
+                swap_in_table(staging, table_name, conn)
+            except BaseException:
+                drop_staging_table(staging, conn)
+                raise
+            mark_table_written(table_name, conn, df.dtypes)
+    finally:
+        if own_conn:
+            conn.close()
@@ -0,0 +1,401 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import perf_utils
+import shared_utils
+from shared_utils import INTERNAL_PREFIX, get_connection, list_tables, get_table_version
+from query_utils import table_columns
+from write_utils import write_slot
+
+# Columnar storage for table reads. SQLite stays the system of record (SQL
+# aggregates, text indexes, rollups and the feature store all run there); with
+# the "parquet" backend every write also exports the table to a Parquet
+# dataset partitioned by season, and load_table reads that instead: only the
+# requested columns, with the universal filters pushed down so whole seasons
+# and row groups (by their min/max statistics) are skipped, partitions read
+# in parallel. Reads fall back to SQLite whenever a table has no current dataset.
+
+STORAGE_BACKENDS = ["sqlite", "parquet"]
+# Backend for table reads (override with DATOS_STORAGE)
+STORAGE_BACKEND = os.environ.get("DATOS_STORAGE", "sqlite")
+# Where datasets live (default: <database name>_parquet next to the database file)
+PARQUET_DIR = os.environ.get("DATOS_PARQUET_DIR")
+# Tables with this column get one directory per value
+PARTITION_COLUMN = "season"
+# Rows per Parquet row group, the unit min/max statistics skip
+ROW_GROUP_ROWS = 64 * 1024
+# Partitions scanned concurrently
+PARALLEL_PARTITIONS = max(4, os.cpu_count() or 1)
+
+DATASETS_TABLE = f"{INTERNAL_PREFIX}parquet_datasets"
+# SQLite rowid, stored so reads return rows in table order across partitions
+ROW_COLUMN = f"{INTERNAL_PREFIX}row"
+# Full dataset schema (column order, category columns) stored next to the data files
+SCHEMA_FILE = "_common_metadata"
+# Directory pyarrow's hive partitioning uses for a NULL partition value
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+if STORAGE_BACKEND not in STORAGE_BACKENDS:
+    raise ValueError(f"DATOS_STORAGE must be one of {STORAGE_BACKENDS}, not {STORAGE_BACKEND!r}")
+
+def _ensure_datasets_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {DATASETS_TABLE} ("
+        "table_name TEXT PRIMARY KEY, version INTEGER NOT NULL, path TEXT NOT NULL, "
+        "partition_column TEXT, rows INTEGER NOT NULL, bytes INTEGER NOT NULL, created_at REAL NOT NULL)"
+    )
+
+# Switch the read backend for this process
+def set_storage_backend(name):
+    global STORAGE_BACKEND
+    if name not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    STORAGE_BACKEND = name
+
+def _root():
+    if PARQUET_DIR:
+        return PARQUET_DIR
+    return os.path.splitext(os.path.abspath(shared_utils.DB_FILE))[0] + "_parquet"
+
+def _table_dir(table_name):
+    db = os.path.abspath(shared_utils.DB_FILE)
+    return os.path.join(_root(), hashlib.sha1(f"{db}\x00{table_name}".encode("utf-8")).hexdigest()[:16])
+
+# Arrow type for a recorded dtype (see schema_utils) or a catalog dtype label.
+# Categories are written as plain strings (Parquet dictionary-encodes them anyway).
+def _arrow_type(dtype):
+    if dtype == "null":
+        return pa.null()
+    if dtype in ("category", "object"):
+        return pa.string()
+    if dtype in ("bool", "boolean"):
+        return pa.bool_()
+    if dtype.startswith("datetime64"):
+        # SQLite keeps datetimes as text with at most microseconds
+        return pa.timestamp("us")
+    return pa.from_numpy_dtype(np.dtype(dtype.lower()))
+
+# Catalog dtype label; columns without a single non-null value read back as None objects
+def _catalog_dtype(catalog, column):
+    if column not in catalog.index:
+        return "object"
+    row = catalog.loc[column]
+    return "null" if row["null_count"] >= row["row_count"] else row["dtype"]
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+# Hive directory name pyarrow gives one partition value
+def _partition_dir(partition, value):
+    return f"{partition}={HIVE_NULL_PARTITION if value is None else value}"
+
+# Path of the dataset exported for the version just before this one, when its
+# files can be reused as they are (same columns and types)
+def _reusable_dataset(table_name, version, read_schema, conn):
+    row = conn.execute(
+        f"SELECT version, path FROM {DATASETS_TABLE} WHERE table_name = ?", (table_name,)
+    ).fetchone()
+    if row is None or row[0] != version - 1 or not os.path.isdir(row[1]):
+        return None
+    try:
+        previous = pq.read_schema(os.path.join(row[1], SCHEMA_FILE))
+    except (pa.ArrowException, OSError):
+        return None
+    return row[1] if previous.equals(read_schema, check_metadata=True) else None
+
+# Export a table from SQLite to a new Parquet dataset and make it current.
+# partitions: (season, week) pairs rewritten in place (see mark_table_written);
+# when the previous version's dataset has the same schema only the seasons
+# they fall in are written and the other season directories are hard-linked.
+# Returns a summary, or None when a column has no single Arrow type (e.g.
+# numbers and text mixed in one column); the table is then read from SQLite.
+def export_table(table_name, conn=None, partitions=None):
+    from catalog_utils import get_catalog
+    from schema_utils import apply_schema, get_schema
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        started = time.perf_counter()
+        _ensure_datasets_table(conn)
+        version = get_table_version(table_name, conn)
+        columns = table_columns(table_name, conn)
+        catalog = get_catalog(table_name, conn)
+        schema = get_schema(table_name, conn, version)
+        dtypes = {c: schema.get(c) or _catalog_dtype(catalog, c) for c in columns}
+        target = pa.schema([pa.field(c, _arrow_type(d)) for c, d in dtypes.items()] + [pa.field(ROW_COLUMN, pa.int64())])
+        partition = PARTITION_COLUMN if PARTITION_COLUMN in columns else None
+        read_schema = pa.schema([
+            pa.field(c, pa.dictionary(pa.int32(), pa.string()) if d == "category" else _arrow_type(d))
+            for c, d in dtypes.items()
+        ] + [pa.field(ROW_COLUMN, pa.int64())], metadata={b"partition_column": (partition or "").encode("utf-8")})
+        # Casts other than category are applied per chunk so bool/datetime/narrow ints land typed
+        chunk_schema = {c: d for c, d in schema.items() if d != "category"}
+
+        previous = None
+        seasons = None
+        if partitions is not None and partition == "season":
+            previous = _reusable_dataset(table_name, version, read_schema, conn)
+            seasons = {season for season, _ in partitions}
+        where, params = "", []
+        if previous is not None:
+            known = sorted(s for s in seasons if s is not None)
+            conditions = [f"season IN ({', '.join('?' for _ in known)})"] if known else []
+            if None in seasons:
+                conditions.append("season IS NULL")
+            where, params = f" WHERE {' OR '.join(conditions)}", known
+
+        table_dir = _table_dir(table_name)
+        os.makedirs(table_dir, exist_ok=True)
+        tmp = os.path.join(table_dir, f".tmp-{uuid.uuid4().hex[:8]}")
+        os.makedirs(tmp)
+        # write_dataset pulls batches on its own thread, so the reader gets a connection it may share
+        reader = sqlite3.connect(shared_utils.DB_FILE, timeout=shared_utils.BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        rows = 0
+
+        def batches():
+            nonlocal rows
+            select_cols = ", ".join(shared_utils.quote_table(c) for c in columns)
+            sql = f"SELECT {select_cols}, rowid AS {ROW_COLUMN} FROM {shared_utils.quote_table(table_name)}{where}"
+            for chunk in pd.read_sql(sql, reader, params=params, chunksize=shared_utils.WRITE_CHUNK_ROWS):
+                rows += len(chunk)
+                chunk = apply_schema(chunk, chunk_schema)
+                yield from pa.Table.from_pandas(chunk, preserve_index=False).cast(target).to_batches()
+
+        try:
+            with perf_utils.span("parquet export", table=table_name, seasons=None if previous is None else len(seasons)):
+                ds.write_dataset(
+                    batches(), tmp, schema=target, format="parquet",
+                    partitioning=ds.partitioning(pa.schema([target.field(partition)]), flavor="hive") if partition else None,
+                    preserve_order=True, min_rows_per_group=ROW_GROUP_ROWS, max_rows_per_group=ROW_GROUP_ROWS,
+                    existing_data_behavior="overwrite_or_ignore",
+                )
+                if previous is not None:
+                    # Files are never modified once written, so unchanged seasons can share them
+                    rewritten = {_partition_dir(partition, season) for season in seasons}
+                    for name in os.listdir(previous):
+                        if name.startswith((".", "_")) or name in rewritten:
+                            continue
+                        shutil.copytree(os.path.join(previous, name), os.path.join(tmp, name), copy_function=os.link)
+                    rows = conn.execute(f"SELECT COUNT(*) FROM {shared_utils.quote_table(table_name)}").fetchone()[0]
+            pq.write_metadata(read_schema, os.path.join(tmp, SCHEMA_FILE))
+        except (pa.ArrowException, OSError):
+            shutil.rmtree(tmp, ignore_errors=True)
+            drop_dataset(table_name, conn)
+            return None
+        finally:
+            reader.close()
+
+        path = os.path.join(table_dir, f"v{version}-{uuid.uuid4().hex[:8]}")
+        os.rename(tmp, path)
+        size = _dir_bytes(path)
+        # Another process may have rewritten the table meanwhile; its export wins
+        if get_table_version(table_name, conn) != version:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        conn.execute(
+            f"INSERT INTO {DATASETS_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(table_name) DO UPDATE SET version = excluded.version, path = excluded.path, "
+            "partition_column = excluded.partition_column, rows = excluded.rows, bytes = excluded.bytes, "
+            "created_at = excluded.created_at",
+            (table_name, version, path, partition, rows, size, time.time()),
+        )
+        conn.commit()
+        # Older versions go; other processes' in-progress exports (.tmp-*) stay
+        for name in os.listdir(table_dir):
+            if os.path.join(table_dir, name) != path and not name.startswith(".tmp-"):
+                shutil.rmtree(os.path.join(table_dir, name), ignore_errors=True)
+    finally:
+        if own_conn:
+            conn.close()
+    return {
+        "table": table_name, "version": version, "rows": rows, "bytes": size,
+        "partitions": len([n for n in os.listdir(path) if not n.startswith("_")]) if partition else None,
+        "seconds": time.perf_counter() - started,
+    }
+
+# Forget a table's dataset and delete its files
+def drop_dataset(table_name, conn):
+    _ensure_datasets_table(conn)
+    conn.execute(f"DELETE FROM {DATASETS_TABLE} WHERE table_name = ?", (table_name,))
+    conn.commit()
+    shutil.rmtree(_table_dir(table_name), ignore_errors=True)
+
+# Bring a table's dataset up to date after a write (called from mark_table_written).
+# Under the sqlite backend the now stale dataset, if any, is removed.
+# partitions: see export_table.
+def refresh_dataset(table_name, conn=None, partitions=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        if STORAGE_BACKEND != "parquet" or table_name.startswith(INTERNAL_PREFIX):
+            drop_dataset(table_name, conn)
+            return None
+        return export_table(table_name, conn, partitions)
+    finally:
+        if own_conn:
+            conn.close()
+
+# Export every user table that has no current dataset (e.g. after switching
+# a database to the parquet backend). Returns one summary per exported table.
+def export_tables(table_names=None, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_datasets_table(conn)
+        current = dict(conn.execute(f"SELECT table_name, version FROM {DATASETS_TABLE}").fetchall())
+        exported = []
+        for table_name in table_names or list_tables(conn):
+            if current.get(table_name) == get_table_version(table_name, conn):
+                continue
+            with write_slot(f"export {table_name}"):
+                summary = export_table(table_name, conn)
+            exported.append(summary or {"table": table_name, "skipped": "mixed column types"})
+    finally:
+        if own_conn:
+            conn.close()
+    return exported
+
+# pyarrow counterpart of query_utils.build_where_clause (the player_index
+# shortcut isn't needed: the substring test runs on the scanned batches)
+def filter_expression(filters):
+    conditions = []
+
+    season = filters.get("season")
+    if season is not None:
+        lo, hi = season
+        conditions.append((ds.field("season") >= lo) & (ds.field("season") <= hi))
+
+    player_search = filters.get("player_search")
+    if player_search:
+        name = ds.field("player_name").cast(pa.string())
+        conditions.append(pc.match_substring(name, player_search, ignore_case=True))
+
+    player_exact = filters.get("player_exact")
+    if player_exact:
+        conditions.append(ds.field("player_name") == player_exact)
+
+    positions = filters.get("positions")
+    if positions is not None:
+        if filters.get("all_positions"):
+            conditions.append(ds.field("position").is_valid())
+        elif positions:
+            conditions.append(ds.field("position").isin(list(positions)))
+        else:
+            conditions.append(ds.scalar(False))
+
+    for column, (lo, hi) in (filters.get("ranges") or {}).items():
+        conditions.append((ds.field(column) >= lo) & (ds.field(column) <= hi))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+# table -> (path, opened dataset); a dataset's files never change once written
+_open_datasets = {}
+_open_lock = threading.Lock()
+
+def _open_dataset(table_name, path):
+    with _open_lock:
+        cached = _open_datasets.get(table_name)
+    if cached is not None and cached[0] == path:
+        return cached[1]
+    schema = pq.read_schema(os.path.join(path, SCHEMA_FILE))
+    partition = schema.metadata.get(b"partition_column", b"").decode("utf-8")
+    categories = [f.name for f in schema if pa.types.is_dictionary(f.type) and f.name != partition]
+    dataset = ds.dataset(
+        path, schema=schema,
+        format=ds.ParquetFileFormat(read_options=ds.ParquetReadOptions(dictionary_columns=categories)),
+        partitioning=ds.partitioning(pa.schema([schema.field(partition)]), flavor="hive") if partition else None,
+    )
+    with _open_lock:
+        _open_datasets[table_name] = (path, dataset)
+    return dataset
+
+# Filters SQLite answers from an index (text index / player_name B-tree) faster than a scan
+SQLITE_INDEXED_FILTERS = ["player_search", "player_exact"]
+
+# Rows of a table from its Parquet dataset, typed like load_table's SQLite
+# reads. None when the parquet backend is off, the table has no current
+# dataset, or the filters are better (or only) answered by SQLite.
+# LIMIT reads always go to SQLite: its first N rows follow the query plan,
+# which a scan of season partitions can't reproduce.
+def read_dataset(table_name, version, columns=None, filters=None, conn=None):
+    from schema_utils import apply_schema, get_schema
+
+    filters = filters or {}
+    if STORAGE_BACKEND != "parquet" or any(filters.get(k) for k in SQLITE_INDEXED_FILTERS):
+        return None
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_datasets_table(conn)
+        row = conn.execute(
+            f"SELECT version, path FROM {DATASETS_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        schema = get_schema(table_name, conn, version)
+    finally:
+        if own_conn:
+            conn.close()
+    if row is None or row[0] != version:
+        return None
+
+    with perf_utils.span("parquet read", table=table_name):
+        try:
+            dataset = _open_dataset(table_name, row[1])
+            names = list(columns) if columns else [c for c in dataset.schema.names if c != ROW_COLUMN]
+            table = dataset.to_table(
+                columns=names + [ROW_COLUMN],
+                filter=filter_expression(filters),
+                fragment_readahead=PARALLEL_PARTITIONS,
+            )
+            rows = table.column(ROW_COLUMN).to_numpy()
+            if (np.diff(rows) < 0).any():
+                table = table.take(np.argsort(rows, kind="stable"))
+            df = table.drop_columns([ROW_COLUMN]).to_pandas(split_blocks=True, self_destruct=True)
+        except (pa.ArrowException, OSError):
+            # Missing files (a concurrent rewrite deleted them) or a filter
+            # Arrow can't type (e.g. a number compared with a text column)
+            return None
+        # Row-group dictionaries hold values the result may not; keep the
+        # present ones, sorted, as astype("category") on a SQLite read does
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                values = df[col].cat.remove_unused_categories()
+                df[col] = values.cat.reorder_categories(values.cat.categories.sort_values())
+        return apply_schema(df, schema)
+
+# Current datasets with their size, for diagnostics
+def dataset_stats(conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_datasets_table(conn)
+        rows = conn.execute(f"SELECT table_name, version, rows, bytes FROM {DATASETS_TABLE}").fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+    return {
+        "backend": STORAGE_BACKEND,
+        "datasets": len(rows),
+        "rows": sum(r[2] for r in rows),
+        "bytes": sum(r[3] for r in rows),
+    }
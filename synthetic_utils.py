@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Synthetic fantasy-football tables with the schemas the Data Fusion page joins:
+# player_stats -> injuries (player_id, season, week), games / weather (game_id),
+# stadiums (stadium_id). Used by the benchmark suite and for demos.
+
+TEAMS = [f"T{i:02d}" for i in range(32)]
+POSITIONS = ["QB", "RB", "WR", "TE"]
+# Share of rostered skill players by position
+POSITION_WEIGHTS = [0.12, 0.28, 0.40, 0.20]
+WEEKS = 17
+FIRST_SEASON = 2010
+INJURY_RATE = 0.05
+INJURY_STATUSES = ["Questionable", "Doubtful", "Out", "IR"]
+
+def _schedule(seasons, rng):
+    games = []
+    for season in seasons:
+        for week in range(1, WEEKS + 1):
+            order = rng.permutation(len(TEAMS))
+            for g in range(len(TEAMS) // 2):
+                home, away = TEAMS[order[2 * g]], TEAMS[order[2 * g + 1]]
+                games.append((f"{season}_{week:02d}_{away}_{home}", season, week, home, away, int(order[2 * g])))
+    return pd.DataFrame(games, columns=["game_id", "season", "week", "home_team", "away_team", "stadium_id"])
+
+def _player_week(players, games_by_team, season, week, rng):
+    n = len(players)
+    pos = players["position"].to_numpy()
+    is_qb, is_rb = pos == "QB", pos == "RB"
+    is_rec = ~is_qb
+
+    targets = np.where(is_rec, rng.poisson(np.where(pos == "WR", 7, np.where(pos == "TE", 5, 3))), 0)
+    receptions = rng.binomial(targets, 0.65)
+    receiving_yards = np.round(receptions * rng.gamma(4.0, 3.0, n), 1)
+    rushing_yards = np.round(np.where(is_rb, rng.gamma(3.0, 20.0, n), np.where(is_qb, rng.gamma(1.5, 10.0, n), 0.0)), 1)
+    passing_yards = np.round(np.where(is_qb, rng.normal(240, 60, n).clip(0), 0.0), 1)
+    touchdowns = rng.poisson(np.where(is_qb, 1.6, 0.45))
+    interceptions = np.where(is_qb, rng.poisson(0.8, n), 0)
+    fantasy_points_ppr = np.round(
+        passing_yards * 0.04 + (rushing_yards + receiving_yards) * 0.1 + receptions + touchdowns * 6 - interceptions * 2, 2
+    )
+    teams = players["team"].to_numpy()
+    return pd.DataFrame({
+        "player_id": players["player_id"].to_numpy(),
+        "player_name": players["player_name"].to_numpy(),
+        "position": pos,
+        "team": teams,
+        "season": season,
+        "week": week,
+        "game_id": games_by_team.loc[teams].to_numpy(),
+        "passing_yards": passing_yards,
+        "rushing_yards": rushing_yards,
+        "receiving_yards": receiving_yards,
+        "targets": targets,
+        "receptions": receptions,
+        "touchdowns": touchdowns,
+        "interceptions": interceptions,
+        "fantasy_points_ppr": fantasy_points_ppr,
+    })
+
+# Write player_stats, injuries, games, weather and stadiums CSVs to out_dir.
+# `rows` is the approximate player_stats size; player_stats and injuries are
+# written week by week, so memory use stays flat at any scale.
+# Returns {table_name: csv_path}.
+def generate_fantasy_data(out_dir, rows=100_000, seasons=5, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    season_list = list(range(FIRST_SEASON, FIRST_SEASON + seasons))
+    players_per_week = max(len(TEAMS), int(round(rows / (seasons * WEEKS))))
+
+    players = pd.DataFrame({
+        "player_id": np.arange(players_per_week),
+        "player_name": [f"Player {i:06d}" for i in range(players_per_week)],
+        "position": rng.choice(POSITIONS, players_per_week, p=POSITION_WEIGHTS),
+        "team": np.array(TEAMS)[np.arange(players_per_week) % len(TEAMS)],
+    })
+
+    games = _schedule(season_list, rng)
+    paths = {name: os.path.join(out_dir, f"{name}.csv") for name in ["player_stats", "injuries", "games", "weather", "stadiums"]}
+    games.to_csv(paths["games"], index=False)
+    pd.DataFrame({
+        "game_id": games["game_id"],
+        "temperature_f": rng.normal(55, 18, len(games)).round(1),
+        "wind_mph": rng.gamma(2.0, 4.0, len(games)).round(1),
+        "precipitation": rng.choice(["none", "rain", "snow"], len(games), p=[0.8, 0.15, 0.05]),
+    }).to_csv(paths["weather"], index=False)
+    pd.DataFrame({
+        "stadium_id": np.arange(len(TEAMS)),
+        "stadium_name": [f"{team} Field" for team in TEAMS],
+        "roof": rng.choice(["outdoors", "dome", "retractable"], len(TEAMS), p=[0.6, 0.25, 0.15]),
+        "surface": rng.choice(["grass", "turf"], len(TEAMS)),
+    }).to_csv(paths["stadiums"], index=False)
+
+    first = True
+    for (season, week), week_games in games.groupby(["season", "week"], sort=True):
+        games_by_team = pd.concat([
+            pd.Series(week_games["game_id"].to_numpy(), index=week_games["home_team"]),
+            pd.Series(week_games["game_id"].to_numpy(), index=week_games["away_team"]),
+        ])
+        stats = _player_week(players, games_by_team, season, week, rng)
+        injured = stats.loc[rng.random(len(stats)) < INJURY_RATE, ["player_id", "season", "week"]]
+        injured = injured.assign(injury_status=rng.choice(INJURY_STATUSES, len(injured)))
+        stats.to_csv(paths["player_stats"], mode="w" if first else "a", header=first, index=False)
+        injured.to_csv(paths["injuries"], mode="w" if first else "a", header=first, index=False)
+        first = False
+    return paths
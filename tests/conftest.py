@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fusion_utils
+import schema_utils
+import shared_utils
+import storage_utils
+
+# Every test gets its own database file. Table versions restart at 1 in a new
+# database, so the in-process caches keyed by (table, version) are cleared too.
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_utils, "DB_FILE", str(tmp_path / "test.db"))
+    monkeypatch.setattr(storage_utils, "STORAGE_BACKEND", "sqlite")
+    shared_utils.invalidate_table_cache()
+    schema_utils._schema_cache.clear()
+    fusion_utils._cardinality_cache.clear()
+    storage_utils._open_datasets.clear()
+    yield tmp_path
+    shared_utils.invalidate_table_cache()
+
+@pytest.fixture
+def conn(db):
+    conn = shared_utils.get_connection()
+    yield conn
+    conn.close()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cleaning_utils import clean_frame, clean_table_chunked
+from shared_utils import load_table, save_table
+
+@pytest.fixture
+def stats():
+    rng = np.random.default_rng(5)
+    n = 600
+    df = pd.DataFrame({
+        "season": rng.integers(2019, 2023, n),
+        "position": rng.choice(np.array(["QB", "RB", "WR", None], dtype=object), n),
+        "yards": np.r_[rng.normal(60, 20, n - 6), [400, -200, 350, 500, -150, 300]].round(1),
+        "touches": rng.poisson(12, n).astype(float),
+        "fantasy_points_ppr": rng.gamma(2.0, 6.0, n).round(2),
+    })
+    df.loc[rng.random(n) < 0.05, "touches"] = np.nan
+    save_table(df, "stats")
+    return df
+
+@pytest.mark.parametrize("method", ["zscore", "iqr", "mad"])
+@pytest.mark.parametrize("drop_na", [False, True])
+@pytest.mark.parametrize("filters", [{}, {"season": (2020, 2021), "positions": ["QB", "WR"]}])
+def test_chunked_cleaning_matches_in_memory(stats, method, drop_na, filters):
+    expected = clean_frame(load_table("stats", filters=filters), drop_na=drop_na, remove_outliers=True, method=method)
+    report = clean_table_chunked(
+        "stats", "stats_clean", filters=filters, drop_na=drop_na, method=method, chunk_rows=97
+    )
+    actual = load_table("stats_clean")
+    assert report["rows_kept"] == len(expected) < report["rows_read"]
+    pd.testing.assert_frame_equal(actual, expected.reset_index(drop=True), check_dtype=False)
+
+def test_empty_selection_keeps_the_schema(stats):
+    report = clean_table_chunked("stats", "stats_clean", filters={"season": (1900, 1901)})
+    assert report["rows_kept"] == 0
+    assert list(load_table("stats_clean").columns) == list(stats.columns)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from query_utils import build_where_clause
+from shared_utils import get_connection, save_table
+from ui_utils import _page_cursor, _page_query
+
+COLUMNS = ["player_name", "season", "fantasy_points_ppr"]
+
+@pytest.fixture
+def grid_table():
+    rng = np.random.default_rng(9)
+    n = 233
+    points = rng.integers(0, 20, n).astype(float)  # many ties
+    points[rng.random(n) < 0.1] = np.nan
+    df = pd.DataFrame({
+        "player_name": rng.choice(np.array(["Ann", "Bo", "Cy", None], dtype=object), n),
+        "season": rng.integers(2019, 2023, n),
+        "position": rng.choice(["QB", "RB"], n),
+        "fantasy_points_ppr": points,
+    })
+    save_table(df, "grid")
+    return df
+
+# Walk the grid page by page the way render_data_grid's Next button does
+def _walk(filters, sort_col, descending, page_size):
+    where, params = build_where_clause(filters)
+    conn = get_connection()
+    pages, cursor = [], None
+    try:
+        while True:
+            sql, page_params = _page_query("grid", COLUMNS, where, params, sort_col, descending, cursor, page_size)
+            page = pd.read_sql(sql, conn, params=page_params)
+            has_next = len(page) > page_size
+            page = page.head(page_size)
+            pages.append(page)
+            if not has_next:
+                break
+            cursor = _page_cursor(page, sort_col)
+    finally:
+        conn.close()
+    return pages
+
+def _expected_rowids(filters, sort_col, descending):
+    where, params = build_where_clause(filters)
+    direction = "DESC" if descending else "ASC"
+    order = f"rowid {direction}" if sort_col is None else f'"{sort_col}" IS NULL, "{sort_col}" {direction}, rowid {direction}'
+    sql = "SELECT rowid FROM grid" + (f" WHERE {where}" if where else "") + f" ORDER BY {order}"
+    conn = get_connection()
+    try:
+        return [r[0] for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("sort_col", [None, "fantasy_points_ppr", "player_name", "season"])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("filters", [{}, {"positions": ["QB"]}])
+def test_pages_cover_every_row_once_in_order(grid_table, sort_col, descending, filters):
+    pages = _walk(filters, sort_col, descending, page_size=20)
+    assert all(len(page) == 20 for page in pages[:-1])
+    rowids = pd.concat(pages)["__rowid__"].tolist()
+    assert rowids == _expected_rowids(filters, sort_col, descending)
+
+def test_null_sort_keys_come_last(grid_table):
+    pages = _walk({}, "fantasy_points_ppr", False, page_size=25)
+    values = pd.concat(pages)["fantasy_points_ppr"]
+    nulls = values.isna().to_numpy()
+    assert nulls.any() and not nulls[: (~nulls).sum()].any()
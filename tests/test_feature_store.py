@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store_utils import attach_features, define_feature, load_with_features, refresh_features
+from shared_utils import bump_table_version, save_table
+
+FEATURES = [
+    ("pts_last", "mean", 1),
+    ("pts_avg_3", "mean", 3),
+    ("pts_sum_2", "sum", 2),
+    ("pts_std_4", "std", 4),
+    ("pts_count_3", "count", 3),
+    ("pts_season_avg", "mean", "season"),
+    ("pts_season_games", "count", "season"),
+    ("pts_career_avg", "mean", "all"),
+    ("pts_career_std", "std", "all"),
+]
+NAMES = [name for name, _, _ in FEATURES]
+
+def _games(rng, seasons, weeks, players=12):
+    rows = []
+    for season in seasons:
+        for week in weeks:
+            # Players miss weeks, and some weeks hold two rows for one player
+            for player in rng.choice(players, size=rng.integers(players // 2, players), replace=False):
+                for _ in range(1 + (rng.random() < 0.1)):
+                    rows.append((f"p{player:02d}", season, week, round(rng.uniform(0, 30), 2)))
+    df = pd.DataFrame(rows, columns=["player_id", "season", "week", "pts"])
+    df.loc[rng.random(len(df)) < 0.08, "pts"] = np.nan
+    df.loc[rng.random(len(df)) < 0.03, "player_id"] = None
+    return df
+
+# Pandas reference: per-period sums, then windows over the periods strictly
+# before each row's (season, week)
+def _reference(df):
+    keyed = df.dropna(subset=["player_id"])
+    periods = keyed.groupby(["player_id", "season", "week"]).agg(
+        n=("pts", "count"), total=("pts", "sum"), sq=("pts", lambda x: (x * x).sum())
+    ).reset_index().sort_values(["player_id", "season", "week"], ignore_index=True)
+    sums = ["n", "total", "sq"]
+    by_player = periods.groupby("player_id")[sums]
+    by_season = periods.groupby(["player_id", "season"])[sums]
+    features = {}
+    for name, stat, window in FEATURES:
+        if window == "all":
+            w = by_player.cumsum() - periods[sums]
+        elif window == "season":
+            w = by_season.cumsum() - periods[sums]
+        else:
+            w = by_player.transform(lambda x: x.shift(1).rolling(window, min_periods=1).sum()).fillna(0.0)
+        n, total, sq = w["n"], w["total"], w["sq"]
+        if stat == "count":
+            features[name] = n
+        elif stat == "sum":
+            features[name] = total
+        elif stat == "mean":
+            features[name] = (total / n).where(n > 0)
+        else:
+            var = ((sq - total * total / n.where(n > 0)) / (n - 1)).clip(lower=0.0)
+            features[name] = np.sqrt(var).where(n > 1)
+    periods = pd.concat([periods[["player_id", "season", "week"]], pd.DataFrame(features)], axis=1)
+    return df.merge(periods, on=["player_id", "season", "week"], how="left")[NAMES]
+
+def _assert_features(actual, expected):
+    np.testing.assert_allclose(
+        actual[NAMES].to_numpy(dtype=float), expected[NAMES].to_numpy(dtype=float), rtol=1e-9, atol=1e-9
+    )
+
+@pytest.fixture
+def games(conn):
+    rng = np.random.default_rng(11)
+    df = _games(rng, [2021, 2022], range(1, 9))
+    save_table(df, "games")
+    for name, stat, window in FEATURES:
+        define_feature("games", name, "pts", stat, window, conn=conn)
+    assert refresh_features("games", conn)[0]["mode"] == "full"
+    return df
+
+def test_stored_features_match_pandas_reference(games):
+    actual = load_with_features("games", ["player_id", "season", "week"], NAMES)
+    _assert_features(actual, _reference(games))
+
+def test_lookup_matches_stored_features(games):
+    stored = load_with_features("games", ["player_id", "season", "week"], NAMES)
+    looked_up = attach_features(games[["player_id", "season", "week"]], "games", NAMES)
+    _assert_features(looked_up, stored)
+
+def test_new_weeks_extend_the_store(games, conn):
+    rng = np.random.default_rng(12)
+    new = _games(rng, [2022], range(9, 11))
+    new.to_sql("games", conn, if_exists="append", index=False)
+    bump_table_version("games", conn)
+    report = refresh_features("games", conn)
+    assert report[0]["mode"] == "incremental"
+    combined = pd.concat([games, new], ignore_index=True)
+    actual = load_with_features("games", ["player_id", "season", "week"], NAMES)
+    _assert_features(actual, _reference(combined))
+
+def test_lookup_for_future_week_uses_all_stored_periods(games):
+    players = sorted(games["player_id"].dropna().unique())
+    future = pd.DataFrame({"player_id": players, "season": 2022, "week": 9})
+    looked_up = attach_features(future, "games", NAMES)
+    # A week after the stored ones sees every stored period as history
+    with_future = pd.concat([games, future.assign(pts=np.nan)], ignore_index=True)
+    expected = _reference(with_future).iloc[len(games):].reset_index(drop=True)
+    _assert_features(looked_up, expected)
+
+def test_edited_history_rebuilds(games, conn):
+    conn.execute("UPDATE games SET pts = pts + 1 WHERE season = 2021 AND week = 2")
+    conn.commit()
+    bump_table_version("games", conn)
+    assert refresh_features("games", conn)[0]["mode"] == "full"
+    edited = games.copy()
+    week = (edited["season"] == 2021) & (edited["week"] == 2)
+    edited.loc[week, "pts"] += 1
+    actual = load_with_features("games", ["player_id", "season", "week"], NAMES)
+    _assert_features(actual, _reference(edited))
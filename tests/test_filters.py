@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+import storage_utils
+from query_utils import build_where_clause
+from shared_utils import get_connection, get_table_version, load_table, save_table
+from storage_utils import filter_expression
+from text_index_utils import get_text_index
+
+FILTERS = [
+    {},
+    {"season": (2019, 2020)},
+    {"player_search": "smith"},
+    {"player_search": "Jo"},
+    {"player_search": "50%"},
+    {"player_search": "a_b"},
+    {"player_exact": "Al Smith"},
+    {"positions": ["QB", "WR"]},
+    {"positions": ["QB", "RB", "WR", "TE"], "all_positions": True},
+    {"positions": []},
+    {"ranges": {"fantasy_points_ppr": (5.0, 15.0)}},
+    {"season": (2020, 2021), "positions": ["RB"], "player_search": "son", "ranges": {"fantasy_points_ppr": (0.0, 20.0)}},
+]
+
+@pytest.fixture
+def players():
+    rng = np.random.default_rng(7)
+    names = ["Al Smith", "Jo Johnson", "BOB SMITHSON", "Ann Jones", "50% Club", "a_b test", "Ab Cd", None]
+    n = 400
+    df = pd.DataFrame({
+        "season": rng.integers(2018, 2023, n),
+        "week": rng.integers(1, 18, n),
+        "player_name": rng.choice(np.array(names, dtype=object), n),
+        "position": rng.choice(np.array(["QB", "RB", "WR", "TE", None], dtype=object), n),
+        "fantasy_points_ppr": rng.uniform(0, 30, n).round(2),
+    })
+    save_table(df, "players")
+    return df
+
+def _sql_rows(filters):
+    where, params = build_where_clause(filters)
+    sql = "SELECT rowid FROM players" + (f" WHERE {where}" if where else "") + " ORDER BY rowid"
+    conn = get_connection()
+    try:
+        return [r[0] for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+def _arrow_rows(df, filters):
+    table = pa.Table.from_pandas(df.assign(rowid=np.arange(1, len(df) + 1)), preserve_index=False)
+    result = ds.dataset(table).to_table(filter=filter_expression(filters))
+    return sorted(result.column("rowid").to_pylist())
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_sql_and_arrow_filters_select_the_same_rows(players, filters):
+    assert _sql_rows(filters) == _arrow_rows(players, filters)
+
+@pytest.mark.parametrize("filters", [f for f in FILTERS if f.get("player_search")])
+def test_text_index_matches_like_scan(players, filters):
+    index = get_text_index("players", "player_name")
+    if index is None:
+        pytest.skip("SQLite build without FTS5")
+    assert _sql_rows({**filters, "player_index": index}) == _sql_rows(filters)
+
+@pytest.mark.parametrize("filters", [f for f in FILTERS if not f.get("player_search") and not f.get("player_exact")])
+def test_parquet_backend_reads_the_same_rows(players, filters, monkeypatch):
+    sqlite = load_table("players", filters=filters)
+    monkeypatch.setattr(storage_utils, "STORAGE_BACKEND", "parquet")
+    save_table(players, "players")
+    assert storage_utils.read_dataset("players", get_table_version("players"), filters=filters) is not None
+    parquet = load_table("players", filters=filters)
+    pd.testing.assert_frame_equal(
+        parquet.reset_index(drop=True), sqlite.reset_index(drop=True), check_dtype=False, check_categorical=False
+    )
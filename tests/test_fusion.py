@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from fusion_utils import DEFAULT_TARGET, fuse_tables
+from ingest_utils import ingest_file
+from shared_utils import load_table, save_table
+from synthetic_utils import generate_fantasy_data
+
+@pytest.fixture
+def sources(db):
+    paths = generate_fantasy_data(str(db / "csv"), rows=2000, seasons=2, seed=3)
+    for table, path in paths.items():
+        with open(path, "rb") as f:
+            ingest_file(f, path, table)
+    assert fuse_tables()["mode"] == "full"
+    return paths
+
+def _sorted(df):
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+def _full_rebuild():
+    fuse_tables(incremental=False)
+    return _sorted(load_table(DEFAULT_TARGET))
+
+def test_unchanged_sources_refresh_nothing(sources):
+    result = fuse_tables()
+    assert result["mode"] == "incremental"
+    assert result["partitions"] == []
+
+def test_incremental_matches_full_rebuild(sources):
+    stats = load_table("player_stats").copy()
+    week = stats["week"] == 3
+    stats.loc[week, "fantasy_points_ppr"] = (stats.loc[week, "fantasy_points_ppr"] + 1).round(2)
+    # Drop one week entirely and duplicate a row in another
+    stats = pd.concat([stats[stats["week"] != 5], stats[stats["week"] == 7].head(1)], ignore_index=True)
+    save_table(stats, "player_stats")
+
+    result = fuse_tables()
+    assert result["mode"] == "incremental"
+    assert {week for _, week in result["partitions"]} == {3, 5, 7}
+    incremental = _sorted(load_table(DEFAULT_TARGET))
+    pd.testing.assert_frame_equal(incremental, _full_rebuild(), check_dtype=False)
+
+def test_overwritten_target_is_rebuilt(sources):
+    save_table(load_table(DEFAULT_TARGET).head(5), DEFAULT_TARGET)
+    assert fuse_tables()["mode"] == "full"
+    assert len(load_table(DEFAULT_TARGET)) == len(_full_rebuild())
+
+def test_unpartitioned_source_change_rebuilds(sources):
+    save_table(load_table("stadiums"), "stadiums")
+    assert fuse_tables()["mode"] == "full"
@@ -0,0 +1,44 @@
+import pandas as pd
+
+import shared_utils
+from shared_utils import cache_stats, get_table_version, load_table, mark_table_written, save_table
+
+def test_repeat_load_is_served_from_cache():
+    save_table(pd.DataFrame({"a": [1, 2, 3]}), "t")
+    first = load_table("t")
+    hits = cache_stats()["hits"]
+    second = load_table("t")
+    assert second is first
+    assert cache_stats()["hits"] == hits + 1
+
+def test_cache_key_includes_columns_and_filter():
+    save_table(pd.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]}), "t")
+    assert list(load_table("t", columns=["b"]).columns) == ["b"]
+    assert load_table("t", where='"a" > ?', params=(1,))["a"].tolist() == [2, 3]
+    assert load_table("t", where='"a" > ?', params=(2,))["a"].tolist() == [3]
+
+def test_save_bumps_version_and_invalidates():
+    save_table(pd.DataFrame({"a": [1, 2, 3]}), "t")
+    before = get_table_version("t")
+    assert load_table("t")["a"].tolist() == [1, 2, 3]
+    save_table(pd.DataFrame({"a": [4]}), "t")
+    assert get_table_version("t") == before + 1
+    assert load_table("t")["a"].tolist() == [4]
+
+def test_direct_sql_write_is_seen_after_mark_table_written(conn):
+    save_table(pd.DataFrame({"a": [1]}), "t")
+    assert load_table("t")["a"].tolist() == [1]
+    conn.execute('INSERT INTO "t" VALUES (2)')
+    conn.commit()
+    mark_table_written("t", conn)
+    assert load_table("t")["a"].tolist() == [1, 2]
+
+def test_invalidate_drops_only_that_table():
+    save_table(pd.DataFrame({"a": [1]}), "t")
+    save_table(pd.DataFrame({"a": [2]}), "u")
+    load_table("t")
+    kept = load_table("u")
+    shared_utils.invalidate_table_cache("t")
+    entries = {key[0] for key in shared_utils._table_cache}
+    assert entries == {"u"}
+    assert load_table("u") is kept
@@ -0,0 +1,139 @@
+import hashlib
+import sqlite3
+
+import pandas as pd
+
+from shared_utils import INTERNAL_PREFIX, get_connection, quote_table, get_table_version
+from query_utils import table_columns, escape_like, match_phrase, text_index_condition
+
+# Trigram text indexes for substring search. Each indexed column gets an FTS5
+# table over its distinct values (with row counts) plus a B-tree index on the
+# column, so a search resolves matching values in the FTS table and then jumps
+# to their rows instead of scanning every string.
+
+TEXT_INDEX_COLUMNS = ["player_name"]
+INDEXES_TABLE = f"{INTERNAL_PREFIX}text_indexes"
+SUGGESTION_LIMIT = 10
+
+def _ensure_indexes_table(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {INDEXES_TABLE} ("
+        "table_name TEXT NOT NULL, column_name TEXT NOT NULL, fts_table TEXT NOT NULL, "
+        "btree_index TEXT NOT NULL, version INTEGER NOT NULL, "
+        "PRIMARY KEY (table_name, column_name))"
+    )
+
+def _index_names(table_name, column):
+    digest = hashlib.sha1(f"{table_name}\x00{column}".encode("utf-8")).hexdigest()[:16]
+    return f"{INTERNAL_PREFIX}fts_{digest}", f"{INTERNAL_PREFIX}idx_{digest}"
+
+def _drop_index(fts_table, btree_index, conn):
+    conn.execute(f"DROP TABLE IF EXISTS {quote_table(fts_table)}")
+    conn.execute(f"DROP INDEX IF EXISTS {quote_table(btree_index)}")
+
+# Rebuild the text indexes of a table (called from mark_table_written).
+# Returns the indexed columns; empty when the table has none or SQLite lacks FTS5.
+def refresh_text_indexes(table_name, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_indexes_table(conn)
+        columns = set(table_columns(table_name, conn))
+        version = get_table_version(table_name, conn)
+        stale = conn.execute(
+            f"SELECT column_name, fts_table, btree_index FROM {INDEXES_TABLE} WHERE table_name = ?", (table_name,)
+        ).fetchall()
+        for column, fts_table, btree_index in stale:
+            if column not in columns:
+                _drop_index(fts_table, btree_index, conn)
+                conn.execute(
+                    f"DELETE FROM {INDEXES_TABLE} WHERE table_name = ? AND column_name = ?", (table_name, column)
+                )
+
+        indexed = []
+        for column in TEXT_INDEX_COLUMNS:
+            if column not in columns:
+                continue
+            fts_table, btree_index = _index_names(table_name, column)
+            c, fts = quote_table(column), quote_table(fts_table)
+            conn.execute(f"DROP TABLE IF EXISTS {fts}")
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5(value, rows UNINDEXED, tokenize='trigram')")
+            except sqlite3.OperationalError:
+                break
+            conn.execute(
+                f"INSERT INTO {fts} (value, rows) SELECT {c}, COUNT(*) FROM {quote_table(table_name)} "
+                f"WHERE {c} IS NOT NULL GROUP BY {c}"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_table(btree_index)} ON {quote_table(table_name)} ({c})")
+            conn.execute(
+                f"INSERT INTO {INDEXES_TABLE} VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(table_name, column_name) DO UPDATE SET "
+                "fts_table = excluded.fts_table, btree_index = excluded.btree_index, version = excluded.version",
+                (table_name, column, fts_table, btree_index, version),
+            )
+            indexed.append(column)
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    return indexed
+
+# FTS table for a column, or None when it has no current index
+def get_text_index(table_name, column, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        _ensure_indexes_table(conn)
+        row = conn.execute(
+            f"SELECT fts_table, version FROM {INDEXES_TABLE} WHERE table_name = ? AND column_name = ?",
+            (table_name, column),
+        ).fetchone()
+        if row is None or row[1] != get_table_version(table_name, conn):
+            return None
+    finally:
+        if own_conn:
+            conn.close()
+    return row[0]
+
+def _trigrams(text):
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Autocomplete: values containing `text` (prefix matches first, then by row count).
+# If nothing contains it, values sharing the most trigrams with it (typo tolerance).
+# Returns a DataFrame of value, rows, match ("prefix", "substring" or "fuzzy").
+def suggest_values(table_name, text, column="player_name", limit=SUGGESTION_LIMIT, conn=None):
+    empty = pd.DataFrame(columns=["value", "rows", "match"])
+    text = text.strip()
+    if not text:
+        return empty
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        fts_table = get_text_index(table_name, column, conn)
+        if fts_table is None:
+            return empty
+        fts = quote_table(fts_table)
+        condition, params = text_index_condition(text)
+        hits = pd.read_sql(
+            f"SELECT value, rows, CASE WHEN value LIKE ? ESCAPE '\\' THEN 'prefix' ELSE 'substring' END AS match "
+            f"FROM {fts} WHERE {condition} ORDER BY match = 'prefix' DESC, rows DESC, value LIMIT ?",
+            conn,
+            params=[f"{escape_like(text)}%"] + params + [int(limit)],
+        )
+        grams = _trigrams(text)
+        if hits.empty and grams:
+            # bm25 over OR-ed trigrams ranks values by how many trigrams they share
+            hits = pd.read_sql(
+                f"SELECT value, rows, 'fuzzy' AS match FROM {fts} WHERE value MATCH ? ORDER BY rank LIMIT ?",
+                conn,
+                params=[" OR ".join(match_phrase(g) for g in sorted(grams)), int(limit)],
+            )
+    finally:
+        if own_conn:
+            conn.close()
+    return hits
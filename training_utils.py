@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+
+from sklearn.model_selection import train_test_split, KFold, ParameterGrid
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV, HalvingRandomSearchCV
+
+from shared_utils import load_table
+from query_utils import build_where_clause
+from feature_store_utils import load_with_features
+
+# Number of warm-start rounds a forest is grown in (progress / cancellation points)
+TRAINING_ROUNDS = 10
+
+# Only the columns a model needs, with the universal filters pushed down to storage.
+# Feature-store features among feature_cols (store_features) are joined in.
+def load_training_frame(table_name, feature_cols, target_col, filters=None, extra_columns=(), conn=None,
+                        store_features=()):
+    where, params = build_where_clause(filters or {})
+    store_features = [c for c in feature_cols if c in set(store_features)]
+    columns = list(dict.fromkeys([c for c in feature_cols if c not in store_features] + [target_col, *extra_columns]))
+    if store_features:
+        return load_with_features(table_name, columns, store_features, where=where, params=params, conn=conn)
+    return load_table(table_name, columns=columns, filters=filters or {}, conn=conn)
+
+# Feature matrix and target the way the Predictor page builds them
+def prepare_xy(df, feature_cols, target_col):
+    X = df[feature_cols].fillna(0)
+    y = df[target_col].fillna(0)
+    return X, y
+
+# Fit a RandomForestRegressor in warm-start rounds.
+# on_round(fraction_done) may return False to stop early (cancellation).
+def train_random_forest(X, y, test_size=0.2, n_estimators=200, max_depth=10, n_jobs=1,
+                        random_state=42, on_round=None):
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state)
+
+    model = RandomForestRegressor(
+        n_estimators=0, max_depth=max_depth, random_state=random_state, n_jobs=n_jobs, warm_start=True
+    )
+    rounds = max(1, min(TRAINING_ROUNDS, n_estimators))
+    for i in range(1, rounds + 1):
+        model.n_estimators = int(round(n_estimators * i / rounds))
+        model.fit(X_train, y_train)
+        if on_round is not None and on_round(i / rounds) is False:
+            return None
+
+    preds = model.predict(X_test)
+    metrics = {
+        "rmse": float(mean_squared_error(y_test, preds) ** 0.5),
+        "r2": float(r2_score(y_test, preds)),
+        "n_train": int(len(X_train)),
+        "n_test": int(len(X_test)),
+    }
+    predictions = pd.DataFrame({"Actual": np.asarray(y_test), "Predicted": preds})
+    return model, metrics, predictions
+
+SEARCH_STRATEGIES = ["random", "grid"]
+CV_STRATEGIES = ["kfold", "season"]
+
+# Searchable regressors. Survivors of each halving round get more of `resource`
+# (trees for ensembles, rows otherwise), so weak candidates stay cheap.
+SEARCH_SPACES = {
+    "random_forest": {
+        "estimator": lambda: RandomForestRegressor(random_state=42),
+        "params": {
+            "max_depth": [4, 6, 8, 10, 14, None],
+            "min_samples_leaf": [1, 2, 5, 10],
+            "max_features": [1.0, 0.5, "sqrt"],
+        },
+        "resource": "n_estimators",
+        "min_resources": 20,
+        "max_resources": 500,
+    },
+    "extra_trees": {
+        "estimator": lambda: ExtraTreesRegressor(random_state=42),
+        "params": {
+            "max_depth": [4, 6, 8, 10, 14, None],
+            "min_samples_leaf": [1, 2, 5, 10],
+            "max_features": [1.0, 0.5, "sqrt"],
+        },
+        "resource": "n_estimators",
+        "min_resources": 20,
+        "max_resources": 500,
+    },
+    "gradient_boosting": {
+        "estimator": lambda: GradientBoostingRegressor(random_state=42),
+        "params": {
+            "learning_rate": [0.03, 0.1, 0.3],
+            "max_depth": [2, 3, 4, 6],
+            "subsample": [0.7, 1.0],
+        },
+        "resource": "n_estimators",
+        "min_resources": 20,
+        "max_resources": 500,
+    },
+    "ridge": {
+        "estimator": lambda: Ridge(),
+        "params": {"alpha": [0.01, 0.1, 1.0, 10.0, 100.0]},
+        "resource": "n_samples",
+    },
+}
+
+# Walk-forward CV over seasons: each fold trains on earlier seasons and
+# tests on the next one, so no fold sees the future.
+class SeasonSplit:
+    def __init__(self, n_splits=3):
+        self.n_splits = n_splits
+
+    def _test_seasons(self, groups):
+        seasons = np.unique(np.asarray(groups))
+        if len(seasons) < 2:
+            raise ValueError("Season-aware CV needs at least two seasons in the filtered data.")
+        return seasons[-min(self.n_splits, len(seasons) - 1):]
+
+    def split(self, X, y=None, groups=None):
+        if groups is None:
+            raise ValueError("SeasonSplit needs the season of every row as groups.")
+        groups = np.asarray(groups)
+        for season in self._test_seasons(groups):
+            yield np.flatnonzero(groups < season), np.flatnonzero(groups == season)
+
+    def get_n_splits(self, X=None, y=None, groups=None):
+        return self.n_splits if groups is None else len(self._test_seasons(groups))
+
+# Number of candidate configurations a search would start with
+def search_space_size(model_name):
+    return len(ParameterGrid(SEARCH_SPACES[model_name]["params"]))
+
+# Successive-halving search with k-fold or season-aware CV.
+# X may be a read-only memmap: joblib hands it to the CV workers by reference;
+# pass feature_names so the fitted model still knows its column names.
+# Returns (best model refit on all rows, metrics, leaderboard DataFrame).
+def search_hyperparameters(X, y, model_name="random_forest", strategy="random", cv="kfold", folds=5,
+                           seasons=None, n_candidates=20, factor=3, n_jobs=1, random_state=42, feature_names=None):
+    space = SEARCH_SPACES[model_name]
+    if cv == "season":
+        splitter = SeasonSplit(folds)
+    else:
+        splitter = KFold(folds, shuffle=True, random_state=random_state)
+    n_start = search_space_size(model_name) if strategy == "grid" else min(n_candidates, search_space_size(model_name))
+    # Start low enough that the final round's survivors get the full budget
+    # (all trees, or all rows when halving on rows)
+    rounds = 1 + int(np.floor(np.log(n_start) / np.log(factor)))
+    max_resources = len(y) if space["resource"] == "n_samples" else space["max_resources"]
+    min_resources = max_resources // factor ** (rounds - 1)
+    if space["resource"] != "n_samples":
+        min_resources = max(space["min_resources"], min_resources)
+    options = dict(
+        factor=factor,
+        resource=space["resource"],
+        min_resources=min_resources,
+        max_resources=max_resources,
+        cv=splitter,
+        scoring="neg_root_mean_squared_error",
+        refit=True,
+        n_jobs=n_jobs,
+        random_state=random_state,
+    )
+    if strategy == "grid":
+        options.pop("random_state")
+        search = HalvingGridSearchCV(space["estimator"](), space["params"], **options)
+    else:
+        search = HalvingRandomSearchCV(space["estimator"](), space["params"], n_candidates=n_start, **options)
+    search.fit(X, y, groups=seasons if cv == "season" else None)
+    model = search.best_estimator_
+    if feature_names is not None:
+        # Fitted on a bare array; record the names so DataFrame input is checked like any other model
+        model.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    results = pd.DataFrame(search.cv_results_)
+    leaderboard = pd.DataFrame({
+        "rank": results["rank_test_score"],
+        "round": results["iter"],
+        "resources": results["n_resources"],
+        "rmse": -results["mean_test_score"],
+        "rmse_std": results["std_test_score"],
+        "fit_seconds": results["mean_fit_time"],
+        "params": results["params"].map(
+            lambda p: ", ".join(f"{k}={v}" for k, v in sorted(p.items()) if k != space["resource"])
+        ),
+    })
+    # Only the last round a candidate reached is comparable across candidates
+    leaderboard = (
+        leaderboard.sort_values("round")
+        .drop_duplicates("params", keep="last")
+        .sort_values(["round", "rmse"], ascending=[False, True])
+        .reset_index(drop=True)
+    )
+    leaderboard["rank"] = leaderboard.index + 1
+
+    metrics = {
+        "model": model_name,
+        "rmse": float(-search.best_score_),
+        "cv": cv,
+        "folds": int(splitter.get_n_splits(X, y, seasons)),
+        "candidates": int(search.n_candidates_[0]),
+        "rounds": int(search.n_iterations_),
+        "best_params": {k: v for k, v in search.best_params_.items()},
+        "n_rows": int(len(y)),
+    }
+    return model, metrics, leaderboard
@@ -1,7 +1,31 @@
+from collections import deque
+
 import streamlit as st
+import pandas as pd
+import perf_utils
+from shared_utils import get_connection, quote_table, save_table
+from query_utils import table_columns, build_where_clause, count_rows
+from result_cache_utils import result_cache_stats
+from storage_utils import dataset_stats
+from write_utils import WriteQueueTimeout, write_queue_status
+
+PAGE_SIZES = [25, 50, 100, 250]
+# Reruns kept per session in the diagnostics panel
+PERF_HISTORY = 20
+
+# Start this rerun's diagnostics trace if the session has recording on
+def start_page_trace(label):
+    if st.session_state.get("perf_enabled", perf_utils.PERF_DEFAULT_ON):
+        previous = perf_utils.start_trace(label)
+        if previous is not None:
+            _perf_history().append(previous)
+
+def _perf_history():
+    return st.session_state.setdefault("perf_traces", deque(maxlen=PERF_HISTORY))
 
 # Page header rendering
 def render_page_header(title, subtitle=None):
+    start_page_trace(title)
     st.title(title)
     if subtitle:
         st.markdown(subtitle)
@@ -16,3 +40,208 @@ def render_kpi_cards(kpi_list):
     cols = st.columns(len(kpi_list))
     for col, (label, value, delta) in zip(cols, kpi_list):
         col.metric(label, value, delta if delta is not None else "")
+
+# on_wait callback for write paths: shows the queue position in a placeholder
+def queue_wait_reporter(placeholder):
+    def report(position, waited):
+        placeholder.write(f"⏳ Waiting for {position} earlier write(s) to finish ({waited:.0f}s)...")
+    return report
+
+# Save button helper: queue position and row progress while the save runs.
+# Returns False (with an error shown) if the write queue wait timed out.
+def save_table_with_progress(df, table_name):
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+
+    def progress(rows, total):
+        progress_bar.progress(rows / total if total else 1.0)
+        status.write(f"Writing {rows:,} of {total:,} rows...")
+
+    try:
+        save_table(df, table_name, progress=progress, on_wait=queue_wait_reporter(status))
+    except WriteQueueTimeout as exc:
+        st.error(str(exc))
+        return False
+    finally:
+        progress_bar.empty()
+        status.empty()
+    return True
+
+# Keyset condition for the page after (last_key, last_rowid); NULL sort keys come last
+def _keyset_condition(sort_col, descending, last_key, last_rowid):
+    if sort_col is None:
+        return ("rowid < ?" if descending else "rowid > ?"), [last_rowid]
+    c = quote_table(sort_col)
+    op = "<" if descending else ">"
+    if last_key is None:
+        return f"({c} IS NULL AND rowid {op} ?)", [last_rowid]
+    return (
+        f"(({c} IS NOT NULL AND ({c} {op} ? OR ({c} = ? AND rowid {op} ?))) OR {c} IS NULL)",
+        [last_key, last_key, last_rowid],
+    )
+
+# SELECT for the grid page starting at cursor (None for the first page), with
+# rowid as __rowid__ and one extra row that tells whether a next page exists
+def _page_query(table_name, columns, where, params, sort_col, descending, cursor, page_size):
+    conditions = [where] if where else []
+    page_params = list(params)
+    if cursor is not None:
+        condition, cursor_params = _keyset_condition(sort_col, descending, *cursor)
+        conditions.append(condition)
+        page_params += cursor_params
+
+    direction = "DESC" if descending else "ASC"
+    if sort_col is None:
+        order = f"rowid {direction}"
+    else:
+        order = f"{quote_table(sort_col)} IS NULL, {quote_table(sort_col)} {direction}, rowid {direction}"
+    select_cols = ", ".join(quote_table(c) for c in columns)
+    sql = f"SELECT rowid AS __rowid__, {select_cols} FROM {quote_table(table_name)}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order} LIMIT {int(page_size) + 1}"
+    return sql, page_params
+
+# Cursor (last_key, last_rowid) for the page after this one
+def _page_cursor(page, sort_col):
+    last = page.iloc[-1]
+    last_key = None if sort_col is None or pd.isna(last[sort_col]) else last[sort_col]
+    return (last_key.item() if hasattr(last_key, "item") else last_key, int(last["__rowid__"]))
+
+# Paginated, server-side sorted grid: only the visible page is read from SQLite
+@perf_utils.timed("render_data_grid")
+def render_data_grid(table_name, filters=None, key="grid", page_size=50, columns=None):
+    where, params = build_where_clause(filters or {})
+    total = count_rows(table_name, where, params)
+    all_columns = columns or table_columns(table_name)
+
+    sort_cols = st.columns([3, 1, 1])
+    sort_col = sort_cols[0].selectbox("Sort by", ["(table order)"] + all_columns, key=f"{key}_sort")
+    sort_col = None if sort_col == "(table order)" else sort_col
+    descending = sort_cols[1].checkbox("Descending", key=f"{key}_desc")
+    sizes = sorted(set(PAGE_SIZES) | {page_size})
+    page_size = sort_cols[2].selectbox("Rows/page", sizes, index=sizes.index(page_size), key=f"{key}_size")
+
+    # Cursor stack of page start keys, reset whenever the query changes
+    signature = (table_name, where, tuple(params), sort_col, descending, page_size)
+    state = st.session_state.setdefault(f"{key}_state", {"signature": signature, "cursors": [None], "next": None})
+    if state["signature"] != signature:
+        state.update(signature=signature, cursors=[None], next=None)
+
+    sql, page_params = _page_query(
+        table_name, all_columns, where, params, sort_col, descending, state["cursors"][-1], page_size
+    )
+    conn = get_connection()
+    try:
+        page = pd.read_sql(sql, conn, params=page_params)
+    finally:
+        conn.close()
+
+    has_next = len(page) > page_size
+    page = page.head(page_size)
+    state["next"] = _page_cursor(page, sort_col) if has_next and not page.empty else None
+
+    with perf_utils.span("st.dataframe", rows=len(page)):
+        st.dataframe(page.drop(columns="__rowid__"), hide_index=True)
+
+    # Callbacks move the cursor before the next rerun fetches its page
+    start = (len(state["cursors"]) - 1) * page_size
+    nav = st.columns([1, 1, 4])
+    nav[0].button("◀ Prev", key=f"{key}_prev", disabled=len(state["cursors"]) <= 1,
+                  on_click=lambda: state["cursors"].pop())
+    nav[1].button("Next ▶", key=f"{key}_next", disabled=state["next"] is None,
+                  on_click=lambda: state["cursors"].append(state["next"]))
+    nav[2].write(f"Rows {start + 1 if len(page) else 0:,}–{start + len(page):,} of {total:,}")
+
+# Paginated view of an in-memory result (only the visible page is sent to the browser)
+def render_frame_grid(df, key="frame_grid", page_size=50):
+    total = len(df)
+    pages = max((total - 1) // page_size + 1, 1)
+    controls = st.columns([3, 1, 1, 2])
+    sort_col = controls[0].selectbox("Sort by", ["(row order)"] + list(df.columns), key=f"{key}_sort")
+    descending = controls[1].checkbox("Descending", key=f"{key}_desc")
+    page_number = controls[2].number_input("Page", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    start = (int(page_number) - 1) * page_size
+
+    if sort_col == "(row order)":
+        page = df.iloc[start:start + page_size]
+    else:
+        # Sort positions of one column instead of sorting/copying the whole frame
+        keys = pd.Series(df[sort_col].to_numpy())
+        order = keys.sort_values(ascending=not descending, na_position="last", kind="stable").index.to_numpy()
+        page = df.iloc[order[start:start + page_size]]
+
+    controls[3].write(f"Rows {start + 1 if total else 0:,}–{min(start + page_size, total):,} of {total:,}")
+    st.dataframe(page)
+
+# Sidebar diagnostics: closes this rerun's trace and shows it with export buttons.
+# Call once at the end of a page.
+def render_diagnostics_panel():
+    trace = perf_utils.finish_trace()
+    history = _perf_history()
+    if trace is not None:
+        history.append(trace)
+
+    with st.sidebar.expander("⏱️ Diagnostics"):
+        st.toggle("Record timings", value=perf_utils.PERF_DEFAULT_ON, key="perf_enabled")
+        writes = write_queue_status()
+        if writes:
+            st.caption("Write queue")
+            st.dataframe(pd.DataFrame(writes), hide_index=True)
+        results = result_cache_stats()
+        if results["budget_bytes"] > 0:
+            st.caption(
+                f"Shared result cache: {results['files']} results, {results['bytes'] / 2**20:,.1f} of "
+                f"{results['budget_bytes'] / 2**20:,.0f} MB · {results['hits']} hits, {results['misses']} misses "
+                "in this process"
+            )
+        storage = dataset_stats()
+        if storage["backend"] != "sqlite":
+            st.caption(
+                f"Storage: {storage['backend']} · {storage['datasets']} datasets, "
+                f"{storage['rows']:,} rows, {storage['bytes'] / 2**20:,.1f} MB"
+            )
+        if not history:
+            st.caption("Nothing recorded yet. Turn on recording and rerun the page.")
+            return
+
+        traces = list(history)
+        pick = st.selectbox(
+            "Rerun", range(len(traces) - 1, -1, -1),
+            format_func=lambda i: f"{traces[i].label} · {traces[i].seconds * 1000:,.0f} ms",
+            key="perf_pick",
+        )
+        trace = traces[pick]
+        summary = trace.summary()
+        st.write(
+            f"**{summary['seconds'] * 1000:,.0f} ms** total · {summary['queries']} queries "
+            f"({summary['sql_seconds'] * 1000:,.0f} ms SQL, {summary['rows_fetched']:,} rows)"
+        )
+
+        spans = sorted(trace.spans, key=lambda s: s["start"])
+        if spans:
+            st.caption("Spans")
+            st.dataframe(pd.DataFrame({
+                "span": ["  " * s["depth"] + s["name"] for s in spans],
+                "ms": [(s["end"] - s["start"]) * 1000 for s in spans],
+            }), hide_index=True)
+        if trace.queries:
+            st.caption("Slowest SQL")
+            queries = sorted(trace.queries, key=lambda q: q["seconds"], reverse=True)[:20]
+            st.dataframe(pd.DataFrame({
+                "ms": [q["seconds"] * 1000 for q in queries],
+                "rows": [q["rows"] for q in queries],
+                "sql": [q["sql"] for q in queries],
+            }), hide_index=True)
+        if trace.frames:
+            st.caption("DataFrames")
+            st.dataframe(pd.DataFrame({
+                "frame": [f["name"] for f in trace.frames],
+                "rows": [f["rows"] for f in trace.frames],
+                "MB": [f["bytes"] / 1024 / 1024 for f in trace.frames],
+            }), hide_index=True)
+
+        cols = st.columns(2)
+        cols[0].download_button("JSON", perf_utils.traces_to_json(traces), file_name="datos_trace.json", mime="application/json")
+        cols[1].download_button("Chrome trace", perf_utils.traces_to_chrome(traces), file_name="datos_trace.chrome.json",
+                                mime="application/json")
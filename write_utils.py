@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# In-process write queue. SQLite allows one writer at a time; instead of
+# racing on the database lock (and failing with "database is locked" after
+# the busy timeout), every table write in this server takes a FIFO slot here.
+# Readers never queue: the database runs in WAL mode (see get_connection).
+
+# Longest a write waits for its turn (override with DATOS_WRITE_WAIT, seconds)
+WRITE_WAIT_SECONDS = float(os.environ.get("DATOS_WRITE_WAIT", "600"))
+# How often a waiting writer reports its position
+WAIT_POLL_SECONDS = 0.5
+
+class WriteQueueTimeout(TimeoutError):
+    pass
+
+_queue = deque()
+_cond = threading.Condition()
+_holder = {"thread": None, "depth": 0}
+
+# Hold the write slot for the body of the with-block. Re-entrant per thread,
+# so a save that calls mark_table_written doesn't queue behind itself.
+# on_wait(position, waited_seconds) is called while queued (position 1 = next).
+@contextmanager
+def write_slot(label, timeout=None, on_wait=None):
+    me = threading.get_ident()
+    with _cond:
+        if _holder["thread"] == me:
+            _holder["depth"] += 1
+            nested = True
+        else:
+            nested = False
+    if nested:
+        try:
+            yield
+        finally:
+            with _cond:
+                _holder["depth"] -= 1
+        return
+
+    ticket = {"label": label, "queued_at": time.time(), "started_at": None}
+    timeout = WRITE_WAIT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    with _cond:
+        _queue.append(ticket)
+        try:
+            while _queue[0] is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise WriteQueueTimeout(
+                        f"Waited {timeout:g}s for {_queue[0]['label']!r} to finish writing; try again later."
+                    )
+                if on_wait is not None:
+                    on_wait(_queue.index(ticket), time.time() - ticket["queued_at"])
+                _cond.wait(min(remaining, WAIT_POLL_SECONDS))
+        except BaseException:
+            _queue.remove(ticket)
+            _cond.notify_all()
+            raise
+        ticket["started_at"] = time.time()
+        _holder.update(thread=me, depth=1)
+    try:
+        yield
+    finally:
+        with _cond:
+            _queue.popleft()
+            _holder.update(thread=None, depth=0)
+            _cond.notify_all()
+
+# Running and queued writes, oldest first
+def write_queue_status():
+    now = time.time()
+    with _cond:
+        return [
+            {
+                "label": t["label"],
+                "state": "writing" if t["started_at"] is not None else "queued",
+                "seconds": now - (t["started_at"] or t["queued_at"]),
+            }
+            for t in _queue
+        ]